@@ -1,22 +1,63 @@
 import moviepy.editor
 from pytube import YouTube
 import time
+import json
 import os
 import moviepy 
 import speech_recognition as sr
-from textblob import TextBlob
 from deep_translator import GoogleTranslator
-import spacy
-import nltk
-from nrclex import NRCLex
 import threading
-from typing import Optional
-
-nlp = spacy.load('en_core_web_sm')
-nltk.download('punkt')
+import queue
+import numpy as np
+import nlp_models
+import audio_extraction
+import voice_activity
+import subtitles
+import log_sink
+from log_sink import logged_stage
+from metrics import instrument_stage
+from video_batch import VideoBatch, recorded_stage
+import emotion_scorer
+import backends
+import artifact_store
+from artifact_store import atomic_open, atomic_path
+from backends import ResolvedStream
+from transcription import ChunkedTranscriber, TranscriptSegment
+from translation import TranslationEngine
+from transcript_store import TranscriptStore
+from stage_cache import StageCache, CacheEntry, hash_file, hash_text, hash_bytes
+from typing import Callable, Iterable, Iterator, Optional
+
+# marks the end of the segments streamed to the timeline of a video
+_END_OF_SEGMENTS = object()
+
+# the parameters of the download in its cache key, the audio is keyed by the same download
+DOWNLOAD_CACHE_PARAMS = {'stream': 'lowest_resolution'}
+
+# the files written as the audio is transcribed in segments: the name of the file in the cache, the attribute and the suffix
+SEGMENT_OUTPUTS = (('segments', 'segments_path', '_segments.jsonl'), ('srt', 'srt_path', '.srt'), ('vtt', 'vtt_path', '.vtt'))
 
 class VideoFile:
 
+    #the attributes of each video are kept in slots instead of a dictionary, which makes large batches of videos smaller.
+    __slots__ = ('url', 'video_id', 'title', 'filename', 'folder_name', 'video_path', 'audio_path', 'audio_samples', 'audio_sample_rate',
+                 'speech_map_path', 'subtitles', 'text_path', 'segments_path', 'srt_path', 'vtt_path', 'translated_text_path', 'translated_text_paths',
+                 'sentiments_path', 'emotions_path', 'timeline_path',
+                 'sentiment', 'emotions', 'batch', 'batch_row')
+
+    #the transcriber shared by all the videos, when it is set long audios are transcribed in chunks, concurrently.
+    transcriber:Optional[ChunkedTranscriber] = None
+    #the cache of the stage outputs shared by all the videos, when it is set the stages reuse the outputs of earlier runs.
+    cache:Optional[StageCache] = None
+    #the JSON Lines file that every stage logs to, when it is set.
+    log_path:Optional[str] = None
+    #the function that translates a text (text, lang_from, lang_to), the Google translator is used when it is not set.
+    translator:Optional[Callable[[str,str,str],str]] = None
+    #the arena that the transcripts are kept in, when it is set the text stages read them from memory instead of the text files.
+    transcript_store:Optional[TranscriptStore] = None
+    #the function that resolves the URL of a video to its stream (backends.VideoSource), pytube is used when it is not set.
+    video_source:Optional[Callable[[str],ResolvedStream]] = None
+
     def __init__(self, url:str) -> None:
         """
         Initialised the VideoFile object with attributes: URL, title, path where the video is downloaded, path of the file with the 
@@ -31,20 +72,35 @@ class VideoFile:
             
         """
         self.url:str = url
+        self.video_id:str = None
         self.title:str = None
         self.filename:str = None
         self.folder_name:str = None
         self.video_path:str = None
         self.audio_path:str = None
+        self.audio_samples:np.ndarray = None
+        self.audio_sample_rate:int = None
+        self.speech_map_path:str = None
         self.subtitles:str = None
         self.text_path:str = None
+        self.segments_path:str = None
+        self.srt_path:str = None
+        self.vtt_path:str = None
         self.translated_text_path:str = None
+        self.translated_text_paths:dict[str,str] = {}
         self.sentiments_path:str = None
         self.emotions_path:str = None
+        self.timeline_path:str = None
         self.sentiment:tuple = {}
+        self.emotions:dict[str,float] = None
+        self.batch:Optional[VideoBatch] = None
+        self.batch_row:int = None
  
  # <-------------------------------- Video Downloading Functions ------------------------------->
 
+    @logged_stage('download', 'video_path')
+    @recorded_stage
+    @instrument_stage('download', None, 'video_path')
     def download_video(self, data_folder:str,semaphore:Optional[threading.Semaphore] = None) -> None:
         """
         Downloads a video from YouTube.
@@ -60,61 +116,90 @@ class VideoFile:
         if(semaphore!=None):
             semaphore.acquire()
         try:
-            yt = YouTube(self.url)
-            self.title = yt.title
-            self.filename = '_'.join(self.title.split()[0:2])
-            self.folder_name = data_folder+self.filename
-            stream = yt.streams.get_lowest_resolution() 
-            print(f"Downloading video titled: {self.title}")
-            self.video_path = stream.download(output_path=self.folder_name, filename=self.filename+'.mp4')
+            cache_key, cached = self.cache_lookup('download', self.url.strip(), DOWNLOAD_CACHE_PARAMS)
+            if(cached != None):
+                self.title = cached.metadata['title']
+                self.assign_folder(data_folder)
+                self.video_path = VideoFile.cache.restore(cached, 'video', os.path.join(self.folder_name, self.filename+'.mp4'))
+                print(f"CACHED - video titled {self.title} restored to: {self.video_path}")
+                return
+
+            if(VideoFile.video_source != None):
+                resolved = VideoFile.video_source(self.url)
+                self.title = resolved.title
+                self.assign_folder(data_folder)
+                print(f"Downloading video titled: {self.title}")
+                self.video_path = backends.fetch_stream(resolved.url, os.path.join(self.folder_name, self.filename+'.mp4'))
+            else:
+                yt = YouTube(self.url)
+                self.title = yt.title
+                self.assign_folder(data_folder)
+                stream = yt.streams.get_lowest_resolution() 
+                print(f"Downloading video titled: {self.title}")
+                video_path = os.path.join(self.folder_name, self.filename+'.mp4')
+                with atomic_path(video_path) as temporary_path:
+                    stream.download(output_path=self.folder_name, filename=os.path.basename(temporary_path))
+                self.video_path = video_path
             print(f"SUCCESSFULL - Download completed to: {self.video_path}")
+            self.cache_store(cache_key, 'download', {'video': self.video_path}, {'title': self.title})
 
         except Exception as e: 
             print(f"UNSUCCESSFUL - failed to complete downloading video from {self.url}")
             print(e)
+            raise
 
         finally:
             if(semaphore!=None):
                 semaphore.release()
 
-    def download_video_and_log(self, filename:str, data_folder:str, lock:threading.Lock, thread_id:int) -> None:
+    def download_video_and_log(self, filename:str, data_folder:str, thread_id:int) -> None:
         """
-        Downloads a video from YouTube and logs the activity in the logger file.
+        Downloads a video from YouTube and logs the activity in the logger file. When the logger file is the log file of
+        the class, download_video already logs the download there, so it is not logged twice.
 
         Parameters:
-            filename: The name of the logger file where all the logs are stored.
-            lock: The mutex that will be acquired while writting to the logger.
+            filename: The name of the logger file where all the logs are stored, as JSON Lines.
+            data_folder: the folder name where the video will be stored, in its own folder.
             thread_id: The unique index assigned to the thread.
             
         Returns:
             None
         """
-        lock.acquire()
+        #the record is queued for the writer thread of the log file, so no lock is held while downloading or logging.
+        start = time.perf_counter()
+        error = None
         try:
-            print(f"DOWNLOADING :: Thread {thread_id} acquired a lock.")
             self.download_video(data_folder) #calls the base download function
-
-            self.log= f'"Timestamp": {time.strftime("%H:%M, %d %b %Y", time.gmtime())}, "URL":"{self.url}", "Download":True, "Thread ID": {thread_id}\n'
-            self.save_to_file(filename,'a', self.log)
             print(f"SUCCESSFUL - Thread {thread_id} completed downloading and logging the video {self.title}.")
 
         except Exception as e: 
+            error = e
             print(f"UNSUCCESSFUL - Thread {thread_id} could not complete downloading and logging the video {self.title}.")
             print(e)
+            raise
 
         finally:
-            lock.release()
-            print(f"DOWNLOADING :: Thread {thread_id} released a lock.")
+            logged_by_stage = VideoFile.log_path != None and os.path.abspath(VideoFile.log_path) == os.path.abspath(filename)
+            if(not logged_by_stage):
+                downloaded_bytes = os.path.getsize(self.video_path) if error == None and self.video_path != None else 0
+                log_sink.get_log_sink(filename).log(url=self.url.strip(), stage='download', duration=round(time.perf_counter()-start, 6),
+                                                    bytes=downloaded_bytes, success=error == None, error=None if error == None else str(error), worker_id=thread_id)
 
 # <-------------------------------- Video Analysis Sub Tasks ------------------------------->
 
 
-    def extract_audio(self,semaphore:Optional[threading.Semaphore] = None) -> None:
+    @logged_stage('extract_audio', 'audio_path')
+    @recorded_stage
+    @instrument_stage('extract_audio', 'video_path', 'audio_path')
+    def extract_audio(self,semaphore:Optional[threading.Semaphore] = None, audio_only:bool = False, write_to_disk:bool = True) -> None:
         """
         Extracts the audio from the video file and saves it into a .wav file.
 
         Parameters:
             semaphore [optional]: to restrict the number of audios to be extracted at a time.
+            audio_only [optional]: to decode only the audio stream, straight to the 16 kHz mono samples that the recognizer uses,
+                which are kept in memory for the transcription.
+            write_to_disk [optional]: whether the audio decoded with audio_only is also saved into a (compact) .wav file.
 
         Returns:
             None
@@ -122,27 +207,109 @@ class VideoFile:
         if(semaphore != None):
             semaphore.acquire()
         try:
-            self.audio_path = os.path.join(self.folder_name, self.filename + ".wav")
+            audio_path = os.path.join(self.folder_name, self.filename + ".wav")
+
+            #the cache only holds files, so audio that is kept in memory only is always decoded.
+            cache_key, cached = None, None
+            if(write_to_disk):
+                params = {'audio_only': True, 'sample_rate': audio_extraction.RECOGNIZER_SAMPLE_RATE} if audio_only else None
+                #the video is the one the download of its URL produced, so the download key names it without hashing the file.
+                video_id = VideoFile.cache.key('download', self.url.strip(), DOWNLOAD_CACHE_PARAMS) if VideoFile.cache != None else None
+                cache_key, cached = self.cache_lookup('extract_audio', video_id, params)
+            if(cached != None):
+                self.audio_path = VideoFile.cache.restore(cached, 'audio', audio_path)
+                if(audio_only):
+                    self.audio_samples, self.audio_sample_rate = audio_extraction.read_wav(self.audio_path)
+                print(f"CACHED - audio of {self.title} restored to: {self.audio_path}")
+                return
 
             print(f"SUBTASK 1 :: Starting extraction of the audio from file {self.title}")
-            video = moviepy.editor.VideoFileClip(self.video_path)
-            video.audio.write_audiofile(self.audio_path)
+            if(audio_only):
+                self.audio_samples = audio_extraction.decode_audio(self.video_path)
+                self.audio_sample_rate = audio_extraction.RECOGNIZER_SAMPLE_RATE
+                if(write_to_disk):
+                    with atomic_path(audio_path) as temporary_path:
+                        audio_extraction.write_wav(temporary_path, self.audio_samples, self.audio_sample_rate)
+                    self.audio_path = audio_path
+            else:
+                video = moviepy.editor.VideoFileClip(self.video_path)
+                with atomic_path(audio_path) as temporary_path:
+                    video.audio.write_audiofile(temporary_path)
+                self.audio_path = audio_path
             print(f"SUBTASK 1 :: extraction completed {self.title}")
 
+            if(self.audio_path != None):
+                self.cache_store(cache_key, 'extract_audio', {'audio': self.audio_path})
+
         except Exception as e: 
              print(f"UNSUCCESSFUL - failed to extract audio from file {self.title}.")
              print(e)
+             raise
 
         finally:
             if(semaphore != None):
                 semaphore.release()
      
-    def transcribe_audio(self, semaphore:Optional[threading.Semaphore] = None) -> None:
+    @logged_stage('trim_audio', 'speech_map_path')
+    @recorded_stage
+    @instrument_stage('trim_audio', 'audio_path', 'audio_path')
+    def trim_audio(self, semaphore:Optional[threading.Semaphore] = None) -> None:
+        """
+        Drops the parts of the extracted audio without speech, so less audio is sent to the recognizer. The speech is
+        saved into a _speech.wav file that audio_path points to, and also kept in memory when the audio was extracted
+        in memory, and the map from its timeline to the timeline of the video is saved into a _speech_map.json file.
+
+        Parameters:
+            semaphore [optional]: to restrict the number of audios to be trimmed at a time.
+
+        Returns:
+            None
+        """
+        if(semaphore != None):
+            semaphore.acquire()
+        try:
+            print(f"SUBTASK 1 :: started trimming the silences of the audio of {self.title}")
+
+            in_memory = self.audio_samples is not None
+            if(in_memory):
+                samples, sample_rate = self.audio_samples, self.audio_sample_rate
+            else:
+                samples, sample_rate = audio_extraction.read_wav(self.audio_path)
+
+            speech, timestamp_map = voice_activity.trim_silence(samples, sample_rate)
+            #the speech is always written, the map is built for its timeline and a transcription that reads the audio
+            #from disk, in a worker process or after a resume, must not find the untrimmed audio at audio_path.
+            speech_path = os.path.join(self.folder_name, self.filename + "_speech.wav")
+            with atomic_path(speech_path) as temporary_path:
+                audio_extraction.write_wav(temporary_path, speech, sample_rate)
+            self.audio_path = speech_path
+            if(in_memory):
+                self.audio_samples = speech
+
+            self.speech_map_path = os.path.join(self.folder_name, self.filename + "_speech_map.json")
+            timestamp_map.save(self.speech_map_path)
+            print(f"SUBTASK 1 :: kept {round(timestamp_map.kept_seconds,1)} of {round(timestamp_map.original_seconds,1)} second(s) of audio of {self.title}")
+
+        except Exception as e: 
+            print(f"UNSUCCESSFUL - failed to trim the audio of {self.title}.")
+            print(e)
+            raise
+
+        finally:
+            if(semaphore != None):
+                semaphore.release()
+
+    @logged_stage('transcribe', 'text_path')
+    @recorded_stage
+    @instrument_stage('transcribe', 'audio_path', 'text_path')
+    def transcribe_audio(self, semaphore:Optional[threading.Semaphore] = None, timeline:bool = False) -> None:
         """
         Extracts the text from the audio file and saves it into a .txt file.
 
         Parameters:
             semaphore: to restrict the number of audios to be transcribed at a time.
+            timeline [optional]: whether the timeline of the video is scored from the segments as they are transcribed,
+                with VideoFile.transcriber, see stream_timeline.
             
         Returns:
             None
@@ -153,25 +320,63 @@ class VideoFile:
         try:
             print(f"SUBTASK 2 :: started transcribing audio from file {self.audio_path} to text")
 
-            recognizer = sr.Recognizer()
-            with sr.AudioFile(self.audio_path) as source:
-                audio = recognizer.record(source)
-            self.subtitles = recognizer.recognize_google(audio)
-            self.text_path = os.path.join(self.folder_name, self.filename + ".txt")
+            text_path = os.path.join(self.folder_name, self.filename + ".txt")
+            in_memory = self.audio_samples is not None
+            audio_hash = hash_bytes(self.audio_samples.tobytes()) if in_memory else hash_file(self.audio_path)
+            cache_key, cached = self.cache_lookup('transcribe', audio_hash, self.transcription_params())
+            if(cached != None):
+                self.text_path = VideoFile.cache.restore(cached, 'text', text_path)
+                for name, attribute, suffix in SEGMENT_OUTPUTS:
+                    if(name in cached.artifacts):
+                        setattr(self, attribute, VideoFile.cache.restore(cached, name, os.path.join(self.folder_name, self.filename + suffix)))
+                self.subtitles = None
+                self.audio_samples = None
+                if(VideoFile.transcript_store != None):
+                    with open(self.text_path, 'r') as text_file:
+                        VideoFile.transcript_store.put(self.transcript_key(), text_file.read())
+                print(f"CACHED - transcription of {self.title} restored to: {self.text_path}")
+                return
+
+            if(VideoFile.transcriber != None):
+                #the segments and their subtitles are written as the chunks are transcribed.
+                segments = self.transcribe_segments()
+                if(timeline):
+                    segments = self.stream_timeline(segments)
+                self.subtitles = ' '.join(segment.text for segment in segments if segment.text != '')
+            elif(in_memory):
+                audio = sr.AudioData(self.audio_samples.tobytes(), self.audio_sample_rate, audio_extraction.RECOGNIZER_SAMPLE_WIDTH)
+                self.subtitles = sr.Recognizer().recognize_google(audio)
+            else:
+                recognizer = sr.Recognizer()
+                with sr.AudioFile(self.audio_path) as source:
+                    audio = recognizer.record(source)
+                self.subtitles = recognizer.recognize_google(audio)
+            #the samples are not needed once they are transcribed, releasing them bounds the memory of large batches.
+            self.audio_samples = None
+            self.text_path = text_path
 
             print(f"SUBTASK 2 :: Saving the text to file: {self.text_path}")
             self.save_to_file(self.text_path,'w',self.subtitles)
+            artifacts = {'text': self.text_path}
+            artifacts.update({name: getattr(self, attribute) for name, attribute, _ in SEGMENT_OUTPUTS if getattr(self, attribute) != None})
+            self.cache_store(cache_key, 'transcribe', artifacts)
+            if(VideoFile.transcript_store != None):
+                VideoFile.transcript_store.put(self.transcript_key(), self.subtitles)
 
             print(f"SUCCESSFUL -  completed transcribing audio from file{self.title}.")
 
         except Exception as e: 
             print(f"UNSUCCESSFUL - failed to not transcribe audio from file {self.title}.")
             print(e)
+            raise
 
         finally:
             if(semaphore != None):
                 semaphore.release()
 
+    @logged_stage('sentiment', 'sentiments_path')
+    @recorded_stage
+    @instrument_stage('sentiment', 'text_path', 'sentiments_path')
     def sentiment_analysis(self,semaphore:Optional[threading.Semaphore] = None) -> None:
         """
         Performs Sentiment Analysis on the video and saves the polarity and subjectivity measure of the content, into a .txt file.
@@ -190,26 +395,116 @@ class VideoFile:
             print(f"SUBTASK 3 :: started sentiment analysis on file {self.title}")
 
             text_to_analyse = self.get_text_from_file()
-            blob = TextBlob(text_to_analyse)
-            self.sentiment = blob.sentiment
-            sentiments_output = f"Polarity measure of the video {self.title} is: {self.sentiment.polarity}\nSubjectivity measure of the video {self.title} is: {self.sentiment.subjectivity}"
-            print(sentiments_output)
+            cache_key, cached = self.cache_lookup('sentiment', hash_text(text_to_analyse))
+            if(cached != None):
+                self.save_sentiments(nlp_models.sentiment_result(cached.metadata['polarity'], cached.metadata['subjectivity']))
+                print(f"CACHED - sentiments of {self.title} restored.")
+                return
 
-            self.sentiments_path = os.path.join(self.folder_name, self.filename + "_sentiments.txt")
-            print(f"SUBTASK 3 :: saving the sentiments to file: {self.sentiments_path}")
-            self.save_to_file(self.sentiments_path,'w',sentiments_output)
+            blob = nlp_models.text_blob(text_to_analyse)
+            self.save_sentiments(blob.sentiment)
+            self.cache_store(cache_key, 'sentiment', {}, {'polarity': self.sentiment.polarity, 'subjectivity': self.sentiment.subjectivity})
 
             print(f"SUCCESSFUL - completed sentiment analysis on file {self.title}.")
 
         except Exception as e: 
             print(f"UNSUCCESSFUL - failed to perform sentiment analysis on file {self.title}.")
             print(e)
+            raise
         
         finally:
             if(semaphore != None):
                 semaphore.release()
 
-    def translate_text(self, lang_from:str, lang_to:str, lang_to_name:str, semaphore:Optional[threading.Semaphore] = None) -> None:
+    def transcribe_segments(self) -> Iterator[TranscriptSegment]:
+        """
+        Transcribes the audio with the transcriber of the class a chunk at a time, yielding each segment as soon as it
+        is transcribed. The segments are written to a _segments.jsonl file and their subtitles to .srt and .vtt files
+        as they come, with the times of the video, mapped back through the speech map when the audio was trimmed.
+
+        Parameters:
+            None
+
+        Returns:
+            a generator of the segments, in order.
+        """
+        if(VideoFile.transcriber == None):
+            raise ValueError('The audio is transcribed in segments by a ChunkedTranscriber, VideoFile.transcriber is not set')
+
+        if(self.audio_samples is not None):
+            segments = VideoFile.transcriber.iter_sample_segments(audio_extraction.buffer_sample_reader(self.audio_samples), self.audio_sample_rate)
+        else:
+            segments = VideoFile.transcriber.iter_file_segments(self.audio_path)
+
+        timestamp_map = voice_activity.TimestampMap.load(self.speech_map_path) if self.speech_map_path != None else None
+        def to_video(segment:TranscriptSegment) -> TranscriptSegment:
+            if(timestamp_map == None):
+                return segment
+            return TranscriptSegment(segment.index, timestamp_map.to_original(segment.start), timestamp_map.to_original(segment.end), segment.text)
+
+        output_paths = [os.path.join(self.folder_name, self.filename + suffix) for _, _, suffix in SEGMENT_OUTPUTS]
+        with subtitles.SegmentWriter(output_paths[0]) as segment_writer, subtitles.SubtitleWriter(output_paths[1]) as srt_writer, subtitles.SubtitleWriter(output_paths[2]) as vtt_writer:
+            for segment in segments:
+                #the cues are split on the timeline of the transcribed audio, then each one is placed on the timeline of the video.
+                cues = [to_video(cue) for cue in subtitles.split_cues(segment)]
+                srt_writer.write(cues)
+                vtt_writer.write(cues)
+                segment = to_video(segment)
+                segment_writer.write(segment)
+                yield segment
+
+        self.segments_path, self.srt_path, self.vtt_path = output_paths
+        print(f"SUBTASK 2 :: subtitles of {self.title} saved to: {self.srt_path} and {self.vtt_path}")
+
+    def stream_timeline(self, segments:Iterator[TranscriptSegment]) -> Iterator[TranscriptSegment]:
+        """
+        Passes the segments of a transcription through while analyse_timeline scores them in a thread of its own, so the
+        timeline of a long video is written as it is transcribed rather than after. The timeline is complete when the
+        segments are, and is dropped if the transcription stops before its end. A timeline that fails leaves
+        timeline_path unset, for the timeline stage to score the segments file again.
+
+        Parameters:
+            segments: the segments of the transcription, from transcribe_segments.
+
+        Returns:
+            a generator of the same segments.
+        """
+        feed:queue.Queue = queue.Queue()
+        self.timeline_path = None
+
+        def streamed_segments() -> Iterator[TranscriptSegment]:
+            while True:
+                item = feed.get()
+                if(item is _END_OF_SEGMENTS):
+                    return
+                if(isinstance(item, BaseException)):
+                    raise item
+                yield item
+
+        def score() -> None:
+            try:
+                self.analyse_timeline(segments=streamed_segments())
+            except Exception:
+                #analyse_timeline prints its error, the transcription goes on without the timeline.
+                pass
+
+        scorer = threading.Thread(target=score, name=f'timeline-{self.filename}', daemon=True)
+        scorer.start()
+        completed = False
+        try:
+            for segment in segments:
+                feed.put(segment)
+                yield segment
+            completed = True
+        finally:
+            feed.put(_END_OF_SEGMENTS if completed else RuntimeError(f'the transcription of {self.title} stopped before its end'))
+            scorer.join()
+
+    @logged_stage('translate', 'translated_text_path')
+    @recorded_stage
+    @instrument_stage('translate', 'text_path', 'translated_text_path')
+    def translate_text(self, lang_from:str, lang_to:str, lang_to_name:str, semaphore:Optional[threading.Semaphore] = None,
+                       text:Optional[str] = None, segments:Optional[list[str]] = None) -> None:
         """
         Translates the transcribed text into a given language and saves it in a .txt file.
 
@@ -218,6 +513,8 @@ class VideoFile:
             lang_to: The language to translate the text into.
             lang_to_name: The name in English of the language that the text is to be translated into.    
             semaphore: to restrict the number of texts to be translated at a time.
+            text [optional]: The transcribed text, if it is already read, for the translations of several languages.
+            segments [optional]: The text already split into sentences by the translation engine, see translate_loaded_text.
 
         Returns:
             None
@@ -228,23 +525,58 @@ class VideoFile:
         try:
             print(f"SUBTASK 4 :: started translating the video {self.title} to {lang_to_name}")
 
-            text_to_analyse = self.get_text_from_file()
-            text_translated = GoogleTranslator(source=lang_from, target=lang_to).translate(text=text_to_analyse)
-            self.translated_text_path = os.path.join(self.folder_name, self.filename + "_"+lang_to_name+".txt")
-
-            print(f"SUBTASK 4 :: saving the translated text to file: {self.translated_text_path}")
-            self.save_to_file(self.translated_text_path,'w',text_translated)
-
-            print(f"SUCCESSFUL - completed translation of the video {self.title}.")
+            text_to_analyse = text if text != None else self.get_text_from_file()
+            self.translated_text_path = self.translate_loaded_text(text_to_analyse, lang_from, lang_to, lang_to_name, segments)
 
         except Exception as e: 
             print(f"UNSUCCESSFUL - failed to translate the video {self.title}.")
             print(e)
+            raise
 
         finally:
             if(semaphore != None):
                 semaphore.release()
        
+    def translate_loaded_text(self, text:str, lang_from:str, lang_to:str, lang_to_name:str, segments:Optional[list[str]] = None) -> str:
+        """
+        Translates a transcript that is already read and saves the translation in a .txt file. Several languages can be
+        translated from the same text at once, each one is recorded in translated_text_paths.
+
+        Parameters:
+            text: The transcribed text.
+            lang_from: The original language of the text.
+            lang_to: The language to translate the text into.
+            lang_to_name: The name in English of the language that the text is to be translated into.
+            segments [optional]: The text already split into sentences by the translation engine, so it is not split again for every language.
+
+        Returns:
+            the path of the translated text.
+        """
+        translated_text_path = os.path.join(self.folder_name, self.filename + "_"+lang_to_name+".txt")
+        cache_key, cached = self.cache_lookup('translate', hash_text(text), self.translation_params(lang_from, lang_to))
+        if(cached != None):
+            self.translated_text_paths[lang_to] = VideoFile.cache.restore(cached, 'translation', translated_text_path)
+            print(f"CACHED - {lang_to_name} translation of {self.title} restored to: {translated_text_path}")
+            return translated_text_path
+
+        if(segments != None and isinstance(VideoFile.translator, TranslationEngine)):
+            text_translated = VideoFile.translator.translate_segmented([segments], lang_from, lang_to)[0]
+        elif(VideoFile.translator != None):
+            text_translated = VideoFile.translator(text, lang_from, lang_to)
+        else:
+            text_translated = GoogleTranslator(source=lang_from, target=lang_to).translate(text=text)
+
+        print(f"SUBTASK 4 :: saving the {lang_to_name} translated text to file: {translated_text_path}")
+        self.save_to_file(translated_text_path,'w',text_translated)
+        self.cache_store(cache_key, 'translate', {'translation': translated_text_path})
+        self.translated_text_paths[lang_to] = translated_text_path
+
+        print(f"SUCCESSFUL - completed {lang_to_name} translation of the video {self.title}.")
+        return translated_text_path
+
+    @logged_stage('emotions', 'emotions_path')
+    @recorded_stage
+    @instrument_stage('emotions', 'text_path', 'emotions_path')
     def extract_emotions(self, semaphore:Optional[threading.Semaphore] = None) -> None:
         """
         Extracts the emotions from the transcribed .txt file of the video and saves it in a separate .txt file.
@@ -262,32 +594,169 @@ class VideoFile:
             print(f"SUBTASK 5 :: started extracting emotions from the video {self.title}")
 
             text_to_analyse = self.get_text_from_file()
+            cache_key, cached = self.cache_lookup('emotions', hash_text(text_to_analyse))
+            if(cached != None):
+                self.save_emotions(cached.metadata['emotions'])
+                print(f"CACHED - emotions of {self.title} restored.")
+                return
+
+            nlp = nlp_models.get_nlp()
             doc = nlp(text_to_analyse)
             full_text = ' '.join([sent.text for sent in doc.sents])
-            emotion = NRCLex(full_text)
-            emotion_output = emotion.affect_frequencies
-
-            print(f"SUBTASK 5 :: Emotions and Frequencies for the video {self.title}: {emotion_output}")
-            
-            self.emotions_path = os.path.join(self.folder_name, self.filename + "_emotions.txt")
-            print(f"SUBTASK 5 :: saving the emotions and frequencies to file: {self.emotions_path}")
-            with open(self.emotions_path, "w") as outfile:
-                print(emotion_output, file=outfile)
+            #scoring the TextBlob words against the precomputed NRC index gives the same output as NRCLex(full_text).affect_frequencies
+            words = nlp_models.text_blob(full_text).words
+            emotion_output = emotion_scorer.affect_frequencies(words)
+            self.save_emotions(emotion_output)
+            self.cache_store(cache_key, 'emotions', {}, {'emotions': emotion_output})
                 
         except Exception as e:
             print(f"UNSUCCESSFUL - failed to extract emotions from the video {self.title}.")
             print(e)
+            raise
 
         finally:
             if(semaphore != None):
                 semaphore.release()
         
 
+    @logged_stage('timeline', 'timeline_path')
+    @recorded_stage
+    @instrument_stage('timeline', 'segments_path', 'timeline_path')
+    def analyse_timeline(self, segments:Optional[Iterable[TranscriptSegment]] = None, semaphore:Optional[threading.Semaphore] = None) -> None:
+        """
+        Scores the sentiment and the emotions of every segment of the transcript, which gives the timeline of the mood of
+        the video, and saves it into a _timeline.jsonl file a segment at a time. The segments are read from the segments
+        file of the transcription, or taken from a stream, like transcribe_segments while the audio is still being transcribed.
+
+        Parameters:
+            segments [optional]: the segments to be scored, those of the segments file if it is not given.
+            semaphore [optional]: to restrict the number of videos that are processed at a time.
+
+        Returns:
+            None
+        """
+        if(semaphore != None):
+            semaphore.acquire()
+        try:
+            print(f"SUBTASK 6 :: started scoring the timeline of the video {self.title}")
+            if(segments == None):
+                if(self.segments_path == None or not os.path.exists(self.segments_path)):
+                    raise ValueError(f'The video {self.title} has no segments file to score, it is written when the audio is transcribed in segments '
+                                     'by VideoFile.transcriber')
+                segments = subtitles.read_segments(self.segments_path)
+
+            timeline_path = os.path.join(self.folder_name, self.filename + "_timeline.jsonl")
+            scored = 0
+            with atomic_open(timeline_path, 'w') as timeline_file:
+                for segment in segments:
+                    if(segment.text.strip() == ''):
+                        continue
+                    blob = nlp_models.text_blob(segment.text)
+                    record = {'index': segment.index, 'start': round(segment.start, 3), 'end': round(segment.end, 3),
+                              'polarity': blob.sentiment.polarity, 'subjectivity': blob.sentiment.subjectivity,
+                              'emotions': emotion_scorer.affect_frequencies(blob.words)}
+                    timeline_file.write(json.dumps(record) + '\n')
+                    timeline_file.flush()
+                    scored += 1
+
+            self.timeline_path = timeline_path
+            print(f"SUCCESSFUL - scored {scored} segment(s) of the video {self.title}, timeline saved to: {self.timeline_path}")
+
+        except Exception as e:
+            print(f"UNSUCCESSFUL - failed to score the timeline of the video {self.title}.")
+            print(e)
+            raise
+
+        finally:
+            if(semaphore != None):
+                semaphore.release()
+
+    @staticmethod
+    def analyse_text_batch(videos:list['VideoFile'], batch_size:int = 32, n_process:int = 1) -> None:
+        """
+        Performs sentiment analysis and emotion extraction on the transcribed text of many videos in one pass. The texts
+        are streamed through spaCy in batches with only the components needed for sentence segmentation, and the
+        sentiment and the emotions of each video are computed from the same TextBlob words.
+
+        Parameters:
+            videos: the array of VideoFile objects to be analysed.
+            batch_size: the number of texts that spaCy processes together.
+            n_process: the number of processes that spaCy uses.
+
+        Returns:
+            None
+        """
+        print(f"SUBTASK 3 & 5 :: started analysing the text of {len(videos)} videos in batches of {batch_size}")
+
+        texts = []
+        videos_with_text = []
+        for video in videos:
+            try:
+                texts.append(video.get_text_from_file())
+                videos_with_text.append(video)
+            except Exception as e:
+                print(f"UNSUCCESSFUL - could not read the transcribed text of the video {video.title}.")
+                print(e)
+
+        nlp = nlp_models.get_nlp()
+        docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=nlp_models.sentence_only_components())
+        for video, doc in zip(videos_with_text, docs):
+            try:
+                full_text = ' '.join([sent.text for sent in doc.sents])
+                blob = nlp_models.text_blob(full_text)
+                video.save_sentiments(blob.sentiment)
+                video.save_emotions(emotion_scorer.affect_frequencies(blob.words))
+                if(video.batch != None):
+                    video.batch.record(video)
+
+            except Exception as e:
+                print(f"UNSUCCESSFUL - failed to analyse the text of the video {video.title}.")
+                print(e)
+
+        print(f"SUCCESSFUL - completed analysing the text of {len(videos_with_text)} videos.")
+
 # <-------------------------------- Helper Functions ------------------------------->
 
+    def save_sentiments(self, sentiment:tuple) -> None:
+        """
+        Stores the sentiment of the video and saves its polarity and subjectivity into a .txt file.
+
+        Parameters:
+            sentiment: the TextBlob sentiment with the polarity and the subjectivity of the text.
+
+        Returns:
+            None
+        """
+        self.sentiment = sentiment
+        sentiments_output = f"Polarity measure of the video {self.title} is: {self.sentiment.polarity}\nSubjectivity measure of the video {self.title} is: {self.sentiment.subjectivity}"
+        print(sentiments_output)
+
+        self.sentiments_path = os.path.join(self.folder_name, self.filename + "_sentiments.txt")
+        print(f"SUBTASK 3 :: saving the sentiments to file: {self.sentiments_path}")
+        self.save_to_file(self.sentiments_path,'w',sentiments_output)
+
+    def save_emotions(self, emotion_output:dict[str,float]) -> None:
+        """
+        Saves the emotions and frequencies of the video into a .txt file.
+
+        Parameters:
+            emotion_output: the frequency of each emotion in the text.
+
+        Returns:
+            None
+        """
+        print(f"SUBTASK 5 :: Emotions and Frequencies for the video {self.title}: {emotion_output}")
+        self.emotions = emotion_output
+
+        self.emotions_path = os.path.join(self.folder_name, self.filename + "_emotions.txt")
+        print(f"SUBTASK 5 :: saving the emotions and frequencies to file: {self.emotions_path}")
+        with atomic_open(self.emotions_path, "w") as outfile:
+            print(emotion_output, file=outfile)
+
     def save_to_file(self,filename:str,mode:str,text:str) -> None:
         """
-        Writes a given text to a file.
+        Writes a given text to a file. A file that is overwritten is written to a temporary file first and renamed into
+        place, so a reader or another worker never sees it half written.
 
         Parameters:
             filename: Path of the file where the text is to be written.
@@ -297,10 +766,95 @@ class VideoFile:
         Returns:
             None
         """
-        with open(filename, mode) as file:
+        with (atomic_open(filename, mode) if mode.startswith('w') else open(filename, mode)) as file:
             file.write(text)
         print(f'Text has been written to {filename}')
 
+    def assign_folder(self, data_folder:str) -> None:
+        """
+        Sets the folder and the name of the files of the video from its canonical id, in the artifact store of the data
+        folder, and records its title in the index of the store. Two videos with the same title get folders of their own.
+
+        Parameters:
+            data_folder: the folder name where all videos are stored.
+
+        Returns:
+            None
+        """
+        store = artifact_store.get_store(data_folder)
+        self.filename = artifact_store.video_key(self.url, self.video_id)
+        self.folder_name = store.register(self.filename, self.url.strip(), self.title)
+
+    def cache_lookup(self, stage:str, input_id:str, params:Optional[dict] = None) -> tuple[Optional[str],Optional[CacheEntry]]:
+        """
+        Looks up the output of a stage in the cache of the videos.
+
+        Parameters:
+            stage: the name of the stage.
+            input_id: the URL of the video, or the hash of the input of the stage.
+            params [optional]: the parameters of the stage that change its output.
+
+        Returns:
+            the key of the stage run and its cache entry, both None when there is no cache, the entry None when the output is not cached.
+        """
+        if(VideoFile.cache == None):
+            return None, None
+
+        key = VideoFile.cache.key(stage, input_id, params)
+        return key, VideoFile.cache.get(key)
+
+    def cache_store(self, key:Optional[str], stage:str, artifacts:dict[str,str], metadata:Optional[dict] = None) -> None:
+        """
+        Stores the output of a stage in the cache of the videos, if there is one.
+
+        Parameters:
+            key: the key returned by cache_lookup.
+            stage: the name of the stage.
+            artifacts: the paths of the output files, by name.
+            metadata [optional]: the values of the stage that are restored with the files.
+
+        Returns:
+            None
+        """
+        if(key != None):
+            VideoFile.cache.put(key, stage, artifacts, metadata)
+
+    def transcription_params(self) -> dict:
+        """
+        Returns the parameters of the transcription that change its output, used in the cache key.
+
+        Parameters:
+            None
+
+        Returns:
+            the name of the recognizer and the chunking of the transcriber.
+        """
+        transcriber = VideoFile.transcriber
+        if(transcriber == None):
+            return {'recognizer': 'google', 'chunked': False}
+        return {'recognizer': getattr(transcriber.recognizer, '__name__', type(transcriber.recognizer).__name__), 'chunked': True,
+                'chunk_seconds': transcriber.chunk_seconds, 'search_seconds': transcriber.search_seconds}
+
+    def translation_params(self, lang_from:str, lang_to:str) -> dict:
+        """
+        Returns the parameters of the translation that change its output, used in the cache key, so the output of a stub
+        or a stand-in translator is never served to a run with the real one.
+
+        Parameters:
+            lang_from: The original language of the text.
+            lang_to: The language to translate the text into.
+
+        Returns:
+            the languages and the name of the translator, the backend of a TranslationEngine.
+        """
+        translator = VideoFile.translator
+        if(translator == None):
+            return {'lang_from': lang_from, 'lang_to': lang_to, 'translator': 'google'}
+        if(isinstance(translator, TranslationEngine)):
+            translator = translator.backend
+        name = getattr(translator, '__qualname__', type(translator).__qualname__)
+        return {'lang_from': lang_from, 'lang_to': lang_to, 'translator': f'{getattr(translator, "__module__", type(translator).__module__)}.{name}'}
+
     def get_text_from_file(self) -> str:
         """
         Retrieves the transcribed text of each video.
@@ -312,14 +866,52 @@ class VideoFile:
             the transcribed text of a video.
         """
 
-        #if the text is not saved in the subtitles attribute of the videofile object then it is retrieved from the text file.
-        if(self.subtitles == None):
-            if(self.text_path == None):
-                raise Exception('Could not find the transcribed text of the video {self.title}') 
-            else:
-                text_file = open(self.text_path,'r')
-                text_to_analyse = text_file.read()
-                print(f"Retrieved text from {self.text_path}")
-                return text_to_analyse
-        else:
+        #if the text is not saved in the subtitles attribute of the videofile object then it is retrieved from the
+        #transcript store, which the transcription in another worker process may have filled, or from the text file.
+        if(self.subtitles != None):
             return self.subtitles
+        if(self.text_path == None):
+            raise Exception(f'Could not find the transcribed text of the video {self.title}')
+
+        if(VideoFile.transcript_store != None):
+            text_to_analyse = VideoFile.transcript_store.get(self.transcript_key())
+            if(text_to_analyse != None):
+                return text_to_analyse
+
+        with open(self.text_path,'r') as text_file:
+            text_to_analyse = text_file.read()
+        print(f"Retrieved text from {self.text_path}")
+        if(VideoFile.transcript_store != None):
+            VideoFile.transcript_store.put(self.transcript_key(), text_to_analyse)
+        return text_to_analyse
+
+    def apply_result(self, updates:dict) -> None:
+        """
+        Merges the attributes that a stage set on a copy of the video, in a worker process, into this video.
+
+        Parameters:
+            updates: the attributes set by the stage, by name.
+
+        Returns:
+            None
+        """
+        for name, value in updates.items():
+            if(name == 'translated_text_paths'):
+                self.translated_text_paths.update(value)
+            elif(value is not None):
+                setattr(self, name, value)
+        if(self.batch != None):
+            self.batch.record(self)
+
+    def transcript_key(self) -> str:
+        """
+        Returns the key of the transcript of the video in the transcript store, the absolute path of its text file,
+        which the parent process and the workers agree on.
+
+        Parameters:
+            None
+
+        Returns:
+            the key of the transcript.
+        """
+        return os.path.abspath(self.text_path)
@@ -0,0 +1,264 @@
+import os
+import re
+import time
+import threading
+from typing import Optional
+
+# an error whose status, or message, says the service is throttling the requests
+RATE_LIMIT_STATUSES = {429, 503}
+RATE_LIMIT_MESSAGE = re.compile(r'\b429\b|too many requests|rate.?limit|quota exceeded', re.IGNORECASE)
+
+# the load average is read at most once a second
+LOAD_SAMPLE_SECONDS = 1.0
+
+# <-------------------------------- Adaptive Limiter ------------------------------->
+
+class AdaptiveLimiter:
+
+    def __init__(self, name:str, initial:int, min_limit:int = 1, max_limit:int = 64, cpu_bound:bool = False, latency_tolerance:float = 2.0,
+                 backoff:float = 0.9, error_backoff:float = 0.75, rate_limit_backoff:float = 0.5, cpu_threshold:float = 1.0) -> None:
+        """
+        Initialises a limiter of the number of tasks of a stage running at one time, used in place of a semaphore: a
+        task acquires it before running and releases it after. The limit grows by one for every limit tasks that
+        complete in time (additive increase), and is cut by a factor (multiplicative decrease) when the latency of the
+        tasks rises well above its long run average, a task fails, the service throttles the requests or, for a CPU
+        bound stage, the cores are saturated. The limit is cut at most once per round of tasks, and stays within the bounds.
+
+        Parameters:
+            name: the name of the stage, for the logs.
+            initial: the limit to start from.
+            min_limit: the lowest limit.
+            max_limit: the highest limit.
+            cpu_bound: whether the stage keeps a core busy, so a saturated machine lowers the limit instead of holding it.
+            latency_tolerance: how many times the baseline latency the recent latency may reach before the limit is cut.
+            backoff: the factor of the limit when the latency rises.
+            error_backoff: the factor of the limit when a task fails.
+            rate_limit_backoff: the factor of the limit when the service throttles the requests.
+            cpu_threshold: the load average per core above which the machine counts as saturated.
+
+        Returns:
+            None
+        """
+        self.name:str = name
+        self.min_limit:int = max(1, min_limit)
+        self.max_limit:int = max(self.min_limit, max_limit)
+        self.limit:float = float(min(max(initial, self.min_limit), self.max_limit))
+        self.cpu_bound:bool = cpu_bound
+        self.latency_tolerance:float = latency_tolerance
+        self.backoff:float = backoff
+        self.error_backoff:float = error_backoff
+        self.rate_limit_backoff:float = rate_limit_backoff
+        self.cpu_threshold:float = cpu_threshold
+
+        self.condition = threading.Condition()
+        self.in_flight:int = 0
+        self.started = threading.local()
+        #the baseline is the long run average latency of the tasks, the recent latency follows the last few tasks.
+        self.baseline_latency:Optional[float] = None
+        self.recent_latency:Optional[float] = None
+        self.completed:int = 0
+        self.failed:int = 0
+        self.throttled:int = 0
+        #the number of tasks completed when the limit was last cut, the next cut waits for a round of tasks.
+        self.last_cut_at:int = -self.max_limit
+        self.load_sampled_at:float = 0.0
+        self.saturated:bool = False
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def acquire(self, blocking:bool = True, timeout:Optional[float] = None) -> bool:
+        """
+        Waits until fewer tasks than the limit are running and takes a place.
+
+        Parameters:
+            blocking: whether to wait for a place.
+            timeout [optional]: the longest time to wait.
+
+        Returns:
+            True if a place was taken.
+        """
+        with self.condition:
+            if(not blocking):
+                if(self.in_flight >= self.current_limit):
+                    return False
+            elif(not self.condition.wait_for(lambda: self.in_flight < self.current_limit, timeout)):
+                return False
+            self.in_flight += 1
+        self.started.value = time.perf_counter()
+        return True
+
+    def release(self, error:Optional[BaseException] = None) -> None:
+        """
+        Gives back the place of a task and adjusts the limit from its outcome. A caller that only knows the semaphore
+        interface releases without an error, and the task counts as successful.
+
+        Parameters:
+            error [optional]: the exception of the task if it failed.
+
+        Returns:
+            None
+        """
+        started = getattr(self.started, 'value', None)
+        latency = time.perf_counter() - started if started != None else None
+        self.started.value = None
+
+        with self.condition:
+            self.in_flight -= 1
+            if(error != None):
+                self.on_error(error)
+            elif(latency != None):
+                self.on_success(latency)
+            self.condition.notify_all()
+
+    def __enter__(self) -> 'AdaptiveLimiter':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.release(exc)
+
+    def snapshot(self) -> dict[str,float]:
+        """
+        Returns the state of the limiter, for the logs and the benchmarks.
+
+        Parameters:
+            None
+
+        Returns:
+            the limit, the running tasks, the latencies and the counts of completed, failed and throttled tasks.
+        """
+        with self.condition:
+            return {'limit': self.current_limit, 'in_flight': self.in_flight, 'baseline_latency': self.baseline_latency, 'recent_latency': self.recent_latency,
+                    'completed': self.completed, 'failed': self.failed, 'throttled': self.throttled}
+
+# <-------------------------------- Limit Adjustment ------------------------------->
+
+    def on_success(self, latency:float) -> None:
+        #called with the condition held.
+        self.completed += 1
+        if(self.baseline_latency == None):
+            self.baseline_latency = self.recent_latency = latency
+            return
+        #the videos differ in length, so a single slow task is averaged out and only a trend of slower tasks, from
+        #contention or a slower service, lowers the limit; a lasting change of the baseline is absorbed over time.
+        self.recent_latency = 0.7*self.recent_latency + 0.3*latency
+        self.baseline_latency = 0.95*self.baseline_latency + 0.05*latency
+
+        if(self.recent_latency > self.latency_tolerance*self.baseline_latency):
+            self.decrease(self.backoff)
+        elif(self.cpu_saturated()):
+            if(self.cpu_bound):
+                self.decrease(self.backoff)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1/max(1.0, self.limit))
+
+    def on_error(self, error:BaseException) -> None:
+        #called with the condition held.
+        self.completed += 1
+        self.failed += 1
+        if(is_rate_limited(error)):
+            self.throttled += 1
+            self.decrease(self.rate_limit_backoff)
+        else:
+            self.decrease(self.error_backoff)
+
+    def decrease(self, factor:float) -> None:
+        #the tasks of the last round started under the old limit, cutting again for each of them would collapse the limit.
+        if(self.completed - self.last_cut_at < max(1, self.current_limit)):
+            return
+        previous = self.current_limit
+        self.limit = max(float(self.min_limit), self.limit*factor)
+        self.last_cut_at = self.completed
+        if(self.current_limit != previous):
+            print(f"ADAPTIVE - lowered the concurrency of {self.name} from {previous} to {self.current_limit}")
+
+    def cpu_saturated(self) -> bool:
+        now = time.perf_counter()
+        if(now - self.load_sampled_at >= LOAD_SAMPLE_SECONDS):
+            self.load_sampled_at = now
+            self.saturated = load_per_core() >= self.cpu_threshold
+        return self.saturated
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+def is_rate_limited(error:BaseException) -> bool:
+    """
+    Tells whether an error is a throttled request, from the status of an HTTP error or, for the libraries that only
+    raise a message, from the message.
+
+    Parameters:
+        error: the exception.
+
+    Returns:
+        True if the service asked for fewer requests.
+    """
+    for attribute in ('status', 'status_code', 'code'):
+        if(getattr(error, attribute, None) in RATE_LIMIT_STATUSES):
+            return True
+    response = getattr(error, 'response', None)
+    if(getattr(response, 'status_code', None) in RATE_LIMIT_STATUSES):
+        return True
+    return bool(RATE_LIMIT_MESSAGE.search(f'{type(error).__name__} {error}'))
+
+def load_per_core() -> float:
+    """
+    Returns the load average of the last minute per core, 0 where the platform does not report it.
+
+    Parameters:
+        None
+
+    Returns:
+        the load per core.
+    """
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+# the stages that keep a core busy, the others wait on the network
+CPU_BOUND_STAGES = frozenset({'extract_audio', 'trim_audio', 'sentiment', 'emotions', 'timeline'})
+
+_limiters:dict[str,AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(stage:str, cpu_bound:Optional[bool] = None) -> AdaptiveLimiter:
+    """
+    Returns the limiter of a stage, creating it on first use, so what a stage learned carries over to its next batch,
+    whichever backend or pipeline runs it. A CPU bound stage starts at half the cores and may use them all, a network
+    bound one starts at 4 and may reach 64.
+
+    Parameters:
+        stage: the name of the stage, like 'translate' for the translations into every language.
+        cpu_bound [optional]: whether the stage keeps a core busy, looked up in CPU_BOUND_STAGES if it is not given.
+
+    Returns:
+        the shared AdaptiveLimiter.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(stage)
+        if(limiter == None):
+            if(cpu_bound == None):
+                cpu_bound = stage in CPU_BOUND_STAGES
+            cores = os.cpu_count() or 1
+            if(cpu_bound):
+                limiter = AdaptiveLimiter(stage, max(1, cores//2), 1, cores, cpu_bound=True)
+            else:
+                limiter = AdaptiveLimiter(stage, 4, 1, 64)
+            _limiters[stage] = limiter
+        return limiter
+
+def limiter_snapshots() -> dict[str,dict[str,float]]:
+    """
+    Returns the state of the limiter of every stage.
+
+    Parameters:
+        None
+
+    Returns:
+        the state of each limiter, by stage.
+    """
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {stage: limiter.snapshot() for stage, limiter in limiters.items()}
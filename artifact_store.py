@@ -0,0 +1,342 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import threading
+import contextlib
+from sqlite_connection import ProcessConnection
+from typing import IO, Iterator, NamedTuple, Optional
+
+# the part of the name of a file that is still being written, it is renamed into place once it is complete
+TEMPORARY_MARKER = '.partial'
+
+INDEX_NAME = 'index.sqlite'
+
+class ArtifactRecord(NamedTuple):
+    video_id: str
+    url: str
+    title: str
+    folder: str
+    registered_at: float
+
+# <-------------------------------- Atomic Writes ------------------------------->
+
+@contextlib.contextmanager
+def atomic_path(path:str) -> Iterator[str]:
+    """
+    Gives a temporary path next to a file to write it to, and renames it over the file once the block completes, so a
+    reader, or another worker writing the same file, never sees it half written. The temporary file keeps the extension
+    of the file, for the writers that pick the format from it, and is removed if the block fails.
+
+    Parameters:
+        path: the path of the file.
+
+    Returns:
+        a context manager that yields the temporary path.
+    """
+    folder, name = os.path.split(path)
+    stem, extension = os.path.splitext(name)
+    os.makedirs(folder or '.', exist_ok=True)
+    #the name is unique to the writer, threads of one process included, and hidden from the listings of the folder.
+    temporary_path = os.path.join(folder, f'.{stem}.{uuid.uuid4().hex[:12]}{TEMPORARY_MARKER}{extension}')
+    try:
+        yield temporary_path
+        os.replace(temporary_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporary_path)
+        raise
+
+@contextlib.contextmanager
+def atomic_open(path:str, mode:str = 'w', **kwargs) -> Iterator[IO]:
+    """
+    Opens a temporary file to write a file through, as atomic_path does.
+
+    Parameters:
+        path: the path of the file.
+        mode: the mode in which to open the file, 'w' or 'wb'.
+        kwargs: the other arguments of open, like the encoding.
+
+    Returns:
+        a context manager that yields the open file.
+    """
+    with atomic_path(path) as temporary_path:
+        with open(temporary_path, mode, **kwargs) as file:
+            yield file
+
+def partial_path(path:str) -> str:
+    """
+    Returns the path a file is written to by partial_open until it is complete, <name>.partial next to the file.
+
+    Parameters:
+        path: the path of the file.
+
+    Returns:
+        the path of the file while it is being written.
+    """
+    return path + TEMPORARY_MARKER
+
+@contextlib.contextmanager
+def partial_open(path:str, mode:str = 'w', **kwargs) -> Iterator[IO]:
+    """
+    Opens a file that is written progressively, like the subtitles of a transcription, at a temporary path that a reader
+    can find from the path of the file (partial_path), so it can follow the file while it is being written. The file is
+    renamed into place once the block completes and removed if it fails. Unlike atomic_open, the temporary path is the
+    same for every writer, so only one writer may write a file at a time, which the manifest and the task queue see to
+    for the stages, and a file left by a crashed writer is overwritten by the next one.
+
+    Parameters:
+        path: the path of the file.
+        mode: the mode in which to open the file, 'w' or 'wb'.
+        kwargs: the other arguments of open, like the encoding.
+
+    Returns:
+        a context manager that yields the open file.
+    """
+    temporary_path = partial_path(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        with open(temporary_path, mode, **kwargs) as file:
+            yield file
+        os.replace(temporary_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporary_path)
+        raise
+
+# <-------------------------------- Artifact Store ------------------------------->
+
+class ArtifactStore:
+
+    def __init__(self, root:str, shard_depth:int = 2, shard_width:int = 2) -> None:
+        """
+        Initialises a store of the outputs of the videos under a data folder. Each video has a folder named by its
+        canonical id, so two videos with the same title never share one, placed under subfolders named by the first
+        characters of the hash of the id (video_data/3f/a9/<id>/ by default), so no folder holds more than a few
+        hundred entries however large the corpus grows. An index in a SQLite file maps each id to its URL, its title
+        and its folder, for lookups and cleanups that do not walk the folders.
+
+        Parameters:
+            root: the data folder.
+            shard_depth: the number of levels of subfolders.
+            shard_width: the number of hexadecimal characters of the hash that name each level, 256 subfolders for 2.
+
+        Returns:
+            None
+        """
+        self.root:str = root
+        self.shard_depth:int = shard_depth
+        self.shard_width:int = shard_width
+        self.lock = threading.Lock()
+        #the index may sit on storage shared by several nodes, where the write-ahead log cannot be used.
+        self.database = ProcessConnection(os.path.join(root, INDEX_NAME), ['CREATE TABLE IF NOT EXISTS videos (video_id TEXT PRIMARY KEY, url TEXT, title TEXT, folder TEXT, registered_at REAL)',
+                                                                           'CREATE INDEX IF NOT EXISTS videos_by_title ON videos (title)',
+                                                                           'CREATE INDEX IF NOT EXISTS videos_by_age ON videos (registered_at)'], timeout=60)
+
+    def folder(self, video_id:str) -> str:
+        """
+        Returns the folder of the outputs of a video, computed from its id without looking anything up.
+
+        Parameters:
+            video_id: the canonical id of the video.
+
+        Returns:
+            the path of the folder.
+        """
+        digest = hashlib.blake2b(video_id.encode('utf-8'), digest_size=8).hexdigest()
+        shards = [digest[level*self.shard_width:(level+1)*self.shard_width] for level in range(self.shard_depth)]
+        return os.path.join(self.root, *shards, video_id)
+
+    def register(self, video_id:str, url:str, title:Optional[str]) -> str:
+        """
+        Records a video in the index, updating its URL and title if it is already there.
+
+        Parameters:
+            video_id: the canonical id of the video.
+            url: the URL of the video.
+            title [optional]: the title of the video.
+
+        Returns:
+            the folder of the outputs of the video.
+        """
+        folder = self.folder(video_id)
+        os.makedirs(folder, exist_ok=True)
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT INTO videos (video_id, url, title, folder, registered_at) VALUES (?, ?, ?, ?, ?) '
+                                   'ON CONFLICT (video_id) DO UPDATE SET url = excluded.url, title = excluded.title, registered_at = excluded.registered_at',
+                                   (video_id, url, title, folder, time.time()))
+        return folder
+
+    def lookup(self, video_id:str) -> Optional[ArtifactRecord]:
+        """
+        Looks up a video in the index.
+
+        Parameters:
+            video_id: the canonical id of the video.
+
+        Returns:
+            the record of the video, or None if it is not in the store.
+        """
+        with self.lock:
+            row = self.connect().execute('SELECT video_id, url, title, folder, registered_at FROM videos WHERE video_id = ?', (video_id,)).fetchone()
+        return ArtifactRecord(*row) if row != None else None
+
+    def find_by_title(self, title:str) -> list[ArtifactRecord]:
+        """
+        Looks up the videos with a title, several videos can share one.
+
+        Parameters:
+            title: the title of the video.
+
+        Returns:
+            the records of the videos.
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT video_id, url, title, folder, registered_at FROM videos WHERE title = ? ORDER BY registered_at', (title,)).fetchall()
+        return [ArtifactRecord(*row) for row in rows]
+
+    def files(self, video_id:str) -> list[str]:
+        """
+        Lists the complete output files of a video, leaving out the ones still being written.
+
+        Parameters:
+            video_id: the canonical id of the video.
+
+        Returns:
+            the paths of the files, sorted.
+        """
+        folder = self.folder(video_id)
+        if(not os.path.isdir(folder)):
+            return []
+        return sorted(entry.path for entry in os.scandir(folder) if entry.is_file() and TEMPORARY_MARKER not in entry.name)
+
+    def remove(self, video_id:str) -> bool:
+        """
+        Removes the outputs of a video and its record. The folder is first renamed out of the way, so a worker that
+        writes the video again starts from an empty folder instead of racing the deletion.
+
+        Parameters:
+            video_id: the canonical id of the video.
+
+        Returns:
+            whether the video was in the store.
+        """
+        folder = self.folder(video_id)
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                removed = connection.execute('DELETE FROM videos WHERE video_id = ?', (video_id,)).rowcount == 1
+        if(os.path.isdir(folder)):
+            doomed = f'{folder}.{uuid.uuid4().hex[:12]}.removed'
+            try:
+                os.rename(folder, doomed)
+            except FileNotFoundError:
+                return removed
+            shutil.rmtree(doomed, ignore_errors=True)
+            removed = True
+        return removed
+
+    def remove_older_than(self, seconds:float) -> int:
+        """
+        Removes the videos registered more than a number of seconds ago, found through the index.
+
+        Parameters:
+            seconds: the age of the oldest video that is kept.
+
+        Returns:
+            the number of videos removed.
+        """
+        with self.lock:
+            video_ids = [row[0] for row in self.connect().execute('SELECT video_id FROM videos WHERE registered_at < ?', (time.time() - seconds,)).fetchall()]
+        for video_id in video_ids:
+            self.remove(video_id)
+        return len(video_ids)
+
+    def remove_partial_files(self, older_than:float = 3600.0) -> int:
+        """
+        Removes the temporary files left behind by workers that crashed while writing. The files of the writers that
+        are still running are kept, as they are younger than older_than.
+
+        Parameters:
+            older_than: the number of seconds since a temporary file was last written for it to be removed.
+
+        Returns:
+            the number of files removed.
+        """
+        cutoff = time.time() - older_than
+        removed = 0
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(folder, name)
+                if(TEMPORARY_MARKER in name):
+                    with contextlib.suppress(FileNotFoundError):
+                        if(os.path.getmtime(path) < cutoff):
+                            os.remove(path)
+                            removed += 1
+        return removed
+
+    def count(self) -> int:
+        with self.lock:
+            return self.connect().execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+    def connect(self) -> sqlite3.Connection:
+        return self.database.get()
+
+def video_key(url:str, video_id:Optional[str] = None) -> str:
+    """
+    Returns the canonical id a video is stored under: its YouTube id, or the hash of its URL for other videos.
+
+    Parameters:
+        url: the URL of the video.
+        video_id [optional]: the id of the video, if it is already known.
+
+    Returns:
+        the id.
+    """
+    #url_ingestion builds VideoFile objects, it is imported here so that VideoFile can import this module.
+    from url_ingestion import canonical_video_id
+    if(video_id == None):
+        video_id = canonical_video_id(url.strip())
+    if(video_id == None):
+        video_id = 'url-' + hashlib.blake2b(url.strip().encode('utf-8'), digest_size=8).hexdigest()
+    return video_id
+
+_stores:dict[str,ArtifactStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(root:str) -> ArtifactStore:
+    """
+    Returns the store of a data folder, creating it on first use, so all the videos of the process share its index.
+
+    Parameters:
+        root: the data folder.
+
+    Returns:
+        the ArtifactStore.
+    """
+    key = os.path.abspath(root)
+    with _stores_lock:
+        store = _stores.get(key)
+        if(store == None):
+            store = ArtifactStore(root)
+            _stores[key] = store
+    return store
+
+def release_store(root:str) -> None:
+    """
+    Forgets the store of a data folder, for a caller that removes the folder, so the next get_store starts afresh.
+
+    Parameters:
+        root: the data folder.
+
+    Returns:
+        None
+    """
+    with _stores_lock:
+        _stores.pop(os.path.abspath(root), None)
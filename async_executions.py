@@ -0,0 +1,210 @@
+import os
+import time
+import random
+import asyncio
+import aiohttp
+from VideoFile import VideoFile
+from backends import ResolvedStream, pytube_resolver
+from metrics import instrument_runner
+from typing import Callable, Optional
+
+# <-------------------------------- Async Downloader ------------------------------->
+
+class AsyncDownloader:
+
+    # the responses that are worth retrying, any other error status fails the download straight away
+    RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+    def __init__(self, resolver:Callable[[str],ResolvedStream] = pytube_resolver, max_concurrency:int = 32, per_host:int = 8,
+                 max_resolving:int = 8, chunk_size:int = 256*1024, retries:int = 4, backoff_seconds:float = 0.5) -> None:
+        """
+        Initialises a downloader that streams the videos to disk over a shared pool of HTTP connections.
+
+        Parameters:
+            resolver: the function that turns a video URL into the URL of the stream to be downloaded, run in a thread.
+            max_concurrency: the number of downloads and of open connections at one time.
+            per_host: the number of open connections to the same host at one time.
+            max_resolving: the number of URLs that are resolved at one time.
+            chunk_size: the number of bytes written to disk at a time.
+            retries: the number of times a failed transfer is retried, resuming from what was already written.
+            backoff_seconds: the delay before the first retry, doubled (with jitter) for each following retry.
+
+        Returns:
+            None
+        """
+        self.resolver:Callable[[str],ResolvedStream] = resolver
+        self.max_concurrency:int = max_concurrency
+        self.per_host:int = per_host
+        self.max_resolving:int = max_resolving
+        self.chunk_size:int = chunk_size
+        self.retries:int = retries
+        self.backoff_seconds:float = backoff_seconds
+
+    def run(self, videos:list[VideoFile], data_folder:str) -> list[Optional[BaseException]]:
+        """
+        Downloads the videos with an event loop of its own.
+
+        Parameters:
+            videos: the array of VideoFile objects
+            data_folder: the folder name where all videos are to be downloaded.
+
+        Returns:
+            the exception of each video that failed, None for the ones that were downloaded.
+        """
+        return asyncio.run(self.download_all(videos, data_folder))
+
+    async def download_all(self, videos:list[VideoFile], data_folder:str) -> list[Optional[BaseException]]:
+        """
+        Downloads the videos concurrently, sharing one HTTP session so the connections are reused.
+
+        Parameters:
+            videos: the array of VideoFile objects
+            data_folder: the folder name where all videos are to be downloaded.
+
+        Returns:
+            the exception of each video that failed, None for the ones that were downloaded.
+        """
+        downloads = asyncio.Semaphore(self.max_concurrency)
+        resolving = asyncio.Semaphore(self.max_resolving)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+            async def download_one(video:VideoFile) -> Optional[BaseException]:
+                async with downloads:
+                    try:
+                        await self.download(session, resolving, video, data_folder)
+                        return None
+                    except Exception as e:
+                        print(f"UNSUCCESSFUL - failed to complete downloading video from {video.url}")
+                        print(e)
+                        return e
+
+            return await asyncio.gather(*(download_one(video) for video in videos))
+
+    async def download(self, session:aiohttp.ClientSession, resolving:asyncio.Semaphore, video:VideoFile, data_folder:str) -> None:
+        """
+        Resolves and downloads one video, setting the same attributes as VideoFile.download_video.
+
+        Parameters:
+            session: the shared HTTP session.
+            resolving: the semaphore that limits the number of URLs resolved at one time.
+            video: the VideoFile object to be downloaded.
+            data_folder: the folder name where the videos will be stored, each in their own folder.
+
+        Returns:
+            None
+        """
+        url = video.url.strip()
+        cache_key, cached = video.cache_lookup('download', url, {'stream': 'lowest_resolution'})
+        if(cached != None):
+            video.title = cached.metadata['title']
+            video.assign_folder(data_folder)
+            video.video_path = await asyncio.to_thread(VideoFile.cache.restore, cached, 'video', os.path.join(video.folder_name, video.filename+'.mp4'))
+            print(f"CACHED - video titled {video.title} restored to: {video.video_path}")
+            return
+
+        async with resolving:
+            stream = await asyncio.to_thread(self.resolver, url)
+
+        video.title = stream.title
+        video.assign_folder(data_folder)
+        path = os.path.join(video.folder_name, video.filename+'.mp4')
+
+        print(f"Downloading video titled: {video.title}")
+        await self.fetch(session, stream, path)
+        video.video_path = path
+        print(f"SUCCESSFULL - Download completed to: {video.video_path}")
+        video.cache_store(cache_key, 'download', {'video': video.video_path}, {'title': video.title})
+
+    async def fetch(self, session:aiohttp.ClientSession, stream:ResolvedStream, path:str) -> None:
+        """
+        Streams a file to disk in chunks. The data is written to a .part file that a retry, or a later run, resumes
+        with a Range request, and the file is renamed into place once it is complete.
+
+        Parameters:
+            session: the shared HTTP session.
+            stream: the resolved stream to be downloaded.
+            path: the path of the downloaded file.
+
+        Returns:
+            None
+        """
+        part_path = path + '.part'
+        for attempt in range(self.retries + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if(stream.filesize != None and offset == stream.filesize):
+                break
+
+            headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+            try:
+                async with session.get(stream.url, headers=headers) as response:
+                    if(response.status == 416 and offset > 0):
+                        #the range starts at the end of the file, so the previous attempt had already received all of it.
+                        break
+                    if(response.status in self.RETRYABLE_STATUSES):
+                        raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status, message=response.reason or '')
+                    response.raise_for_status()
+
+                    #a server that ignores the Range header sends the whole file again.
+                    mode = 'ab' if response.status == 206 else 'wb'
+                    with open(part_path, mode) as part_file:
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            part_file.write(chunk)
+                break
+
+            except aiohttp.ClientResponseError as e:
+                if(e.status not in self.RETRYABLE_STATUSES or attempt == self.retries):
+                    raise
+                await self.backoff(attempt, stream.url, e)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if(attempt == self.retries):
+                    raise
+                await self.backoff(attempt, stream.url, e)
+
+        os.replace(part_path, path)
+
+    async def backoff(self, attempt:int, url:str, error:BaseException) -> None:
+        """
+        Waits before a retry, exponentially longer after each attempt, with jitter so the retries do not line up.
+
+        Parameters:
+            attempt: the number of the attempt that failed, starting at 0.
+            url: the URL that is retried.
+            error: the error of the failed attempt.
+
+        Returns:
+            None
+        """
+        delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+        print(f"RETRYING - attempt {attempt+1} to download {url} failed ({error}), retrying in {round(delay,2)} second(s)")
+        await asyncio.sleep(delay)
+
+# <-------------------------------- Parallel Downloading Functions ------------------------------->
+
+@instrument_runner('asyncio')
+def parallel_video_downloader(videos:list[VideoFile], data_folder:str, max_concurrency:int = 32, per_host:int = 8, resolver:Callable[[str],ResolvedStream] = pytube_resolver) -> list[Optional[BaseException]]:
+    """
+    Downloads an array of videos provided, using asyncio.
+
+    Parameters:
+        videos: the array of VideoFile objects
+        data_folder: the folder name where all videos are to be downloaded.
+        max_concurrency: the number of downloads at one time.
+        per_host: the number of open connections to the same host at one time.
+        resolver: the function that turns a video URL into the URL of the stream to be downloaded.
+
+    Returns:
+        the exception of each video that failed, None for the ones that were downloaded.
+    """
+    start = time.perf_counter()
+
+    downloader = AsyncDownloader(resolver, max_concurrency, per_host)
+    errors = downloader.run(videos, data_folder)
+
+    end = time.perf_counter()
+    failed = sum(1 for error in errors if error != None)
+    print(f'Time took to download the videos in parallel [asyncio]: {round(end-start,2)} second(s), {failed} failed')
+    return errors
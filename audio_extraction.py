@@ -0,0 +1,92 @@
+import wave
+import subprocess
+import numpy as np
+from transcription import to_mono_int16
+from typing import Callable
+
+# the format the speech recognizers work with
+RECOGNIZER_SAMPLE_RATE = 16000
+RECOGNIZER_SAMPLE_WIDTH = 2
+
+def ffmpeg_binary() -> str:
+    """
+    Returns the ffmpeg executable that moviepy is configured with.
+
+    Parameters:
+        None
+
+    Returns:
+        the path of the ffmpeg executable.
+    """
+    from moviepy.config import get_setting
+    return get_setting('FFMPEG_BINARY')
+
+def decode_audio(video_path:str, sample_rate:int = RECOGNIZER_SAMPLE_RATE) -> np.ndarray:
+    """
+    Decodes only the audio stream of a video, resampled to 16 bit mono samples. The video frames are never decoded.
+
+    Parameters:
+        video_path: the path of the video file.
+        sample_rate: the number of samples per second of the decoded audio.
+
+    Returns:
+        the samples of the audio.
+    """
+    command = [ffmpeg_binary(), '-v', 'error', '-i', video_path,
+               '-vn', '-ac', '1', '-ar', str(sample_rate), '-acodec', 'pcm_s16le', '-f', 's16le', '-']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if(result.returncode != 0):
+        raise RuntimeError(f'ffmpeg could not decode the audio of {video_path}: {result.stderr.decode(errors="replace").strip()}')
+    return np.frombuffer(result.stdout, dtype='<i2')
+
+def write_wav(path:str, samples:np.ndarray, sample_rate:int = RECOGNIZER_SAMPLE_RATE) -> None:
+    """
+    Writes 16 bit mono samples to a .wav file.
+
+    Parameters:
+        path: the path of the .wav file.
+        samples: the samples of the audio.
+        sample_rate: the number of samples per second.
+
+    Returns:
+        None
+    """
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(RECOGNIZER_SAMPLE_WIDTH)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
+
+def read_wav(path:str) -> tuple[np.ndarray,int]:
+    """
+    Reads a .wav file into memory as 16 bit mono samples.
+
+    Parameters:
+        path: the path of the .wav file.
+
+    Returns:
+        the samples of the audio and the number of samples per second.
+    """
+    with wave.open(path, 'rb') as wav_file:
+        frames = wav_file.readframes(wav_file.getnframes())
+        return to_mono_int16(frames, wav_file.getsampwidth(), wav_file.getnchannels()), wav_file.getframerate()
+
+def buffer_sample_reader(samples:np.ndarray) -> Callable[[int],np.ndarray]:
+    """
+    Wraps samples held in memory as a reader for the chunked transcriber. The chunks are views of the buffer, not copies.
+
+    Parameters:
+        samples: the samples of the audio.
+
+    Returns:
+        a function that reads up to the given number of samples.
+    """
+    position = 0
+
+    def read(count:int) -> np.ndarray:
+        nonlocal position
+        chunk = samples[position:position+count]
+        position += len(chunk)
+        return chunk
+
+    return read
@@ -0,0 +1,302 @@
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+import urllib.request
+import speech_recognition as sr
+from artifact_store import atomic_open
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, NamedTuple, Optional
+
+class ResolvedStream(NamedTuple):
+    url: str
+    title: str
+    filesize: Optional[int] = None
+
+# a video source turns the URL of a video into the URL of the stream to download, with its title
+VideoSource = Callable[[str],ResolvedStream]
+# a recognizer transcribes a chunk of audio, like transcription.google_recognizer
+Recognizer = Callable[[sr.AudioData],str]
+# a translation backend translates segments, like translation.google_backend
+TranslationBackend = Callable[[list[str],str,str],list[str]]
+
+RANGE_HEADER = re.compile(r'bytes=(\d*)-(\d*)$')
+
+# <-------------------------------- Live Services ------------------------------->
+
+def pytube_resolver(video_url:str) -> ResolvedStream:
+    """
+    Resolves a YouTube URL to the direct URL of its lowest resolution stream, like VideoFile.download_video does.
+
+    Parameters:
+        video_url: The Youtube URL of the video
+
+    Returns:
+        the URL, title and size of the stream.
+    """
+    from pytube import YouTube
+    yt = YouTube(video_url)
+    stream = yt.streams.get_lowest_resolution()
+    return ResolvedStream(stream.url, yt.title, stream.filesize)
+
+def fetch_stream(url:str, path:str, chunk_size:int = 256*1024, timeout:float = 60.0) -> str:
+    """
+    Downloads a resolved stream to a file, a chunk at a time.
+
+    Parameters:
+        url: the URL of the stream.
+        path: the path of the file.
+        chunk_size: the number of bytes written at a time.
+        timeout: the longest wait for the server, in seconds.
+
+    Returns:
+        the path of the file.
+    """
+    #an error status raises urllib.error.HTTPError, whose code tells a throttled request apart.
+    with urllib.request.urlopen(url, timeout=timeout) as response, atomic_open(path, 'wb') as file:
+        while True:
+            chunk = response.read(chunk_size)
+            if(not chunk):
+                break
+            file.write(chunk)
+    return path
+
+# <-------------------------------- Fault Injection ------------------------------->
+
+class ServiceError(Exception):
+
+    def __init__(self, status:int, message:str) -> None:
+        super().__init__(f'HTTP Error {status}: {message}')
+        self.status:int = status
+        self.message:str = message
+
+    def __reduce__(self) -> tuple:
+        #the errors of the process backends are pickled back to the parent with their status.
+        return (ServiceError, (self.status, self.message))
+
+class FaultProfile:
+
+    def __init__(self, latency:float = 0.0, jitter:float = 0.0, error_rate:float = 0.0, throttle_rate:float = 0.0,
+                 capacity:Optional[int] = None, seed:Optional[int] = 0) -> None:
+        """
+        Initialises the behaviour of a stand-in service: how long a call takes, and how often it fails or is throttled.
+        With a seed, the same sequence of calls sees the same delays and faults on every run. A process forked from the
+        one that made the profile, like a worker of run_local_workers, mixes its process id into the seed, so each worker
+        draws its own faults instead of repeating those of the others.
+
+        Parameters:
+            latency: the number of seconds each call takes.
+            jitter: the largest number of seconds added to or taken from the latency, uniformly at random.
+            error_rate: the share of calls that fail with a 503 Service Unavailable.
+            throttle_rate: the share of calls that are refused with a 429 Too Many Requests.
+            capacity [optional]: the number of calls served at one time, the calls above it are refused with a 429.
+            seed [optional]: the seed of the random delays and faults, None for a different run every time.
+
+        Returns:
+            None
+        """
+        self.latency:float = latency
+        self.jitter:float = jitter
+        self.error_rate:float = error_rate
+        self.throttle_rate:float = throttle_rate
+        self.capacity:Optional[int] = capacity
+        self.seed:Optional[int] = seed
+        self.pid:int = os.getpid()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.active:int = 0
+        self.calls:int = 0
+        self.errors:int = 0
+        self.throttled:int = 0
+
+    def call(self, work:Callable[[],object]) -> object:
+        """
+        Runs a call of the service: refuses it when the service is over capacity or the dice say so, waits for the
+        latency, and returns the result of the work.
+
+        Parameters:
+            work: the function that computes the response.
+
+        Returns:
+            the response.
+        """
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            active = self.active
+            #a forked process inherits the state of the generator, which would give every worker the same rolls.
+            if(os.getpid() != self.pid):
+                self.pid = os.getpid()
+                self.random = random.Random(f'{self.seed}:{self.pid}' if self.seed != None else None)
+            roll = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        try:
+            if((self.capacity != None and active > self.capacity) or roll < self.throttle_rate):
+                with self.lock:
+                    self.throttled += 1
+                raise ServiceError(429, 'Too Many Requests')
+            time.sleep(delay)
+            if(roll < self.throttle_rate + self.error_rate):
+                with self.lock:
+                    self.errors += 1
+                raise ServiceError(503, 'Service Unavailable')
+            return work()
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def counts(self) -> dict[str,int]:
+        with self.lock:
+            return {'calls': self.calls, 'errors': self.errors, 'throttled': self.throttled}
+
+# <-------------------------------- Stand-in Services ------------------------------->
+
+class FakeRecognizer:
+
+    def __init__(self, profile:Optional[FaultProfile] = None, transcript:str = 'the quick brown fox jumps over the lazy dog.') -> None:
+        """
+        Initialises a recognizer that stands in for the speech API, for ChunkedTranscriber(recognizer=...). It answers
+        every chunk with the same transcript, after the delays and faults of its profile.
+
+        Parameters:
+            profile [optional]: the latency and faults of the service.
+            transcript: the transcript of every chunk.
+
+        Returns:
+            None
+        """
+        self.profile:FaultProfile = profile or FaultProfile()
+        self.transcript:str = transcript
+
+    def __call__(self, audio:sr.AudioData) -> str:
+        return self.profile.call(lambda: self.transcript)
+
+class FakeTranslationBackend:
+
+    def __init__(self, profile:Optional[FaultProfile] = None) -> None:
+        """
+        Initialises a backend that stands in for the translation API, for TranslationEngine(backend=...). Each request
+        returns its segments marked with the target language, after the delays and faults of its profile.
+
+        Parameters:
+            profile [optional]: the latency and faults of the service, per request.
+
+        Returns:
+            None
+        """
+        self.profile:FaultProfile = profile or FaultProfile()
+
+    def __call__(self, segments:list[str], source:str, target:str) -> list[str]:
+        return self.profile.call(lambda: [f'[{target}] {segment}' for segment in segments])
+
+class FakeVideoServer:
+
+    def __init__(self, video_path:str, profile:Optional[FaultProfile] = None, host:str = '127.0.0.1', port:int = 0) -> None:
+        """
+        Initialises a local HTTP server that stands in for YouTube: every video is served from the same fixture file,
+        with Range requests answered by 206 Partial Content so resumed downloads work, and every request goes through
+        the delays and faults of the profile. The server itself is used as the video source (VideoFile.video_source),
+        resolving any URL to a stream of the server.
+
+        Parameters:
+            video_path: the path of the fixture video.
+            profile [optional]: the latency and faults of the server, per request.
+            host: the address the server listens on.
+            port: the port the server listens on, a free one if it is 0.
+
+        Returns:
+            None
+        """
+        self.video_path:str = video_path
+        self.profile:FaultProfile = profile or FaultProfile()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread:Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeVideoServer':
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-video-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'FakeVideoServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def __call__(self, video_url:str) -> ResolvedStream:
+        """
+        Resolves the URL of a video to its stream on the server. The title is built from a hash of the URL, so every
+        video gets a folder of its own.
+
+        Parameters:
+            video_url: the URL of the video.
+
+        Returns:
+            the URL, title and size of the stream.
+        """
+        video_key = hashlib.blake2b(video_url.strip().encode('utf-8'), digest_size=6).hexdigest()
+        return ResolvedStream(f'{self.base_url}/videos/{video_key}.mp4', f'Video {video_key}', os.path.getsize(self.video_path))
+
+    def make_handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self) -> None:
+                try:
+                    server.profile.call(lambda: None)
+                except ServiceError as e:
+                    self.send_error(e.status)
+                    return
+
+                size = os.path.getsize(server.video_path)
+                start, end = 0, size - 1
+                match = RANGE_HEADER.match(self.headers.get('Range', ''))
+                if(match != None and match.group(1) + match.group(2) != ''):
+                    if(match.group(1) != ''):
+                        start = int(match.group(1))
+                        end = int(match.group(2)) if match.group(2) != '' else size - 1
+                    else:
+                        start = max(0, size - int(match.group(2)))
+                    if(start >= size or start > end):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{size}')
+                        self.end_headers()
+                        return
+                    end = min(end, size - 1)
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+
+                with open(server.video_path, 'rb') as file:
+                    file.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = file.read(min(256*1024, remaining))
+                        if(not chunk):
+                            break
+                        self.wfile.write(chunk)
+                        remaining -= len(chunk)
+
+            def log_message(self, format:str, *args) -> None:
+                #thousands of requests per run would flood the output.
+                pass
+
+        return Handler
@@ -0,0 +1,393 @@
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import argparse
+import platform
+import threading
+import multiprocessing
+import numpy as np
+import speech_recognition as sr
+from VideoFile import VideoFile
+from transcription import ChunkedTranscriber
+import serial_executions
+import threads_executions
+import process_executions
+import concurrent_executions
+from typing import Callable, Optional
+
+STAGES = ('extract', 'transcribe', 'sentiment', 'translate', 'emotions')
+BACKENDS = ('serial', 'threads', 'processes', 'concurrent')
+
+# the stages whose outputs a stage reads, they are run serially before it is benchmarked
+PREREQUISITES = {
+    'extract': (),
+    'transcribe': ('extract',),
+    'sentiment': ('extract', 'transcribe'),
+    'translate': ('extract', 'transcribe'),
+    'emotions': ('extract', 'transcribe'),
+}
+
+LANG_FROM, LANG_TO, LANG_NAME = 'en', 'es', 'Spanish'
+
+# the end of the name of the file that each stage writes, in the folder of the video
+STAGE_OUTPUTS = {
+    'extract': '.wav',
+    'transcribe': '.txt',
+    'sentiment': '_sentiments.txt',
+    'translate': f'_{LANG_NAME}.txt',
+    'emotions': '_emotions.txt',
+}
+
+STUB_TRANSCRIPT = ("The film opens on a quiet harbour town and the crowd is delighted by the music. "
+                   "Later the storm frightens everyone, but the ending is hopeful and warm.")
+
+# <-------------------------------- Stub Services ------------------------------->
+
+class StubRecognizer:
+
+    def __init__(self, latency:float) -> None:
+        """
+        Initialises a recognizer that stands in for the speech API: it waits for the given latency, like a network
+        call, and returns a fixed transcript.
+
+        Parameters:
+            latency: the number of seconds each chunk takes to be transcribed.
+
+        Returns:
+            None
+        """
+        self.latency:float = latency
+
+    def __call__(self, audio:sr.AudioData) -> str:
+        time.sleep(self.latency)
+        return STUB_TRANSCRIPT
+
+class StubTranslator:
+
+    def __init__(self, latency:float) -> None:
+        """
+        Initialises a translator that stands in for the translation API: it waits for the given latency and returns
+        the text marked with the target language.
+
+        Parameters:
+            latency: the number of seconds each text takes to be translated.
+
+        Returns:
+            None
+        """
+        self.latency:float = latency
+
+    def __call__(self, text:str, lang_from:str, lang_to:str) -> str:
+        time.sleep(self.latency)
+        return f'[{lang_to}] {text}'
+
+# <-------------------------------- Fixture Videos ------------------------------->
+
+def make_fixture_video(path:str, seconds:float, fps:int = 10, size:tuple[int,int] = (160,120)) -> str:
+    """
+    Renders a small synthetic video, a plain frame with a 440 Hz tone, so the benchmarks never touch the network.
+
+    Parameters:
+        path: the path of the video file.
+        seconds: the length of the video.
+        fps: the frames per second of the video.
+        size: the width and height of the frames.
+
+    Returns:
+        the path of the video file.
+    """
+    from moviepy.editor import ColorClip, AudioClip
+
+    if(os.path.exists(path)):
+        return path
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tone = AudioClip(lambda t: np.stack([0.3*np.sin(2*np.pi*440*np.asarray(t))]*2, axis=-1), duration=seconds, fps=44100)
+    clip = ColorClip(size, color=(30,60,90), duration=seconds).set_audio(tone)
+    clip.write_videofile(path, fps=fps, codec='libx264', audio_codec='aac', verbose=False, logger=None)
+    clip.close()
+    return path
+
+def make_corpus(fixture_path:str, corpus_folder:str, size:int) -> list[VideoFile]:
+    """
+    Copies the fixture video into a folder per video and builds the VideoFile objects as if they had been downloaded.
+
+    Parameters:
+        fixture_path: the path of the fixture video.
+        corpus_folder: the folder where the videos are copied.
+        size: the number of videos.
+
+    Returns:
+        the array of VideoFile objects.
+    """
+    videos = []
+    for index in range(size):
+        video = VideoFile(f'fixture://video/{index}')
+        video.title = f'Fixture video {index}'
+        video.filename = f'fixture_{index}'
+        video.folder_name = os.path.join(corpus_folder, video.filename)
+        os.makedirs(video.folder_name, exist_ok=True)
+        video.video_path = os.path.join(video.folder_name, video.filename+'.mp4')
+        if(not os.path.exists(video.video_path)):
+            shutil.copyfile(fixture_path, video.video_path)
+        videos.append(video)
+    return videos
+
+# <-------------------------------- Stage Runners ------------------------------->
+
+def stage_runner(stage:str, backend:str) -> Callable[[list[VideoFile],int],None]:
+    """
+    Returns the function of a backend that runs a stage over the videos with a number of workers.
+
+    Parameters:
+        stage: the name of the stage.
+        backend: the name of the backend.
+
+    Returns:
+        the function, called with the videos and the number of workers.
+    """
+    modules = {'threads': threads_executions, 'processes': process_executions, 'concurrent': concurrent_executions}
+    names = {
+        'extract': 'audio_extractor',
+        'transcribe': 'audio_transcriber',
+        'sentiment': 'sentiment_analyser',
+        'translate': 'text_translator',
+        'emotions': 'emotion_extractor',
+    }
+
+    if(backend == 'serial'):
+        function = getattr(serial_executions, f'serial_{names[stage]}')
+        if(stage == 'translate'):
+            return lambda videos, workers: function(videos, LANG_FROM, LANG_TO, LANG_NAME)
+        return lambda videos, workers: function(videos)
+
+    function = getattr(modules[backend], f'parallel_{names[stage]}')
+    if(stage == 'translate'):
+        return lambda videos, workers: function(videos, LANG_FROM, LANG_TO, LANG_NAME, max_no_of_threads=workers)
+    return lambda videos, workers: function(videos, max_no_of_threads=workers)
+
+def prepare_videos(videos:list[VideoFile], stage:str) -> None:
+    """
+    Runs the stages that the benchmarked stage depends on, serially and in this process, so their outputs are set on
+    the VideoFile objects whatever the backend being measured.
+
+    Parameters:
+        videos: the array of VideoFile objects
+        stage: the name of the benchmarked stage.
+
+    Returns:
+        None
+    """
+    for prerequisite in PREREQUISITES[stage]:
+        if(all(os.path.exists(output_path(video, prerequisite)) for video in videos)):
+            #the outputs of an earlier run are reused, only the attributes are set again.
+            for video in videos:
+                set_output_attribute(video, prerequisite)
+            continue
+        stage_runner(prerequisite, 'serial')(videos, 1)
+
+def output_path(video:VideoFile, stage:str) -> str:
+    return os.path.join(video.folder_name, video.filename + STAGE_OUTPUTS[stage])
+
+def set_output_attribute(video:VideoFile, stage:str) -> None:
+    if(stage == 'extract'):
+        video.audio_path = output_path(video, stage)
+    elif(stage == 'transcribe'):
+        video.text_path = output_path(video, stage)
+
+# <-------------------------------- Resource Measurement ------------------------------->
+
+def process_rss_bytes(pid:int) -> int:
+    """
+    Reads the resident memory of a process from /proc.
+
+    Parameters:
+        pid: the id of the process.
+
+    Returns:
+        the resident memory in bytes, 0 if it cannot be read.
+    """
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+class ResourceSampler:
+
+    def __init__(self, interval:float = 0.05) -> None:
+        """
+        Initialises a sampler that records the peak resident memory of this process and of its worker processes
+        together, every interval seconds, from a background thread.
+
+        Parameters:
+            interval: the number of seconds between samples.
+
+        Returns:
+            None
+        """
+        self.interval:float = interval
+        self.peak_bytes:int = 0
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, name='benchmark-sampler', daemon=True)
+
+    def __enter__(self) -> 'ResourceSampler':
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stopped.set()
+        self.sampler.join()
+
+    def _sample(self) -> None:
+        while True:
+            pids = [os.getpid()] + [child.pid for child in multiprocessing.active_children()]
+            self.peak_bytes = max(self.peak_bytes, sum(process_rss_bytes(pid) for pid in pids))
+            if(self.stopped.wait(self.interval)):
+                return
+
+def cpu_seconds() -> float:
+    """
+    Returns the CPU time used by this process and by its finished child processes.
+
+    Parameters:
+        None
+
+    Returns:
+        the user and system CPU time in seconds.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+# <-------------------------------- Benchmark ------------------------------->
+
+def benchmark_stage(videos:list[VideoFile], stage:str, backend:str, workers:int) -> dict:
+    """
+    Runs a stage over copies of the videos with a backend and measures it.
+
+    Parameters:
+        videos: the array of VideoFile objects, with the prerequisite stages already run.
+        stage: the name of the stage.
+        backend: the name of the backend.
+        workers: the number of workers of the backend.
+
+    Returns:
+        the result of the run: wall time, throughput, CPU utilisation, peak memory and the number of completed videos.
+    """
+    #each run gets copies of the videos, so the attributes set by one run do not leak into the next one.
+    videos = [copy.copy(video) for video in videos]
+    for video in videos:
+        if(os.path.exists(output_path(video, stage))):
+            os.remove(output_path(video, stage))
+
+    run = stage_runner(stage, backend)
+    start_cpu = cpu_seconds()
+    start = time.perf_counter()
+    with ResourceSampler() as sampler:
+        run(videos, workers)
+    wall = time.perf_counter() - start
+    cpu = cpu_seconds() - start_cpu
+    threads_executions.shutdown_shared_executors()
+
+    #the process backends update copies of the videos in the workers, so completion is read from the files on disk.
+    completed = sum(1 for video in videos if os.path.exists(output_path(video, stage)))
+    return {
+        'stage': stage,
+        'backend': backend,
+        'workers': workers,
+        'videos': len(videos),
+        'completed': completed,
+        'wall_seconds': round(wall, 4),
+        'throughput_videos_per_second': round(completed / wall, 4) if wall > 0 else None,
+        'cpu_seconds': round(cpu, 4),
+        'cpu_utilization': round(cpu / (wall * (os.cpu_count() or 1)), 4) if wall > 0 else None,
+        'peak_rss_mb': round(sampler.peak_bytes / 1024**2, 2),
+    }
+
+def run_benchmarks(stages:list[str], backends:list[str], workers:list[int], corpus_sizes:list[int], work_folder:str,
+                   fixture_seconds:float, recognizer_latency:float, translator_latency:float, repeats:int = 1) -> dict:
+    """
+    Runs every stage under every backend, worker count and corpus size.
+
+    Parameters:
+        stages: the names of the stages to be benchmarked.
+        backends: the names of the backends to be compared.
+        workers: the numbers of workers to be tried, the serial backend is only run once.
+        corpus_sizes: the numbers of videos to be tried.
+        work_folder: the folder of the fixture video and of the corpora.
+        fixture_seconds: the length of the fixture video.
+        recognizer_latency: the latency of the stub recognizer for each chunk.
+        translator_latency: the latency of the stub translator for each text.
+        repeats: the number of times each run is repeated.
+
+    Returns:
+        the environment of the benchmark and the result of each run.
+    """
+    #the process backends rely on fork to hand the stubs to the workers, the default start method on Linux.
+    VideoFile.transcriber = ChunkedTranscriber(StubRecognizer(recognizer_latency), chunk_seconds=30, max_workers=4)
+    VideoFile.translator = StubTranslator(translator_latency)
+    VideoFile.cache = None
+    VideoFile.log_path = None
+
+    fixture_path = make_fixture_video(os.path.join(work_folder, 'fixture.mp4'), fixture_seconds)
+    results = []
+    for size in corpus_sizes:
+        videos = make_corpus(fixture_path, os.path.join(work_folder, f'corpus_{size}'), size)
+        for stage in stages:
+            prepare_videos(videos, stage)
+            for backend in backends:
+                for worker_count in ([1] if backend == 'serial' else workers):
+                    for repeat in range(repeats):
+                        print(f'BENCHMARK :: {stage} with {backend} backend, {worker_count} worker(s), {size} video(s), run {repeat+1}')
+                        result = benchmark_stage(videos, stage, backend, worker_count)
+                        result['repeat'] = repeat
+                        results.append(result)
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'start_method': multiprocessing.get_start_method(),
+            'fixture_seconds': fixture_seconds,
+            'recognizer_latency': recognizer_latency,
+            'translator_latency': translator_latency,
+        },
+        'results': results,
+    }
+
+def comma_separated(kind:type) -> Callable[[str],list]:
+    return lambda value: [kind(item) for item in value.split(',') if item != '']
+
+def main(argv:Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks the stages of CineSense under the serial, thread, process and executor backends.')
+    parser.add_argument('--stages', type=comma_separated(str), default=list(STAGES), help='comma separated stages to benchmark')
+    parser.add_argument('--backends', type=comma_separated(str), default=list(BACKENDS), help='comma separated backends to compare')
+    parser.add_argument('--workers', type=comma_separated(int), default=[2, 4, 8], help='comma separated worker counts')
+    parser.add_argument('--corpus-sizes', type=comma_separated(int), default=[8], help='comma separated numbers of videos')
+    parser.add_argument('--repeats', type=int, default=1, help='number of times each run is repeated')
+    parser.add_argument('--work-folder', default='benchmark_data', help='folder of the fixture video and corpora')
+    parser.add_argument('--fixture-seconds', type=float, default=20.0, help='length of the fixture video')
+    parser.add_argument('--recognizer-latency', type=float, default=0.2, help='seconds the stub recognizer takes per chunk')
+    parser.add_argument('--translator-latency', type=float, default=0.2, help='seconds the stub translator takes per text')
+    parser.add_argument('--output', default='benchmark_results.json', help='file the results are written to')
+    args = parser.parse_args(argv)
+
+    for stage in args.stages:
+        if(stage not in STAGES):
+            parser.error(f'unknown stage {stage}, expected one of {", ".join(STAGES)}')
+    for backend in args.backends:
+        if(backend not in BACKENDS):
+            parser.error(f'unknown backend {backend}, expected one of {", ".join(BACKENDS)}')
+
+    report = run_benchmarks(args.stages, args.backends, args.workers, args.corpus_sizes, args.work_folder,
+                            args.fixture_seconds, args.recognizer_latency, args.translator_latency, args.repeats)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f'BENCHMARK :: {len(report["results"])} result(s) written to {args.output}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
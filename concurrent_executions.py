@@ -1,38 +1,150 @@
 import time
 import concurrent.futures
 from VideoFile import VideoFile
-from typing import Optional
+import nlp_models
+from metrics import instrument_runner, observe_remote_stage
+from threads_executions import TaskResult
+from stage_tasks import make_task, run_stage_tasks, default_chunksize, default_pool_size, apply_stage_result
+from typing import Any, Optional
 
-#defines a helper function to call the transcribe_audio method on each video 
-def audio_transcriber_helper(video:VideoFile) -> None:
-        video.transcribe_audio()
+# <-------------------------------- Concurrency Helper Functions ------------------------------->
 
-def parallel_audio_transcriber(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> None:
+def concurrent_process_helper(videos: list[VideoFile], stage:str, descriptive_text:str, params:Optional[dict[str,Any]] = None, max_no_of_threads: Optional[int] = None, chunksize: Optional[int] = None) -> list[TaskResult]:
     """
-    Transcribes the audios of all VideoFile objects using concurrency for parallelism.
+    A helper function that runs a stage on the videos with a ProcessPoolExecutor. The videos are sent as chunks of slim
+    tasks, and the attributes the stage set are merged into the videos of this process as each chunk completes.
 
     Parameters:
         videos: the array of VideoFile objects.
+        stage: the name of the stage, which also selects the models that the workers load.
+        descriptive_text: to print out the specific functionality of the function that calls this helper function.
+        params [optional]: the parameters of the stage.
         max_no_of_threads [optional]: to define the number of workers that could execute a function at one time.
+        chunksize [optional]: the number of tasks sent to a worker at a time, picked from the number of videos if it is not given.
 
     Returns:
-        None    
+        the result or the exception of the stage for each video, in the order of the videos.
     """
 
     if(max_no_of_threads == None):
-        max_no_of_threads = len(videos)
-    try:
-        start = time.perf_counter()
+        max_no_of_threads = default_pool_size(stage, len(videos))
+    if(chunksize == None):
+        chunksize = default_chunksize(len(videos), max_no_of_threads)
+
+    errors:dict[int,Optional[BaseException]] = {}
+    start = time.perf_counter()
+
+    tasks = [make_task(video, index, stage, params) for index, video in enumerate(videos)]
+    chunks = [tasks[i:i+chunksize] for i in range(0, len(tasks), chunksize)]
+    #the models are loaded once per worker, or once in the parent when the workers are forked from it.
+    initializer, initargs = nlp_models.prepare_worker_pool(nlp_models.STAGE_MODELS[stage])
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, max_no_of_threads), initializer=initializer, initargs=initargs) as executor:
+        futures = {executor.submit(run_stage_tasks, chunk): chunk for chunk in chunks}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                for result in future.result():
+                    apply_stage_result(videos[result.index], result)
+                    errors[result.index] = result.error
+            except Exception as e:
+                #the worker running the chunk died, so every video of the chunk failed.
+                for task in futures[future]:
+                    errors[task.index] = e
+                    observe_remote_stage(stage, None, False)
+
+    end = time.perf_counter()
+    failed = sum(1 for error in errors.values() if error != None)
+    print(f'Time took to {descriptive_text} the videos in parallel [concurrency, processes]: {end - start} second(s), {failed} failed')
+    return [TaskResult(video, None, errors.get(index)) for index, video in enumerate(videos)]
+
+# <-------------------------------- Parallel Downloading Functions ------------------------------->
+
+@instrument_runner('concurrent')
+def parallel_video_downloader(videos: list[VideoFile], data_folder: str, max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Downloads an array of videos provided, using concurrency for parallelism.
+
+    Parameters:
+        videos: the array of VideoFile objects.
+        data_folder: the folder name where all videos are to be downloaded.
+        max_no_of_threads [optional]: to define the number of workers that could execute a function at one time.
+
+    Returns:
+        the exception of the download of each video, None for the ones that succeeded.
+    """
+    return concurrent_process_helper(videos, 'download', 'download', {'data_folder': data_folder}, max_no_of_threads)
+
+# <-------------------------------- Parallel Analysis Functions ------------------------------->
+
+@instrument_runner('concurrent')
+def parallel_audio_extractor(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Extracts the audios of all VideoFile objects using concurrency for parallelism.
+
+    Parameters:
+        videos: the array of VideoFile objects.
+        max_no_of_threads [optional]: to define the number of workers that could execute a function at one time.
+
+    Returns:
+        the exception of the audio extraction of each video, None for the ones that succeeded.
+    """
+    return concurrent_process_helper(videos, 'extract_audio', 'extract audio from', None, max_no_of_threads)
+
+@instrument_runner('concurrent')
+def parallel_audio_transcriber(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Transcribes the audios of all VideoFile objects using concurrency for parallelism.
+
+    Parameters:
+        videos: the array of VideoFile objects.
+        max_no_of_threads [optional]: to define the number of workers that could execute a function at one time.
+
+    Returns:
+        the exception of the transcription of each video, None for the ones that succeeded.
+    """
+    return concurrent_process_helper(videos, 'transcribe', 'transcribe audios from', None, max_no_of_threads)
+
+@instrument_runner('concurrent')
+def parallel_sentiment_analyser(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Performs sentiment analysis on all VideoFile objects using concurrency for parallelism.
+
+    Parameters:
+        videos: the array of VideoFile objects.
+        max_no_of_threads [optional]: to define the number of workers that could execute a function at one time.
+
+    Returns:
+        the exception of the sentiment analysis of each video, None for the ones that succeeded.
+    """
+    return concurrent_process_helper(videos, 'sentiment', 'perform sentiment analysis on', None, max_no_of_threads)
 
-        with concurrent.futures.ProcessPoolExecutor(max_workers=max_no_of_threads) as executor:
-            executor.map(audio_transcriber_helper, videos)
+@instrument_runner('concurrent')
+def parallel_text_translator(videos: list[VideoFile], lang_from: str, lang_to: str, lang_name: str, max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Translates the transcribed text of all VideoFile objects using concurrency for parallelism.
 
-        end = time.perf_counter()
-        print(f'Time took to transcribe audios from the videos in parallel [concurrency, processes]: {end - start} second(s)')
+    Parameters:
+        videos: the array of VideoFile objects.
+        lang_from: The original language of the text.
+        lang_to: The language to translate the text into.
+        lang_name: The name in English of the language that the text is to be translated into.
+        max_no_of_threads [optional]: to define the number of workers that could execute a function at one time.
+
+    Returns:
+        the exception of the translation of each video, None for the ones that succeeded.
+    """
+    params = {'lang_from': lang_from, 'lang_to': lang_to, 'lang_to_name': lang_name}
+    return concurrent_process_helper(videos, 'translate', f'translate in {lang_name}', params, max_no_of_threads)
 
-    except Exception as e:
-        print('Failed to transcribe audios concurrently.')
-        print(e)
+@instrument_runner('concurrent')
+def parallel_emotion_extractor(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Extracts the emotions of all VideoFile objects using concurrency for parallelism.
 
+    Parameters:
+        videos: the array of VideoFile objects.
+        max_no_of_threads [optional]: to define the number of workers that could execute a function at one time.
 
-        
\ No newline at end of file
+    Returns:
+        the exception of the emotion extraction of each video, None for the ones that succeeded.
+    """
+    return concurrent_process_helper(videos, 'emotions', 'extract emotion from', None, max_no_of_threads)
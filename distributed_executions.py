@@ -0,0 +1,586 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from VideoFile import VideoFile
+from job_manifest import encode_outputs, decode_outputs
+from stage_tasks import StageTask, STAGE_INPUTS, STAGE_PRODUCES
+import stage_tasks
+import url_ingestion
+import metrics
+from sqlite_connection import ProcessConnection
+from typing import Any, Iterable, Optional
+
+# the states of a task: waiting for a worker (and for the task it depends on), leased by a worker, completed, failed
+# after its last attempt, or never to run because a task it depends on failed
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+# the stage each stage reads the outputs of, a stage that is not queued is replaced by the one it depends on
+UPSTREAM = {
+    'download': None,
+    'extract_audio': 'download',
+    'trim_audio': 'extract_audio',
+    'transcribe': 'trim_audio',
+    'sentiment': 'transcribe',
+    'translate': 'transcribe',
+    'emotions': 'transcribe',
+    'timeline': 'transcribe',
+}
+
+DEFAULT_STAGES = ('download', 'extract_audio', 'transcribe', 'sentiment', 'translate', 'emotions')
+
+# <-------------------------------- Task Queue ------------------------------->
+
+class TaskQueue:
+
+    def __init__(self, path:str, wal:bool = False, max_attempts:int = 3, retry_seconds:float = 5.0) -> None:
+        """
+        Initialises a queue of stage tasks in a SQLite file that the coordinator and the workers of every node open on
+        shared storage. A worker leases a task for a number of seconds and keeps the lease alive with heartbeats while
+        it runs the stage; a task whose lease runs out, because its worker crashed or lost its node, goes back to the
+        queue. Each task records the attributes its stage set, and the task of the next stage of the video only becomes
+        ready once the task it depends on is done, so any worker can pick it up with the paths it needs.
+
+        Parameters:
+            path: the path of the SQLite file.
+            wal: whether the file is put in write-ahead log mode, faster but only safe when all the workers run on
+                 the machine that holds the file, as it relies on shared memory.
+            max_attempts: the number of times a task is run before it is recorded as failed.
+            retry_seconds: the number of seconds a failed task waits before its next attempt, doubled at every attempt.
+
+        Returns:
+            None
+        """
+        self.path:str = path
+        self.wal:bool = wal
+        self.max_attempts:int = max_attempts
+        self.retry_seconds:float = retry_seconds
+        self.lock = threading.Lock()
+        #the transactions are opened by hand, so that a lease reads and takes a task in one locked step.
+        self.database = ProcessConnection(path, ['CREATE TABLE IF NOT EXISTS videos (video_key TEXT PRIMARY KEY, url TEXT, outputs TEXT)',
+                                                 'CREATE TABLE IF NOT EXISTS tasks (task_id INTEGER PRIMARY KEY AUTOINCREMENT, video_key TEXT, stage TEXT, params TEXT, '
+                                                 'status TEXT, depends_on INTEGER, worker TEXT, lease_expires REAL, attempts INTEGER, max_attempts INTEGER, '
+                                                 'available_at REAL, started_at REAL, finished_at REAL, error TEXT, UNIQUE (video_key, stage))',
+                                                 'CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (status, available_at)'],
+                                          wal=wal, timeout=60, autocommit=True)
+
+    def enqueue(self, video:VideoFile, stages:Iterable[str], params:Optional[dict[str,dict[str,Any]]] = None) -> int:
+        """
+        Adds the tasks of the stages of a video, each depending on the task of the stage it reads the outputs of. The
+        tasks already queued for the video are kept, so a coordinator that is started again does not repeat them.
+
+        Parameters:
+            video: the VideoFile object.
+            stages: the names of the stages, in the order of UPSTREAM.
+            params [optional]: the parameters of the stages, by stage name.
+
+        Returns:
+            the number of tasks added.
+        """
+        stages = list(stages)
+        key = video.video_id if video.video_id != None else video.url.strip()
+        added = 0
+        with self.lock:
+            connection = self.connect()
+            with Transaction(connection):
+                connection.execute('INSERT OR IGNORE INTO videos (video_key, url, outputs) VALUES (?, ?, ?)', (key, video.url.strip(), '{}'))
+                task_ids:dict[str,int] = {}
+                for stage in stages:
+                    upstream = UPSTREAM[stage]
+                    while(upstream != None and upstream not in stages):
+                        upstream = UPSTREAM[upstream]
+                    cursor = connection.execute('INSERT OR IGNORE INTO tasks (video_key, stage, params, status, depends_on, attempts, max_attempts, available_at) '
+                                                'VALUES (?, ?, ?, ?, ?, 0, ?, 0)',
+                                                (key, stage, json.dumps((params or {}).get(stage, {})), PENDING, task_ids.get(upstream), self.max_attempts))
+                    added += cursor.rowcount
+                    task_ids[stage] = connection.execute('SELECT task_id FROM tasks WHERE video_key = ? AND stage = ?', (key, stage)).fetchone()[0]
+        return added
+
+    def lease(self, worker:str, lease_seconds:float) -> Optional[StageTask]:
+        """
+        Takes the oldest ready task for a worker, first returning to the queue the tasks whose lease ran out.
+
+        Parameters:
+            worker: the name of the worker.
+            lease_seconds: the number of seconds the task is leased for, unless the lease is extended by a heartbeat.
+
+        Returns:
+            the task, with the id of the task as its index, or None if no task is ready.
+        """
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            with Transaction(connection):
+                expired = connection.execute('SELECT task_id, attempts, max_attempts, worker FROM tasks WHERE status = ? AND lease_expires < ?', (LEASED, now)).fetchall()
+                for task_id, attempts, max_attempts, owner in expired:
+                    print(f"DISTRIBUTED :: lease of task {task_id} held by {owner} expired")
+                    self.settle(connection, task_id, attempts, max_attempts, f'the lease held by {owner} expired', now)
+
+                row = connection.execute('SELECT tasks.task_id, tasks.stage, tasks.params, videos.url, videos.outputs FROM tasks JOIN videos ON videos.video_key = tasks.video_key '
+                                         'WHERE tasks.status = ? AND tasks.available_at <= ? AND (tasks.depends_on IS NULL OR '
+                                         '(SELECT upstream.status FROM tasks AS upstream WHERE upstream.task_id = tasks.depends_on) = ?) '
+                                         'ORDER BY tasks.task_id LIMIT 1', (PENDING, now, DONE)).fetchone()
+                if(row == None):
+                    return None
+                task_id, stage, params, url, outputs = row
+                connection.execute('UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, started_at = ? WHERE task_id = ?',
+                                   (LEASED, worker, now + lease_seconds, now, task_id))
+
+        values = decode_outputs(outputs)
+        values['url'] = url
+        return StageTask(task_id, stage, {name: values.get(name) for name in STAGE_INPUTS[stage]}, json.loads(params))
+
+    def heartbeat(self, task_id:int, worker:str, lease_seconds:float) -> bool:
+        """
+        Extends the lease of a task that the worker is still running.
+
+        Parameters:
+            task_id: the id of the task.
+            worker: the name of the worker.
+            lease_seconds: the number of seconds the lease is extended for, from now.
+
+        Returns:
+            whether the worker still holds the lease.
+        """
+        with self.lock:
+            connection = self.connect()
+            with Transaction(connection):
+                cursor = connection.execute('UPDATE tasks SET lease_expires = ? WHERE task_id = ? AND worker = ? AND status = ?',
+                                            (time.time() + lease_seconds, task_id, worker, LEASED))
+        return cursor.rowcount == 1
+
+    def complete(self, task_id:int, worker:str, updates:dict[str,Any]) -> bool:
+        """
+        Records that a task completed and merges the attributes its stage set into the outputs of its video, ready for
+        the tasks that depend on it.
+
+        Parameters:
+            task_id: the id of the task.
+            worker: the name of the worker.
+            updates: the attributes set by the stage, by name.
+
+        Returns:
+            whether the result was recorded, False if the lease had run out and the task went to another worker.
+        """
+        with self.lock:
+            connection = self.connect()
+            with Transaction(connection):
+                row = connection.execute('SELECT video_key FROM tasks WHERE task_id = ? AND worker = ? AND status = ?', (task_id, worker, LEASED)).fetchone()
+                if(row == None):
+                    return False
+                outputs = decode_outputs(connection.execute('SELECT outputs FROM videos WHERE video_key = ?', (row[0],)).fetchone()[0])
+                for name, value in decode_outputs(encode_outputs(updates)).items():
+                    #the translations of several languages are merged, as VideoFile.apply_result does.
+                    if(name == 'translated_text_paths'):
+                        outputs[name] = {**outputs.get(name, {}), **value}
+                    else:
+                        outputs[name] = value
+                connection.execute('UPDATE videos SET outputs = ? WHERE video_key = ?', (encode_outputs(outputs), row[0]))
+                connection.execute('UPDATE tasks SET status = ?, error = NULL, finished_at = ? WHERE task_id = ?', (DONE, time.time(), task_id))
+        return True
+
+    def fail(self, task_id:int, worker:str, error:str) -> bool:
+        """
+        Records that an attempt of a task failed, queueing the task again after a delay if it has attempts left.
+
+        Parameters:
+            task_id: the id of the task.
+            worker: the name of the worker.
+            error: the error of the attempt.
+
+        Returns:
+            whether the failure was recorded, False if the lease had run out and the task went to another worker.
+        """
+        with self.lock:
+            connection = self.connect()
+            with Transaction(connection):
+                row = connection.execute('SELECT attempts, max_attempts FROM tasks WHERE task_id = ? AND worker = ? AND status = ?', (task_id, worker, LEASED)).fetchone()
+                if(row == None):
+                    return False
+                self.settle(connection, task_id, row[0], row[1], error, time.time())
+        return True
+
+    def is_finished(self) -> bool:
+        """
+        Returns whether no task is waiting or running.
+
+        Parameters:
+            None
+
+        Returns:
+            True if every task is done, failed or blocked.
+        """
+        with self.lock:
+            return self.connect().execute('SELECT COUNT(*) FROM tasks WHERE status IN (?, ?)', (PENDING, LEASED)).fetchone()[0] == 0
+
+    def summary(self) -> dict[str,dict[str,int]]:
+        """
+        Counts the tasks in each status for each stage.
+
+        Parameters:
+            None
+
+        Returns:
+            the number of tasks of each status, by stage name.
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT stage, status, COUNT(*) FROM tasks GROUP BY stage, status').fetchall()
+        summary:dict[str,dict[str,int]] = {}
+        for stage, status, count in rows:
+            summary.setdefault(stage, {})[status] = count
+        return summary
+
+    def worker_summary(self) -> dict[str,int]:
+        """
+        Counts the tasks completed by each worker, to see how the work was spread over the nodes.
+
+        Parameters:
+            None
+
+        Returns:
+            the number of completed tasks, by worker name.
+        """
+        with self.lock:
+            return dict(self.connect().execute('SELECT worker, COUNT(*) FROM tasks WHERE status = ? GROUP BY worker ORDER BY worker', (DONE,)).fetchall())
+
+    def failures(self) -> list[tuple[str,str,str]]:
+        """
+        Returns the tasks that failed after their last attempt.
+
+        Parameters:
+            None
+
+        Returns:
+            the URL of the video, the name of the stage and the error of each failure.
+        """
+        with self.lock:
+            return self.connect().execute('SELECT videos.url, tasks.stage, tasks.error FROM tasks JOIN videos ON videos.video_key = tasks.video_key '
+                                          'WHERE tasks.status = ? ORDER BY tasks.task_id', (FAILED,)).fetchall()
+
+    def restore(self, video:VideoFile) -> None:
+        """
+        Sets on a video the attributes recorded by its completed tasks, for the coordinator to collect the results.
+
+        Parameters:
+            video: the VideoFile object.
+
+        Returns:
+            None
+        """
+        key = video.video_id if video.video_id != None else video.url.strip()
+        with self.lock:
+            row = self.connect().execute('SELECT outputs FROM videos WHERE video_key = ?', (key,)).fetchone()
+        if(row != None):
+            video.apply_result(decode_outputs(row[0]))
+
+    def reset(self) -> None:
+        """
+        Empties the queue, for a batch that starts from scratch.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self.lock:
+            connection = self.connect()
+            with Transaction(connection):
+                connection.execute('DELETE FROM tasks')
+                connection.execute('DELETE FROM videos')
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+    def settle(self, connection:sqlite3.Connection, task_id:int, attempts:int, max_attempts:int, error:str, now:float) -> None:
+        #a task with attempts left waits before it is tried again, the last failure blocks the tasks that depend on it.
+        if(attempts < max_attempts):
+            connection.execute('UPDATE tasks SET status = ?, worker = NULL, error = ?, available_at = ? WHERE task_id = ?',
+                               (PENDING, error, now + self.retry_seconds * 2**(attempts - 1), task_id))
+            return
+        connection.execute('UPDATE tasks SET status = ?, error = ?, finished_at = ? WHERE task_id = ?', (FAILED, error, now, task_id))
+        connection.execute('WITH RECURSIVE downstream(task_id) AS (SELECT task_id FROM tasks WHERE depends_on = ? '
+                           'UNION SELECT tasks.task_id FROM tasks JOIN downstream ON tasks.depends_on = downstream.task_id) '
+                           'UPDATE tasks SET status = ?, error = ? WHERE task_id IN (SELECT task_id FROM downstream)',
+                           (task_id, BLOCKED, f'task {task_id} failed'))
+
+    def connect(self) -> sqlite3.Connection:
+        return self.database.get()
+
+class Transaction:
+
+    def __init__(self, connection:sqlite3.Connection) -> None:
+        self.connection:sqlite3.Connection = connection
+
+    def __enter__(self) -> None:
+        #the write lock is taken at the start, so two workers never read the same ready task.
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, *exc) -> None:
+        self.connection.execute('COMMIT' if exc_type == None else 'ROLLBACK')
+
+class LeaseHeartbeat:
+
+    def __init__(self, queue:TaskQueue, task_id:int, worker:str, lease_seconds:float) -> None:
+        """
+        Initialises a thread that extends the lease of a task three times per lease period while the stage runs, so a
+        long transcription keeps its lease and a worker that dies loses it within one period.
+
+        Parameters:
+            queue: the task queue.
+            task_id: the id of the task.
+            worker: the name of the worker.
+            lease_seconds: the number of seconds of each lease.
+
+        Returns:
+            None
+        """
+        self.queue:TaskQueue = queue
+        self.task_id:int = task_id
+        self.worker:str = worker
+        self.lease_seconds:float = lease_seconds
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.beat, daemon=True)
+
+    def __enter__(self) -> 'LeaseHeartbeat':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop.set()
+        self.thread.join()
+
+    def beat(self) -> None:
+        while(not self.stop.wait(self.lease_seconds / 3)):
+            try:
+                if(not self.queue.heartbeat(self.task_id, self.worker, self.lease_seconds)):
+                    print(f"DISTRIBUTED :: {self.worker} lost the lease of task {self.task_id}")
+                    return
+            except sqlite3.Error as e:
+                #a busy or briefly unreachable queue is retried at the next beat, the lease has time left.
+                print(f"DISTRIBUTED :: heartbeat of task {self.task_id} failed: {e}")
+
+# <-------------------------------- Coordinator ------------------------------->
+
+def enqueue_videos(queue:TaskQueue, videos:Iterable[VideoFile], data_folder:str, stages:Iterable[str] = DEFAULT_STAGES, lang_from:str = 'en',
+                   lang_to:str = 'es', lang_name:str = 'Spanish') -> int:
+    """
+    Adds the tasks of every stage of every video to the queue, with the parameters the stages are run with.
+
+    Parameters:
+        queue: the task queue.
+        videos: the VideoFile objects to be processed.
+        data_folder: the folder on shared storage where all videos are to be downloaded.
+        stages: the names of the stages to be run.
+        lang_from: The original language of the text.
+        lang_to: The language to translate the text into.
+        lang_name: The name in English of the language that the text is to be translated into.
+
+    Returns:
+        the number of tasks added.
+    """
+    stages = [stage for stage in UPSTREAM if stage in set(stages)]
+    params = {
+        'download': {'data_folder': data_folder},
+        'extract_audio': {'audio_only': True},
+        'translate': {'lang_from': lang_from, 'lang_to': lang_to, 'lang_to_name': lang_name},
+    }
+    return sum(queue.enqueue(video, stages, params) for video in videos)
+
+def wait_for_queue(queue:TaskQueue, poll_seconds:float = 2.0) -> dict[str,dict[str,int]]:
+    """
+    Waits until every task of the queue is done, failed or blocked, printing the progress when it changes.
+
+    Parameters:
+        queue: the task queue.
+        poll_seconds: the number of seconds between two looks at the queue.
+
+    Returns:
+        the number of tasks of each status, by stage name.
+    """
+    last = None
+    while(True):
+        summary = queue.summary()
+        counts = {status: sum(statuses.get(status, 0) for statuses in summary.values()) for status in (PENDING, LEASED, DONE, FAILED, BLOCKED)}
+        if(counts != last):
+            print(f"DISTRIBUTED :: {counts[DONE]} done, {counts[LEASED]} running, {counts[PENDING]} pending, {counts[FAILED]} failed, {counts[BLOCKED]} blocked")
+            last = counts
+        if(counts[PENDING] + counts[LEASED] == 0):
+            return summary
+        time.sleep(poll_seconds)
+
+# <-------------------------------- Workers ------------------------------->
+
+def run_worker(queue_path:str, worker:Optional[str] = None, lease_seconds:float = 60.0, poll_seconds:float = 1.0, exit_when_finished:bool = True,
+               metrics_folder:Optional[str] = None) -> int:
+    """
+    Leases the tasks of the queue one at a time and runs their stages, writing the outputs under the data folder of
+    the download task and reporting the attributes each stage set, until the queue is finished.
+
+    Parameters:
+        queue_path: the path of the SQLite file of the queue.
+        worker [optional]: the name of the worker, the host name and the process id by default.
+        lease_seconds: the number of seconds of each lease.
+        poll_seconds: the number of seconds to wait when no task is ready.
+        exit_when_finished: whether the worker stops once no task is waiting or running, or keeps waiting for new ones.
+        metrics_folder [optional]: the folder the metrics of the worker are written to when it stops, as metrics-<worker>.json.
+
+    Returns:
+        the number of tasks completed by the worker.
+    """
+    queue = TaskQueue(queue_path)
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    completed = 0
+    while(True):
+        task = queue.lease(worker, lease_seconds)
+        if(task == None):
+            if(exit_when_finished and queue.is_finished()):
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        with LeaseHeartbeat(queue, task.index, worker, lease_seconds):
+            result = stage_tasks.run_stage_task(task)
+
+        #the errors of the VideoFile methods come back in the result, the check of the output only guards against a
+        #stage that returns without producing it.
+        succeeded = result.error == None and result.updates.get(STAGE_PRODUCES[task.stage]) != None
+        metrics.observe_remote_stage(task.stage, result.duration, succeeded)
+        if(succeeded):
+            if(queue.complete(task.index, worker, result.updates)):
+                completed += 1
+                print(f"SUCCESSFUL - {worker} ran {task.stage} of {task.inputs['url']} in {round(result.duration,2)} second(s)")
+        else:
+            error = f'{type(result.error).__name__}: {result.error}' if result.error != None else 'the stage did not produce its output'
+            queue.fail(task.index, worker, error)
+            print(f"UNSUCCESSFUL - {worker} ran {task.stage} of {task.inputs['url']}: {error}")
+
+    if(metrics_folder != None):
+        os.makedirs(metrics_folder, exist_ok=True)
+        metrics.registry.write_json(os.path.join(metrics_folder, f"metrics-{worker.replace(':', '-')}.json"))
+    return completed
+
+def run_local_workers(queue_path:str, processes:int, lease_seconds:float = 60.0, poll_seconds:float = 1.0, metrics_folder:Optional[str] = None) -> None:
+    """
+    Runs worker processes on this machine until the queue is finished, the way several nodes would share it.
+
+    Parameters:
+        queue_path: the path of the SQLite file of the queue.
+        processes: the number of worker processes.
+        lease_seconds: the number of seconds of each lease.
+        poll_seconds: the number of seconds to wait when no task is ready.
+        metrics_folder [optional]: the folder each worker writes its metrics to, as run_worker does.
+
+    Returns:
+        None
+    """
+    workers = [multiprocessing.Process(target=run_worker, args=(queue_path, f'{socket.gethostname()}:worker-{index}', lease_seconds, poll_seconds, True, metrics_folder))
+               for index in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def configure_services(fake_services:bool, work_folder:str, latency:float) -> Optional[Any]:
+    """
+    Configures the transcriber and translator of this process as main.py does, or points the downloads, transcriptions
+    and translations at the local stand-ins of backends.py to try the queue on one machine without the network.
+
+    Parameters:
+        fake_services: whether the stand-in services are used.
+        work_folder: the folder of the fixture video of the stand-in video server.
+        latency: the number of seconds each call of a stand-in service takes.
+
+    Returns:
+        the started stand-in video server, to be stopped by the caller, or None.
+    """
+    from transcription import ChunkedTranscriber
+    from translation import TranslationEngine
+
+    if(not fake_services):
+        VideoFile.transcriber = ChunkedTranscriber(chunk_seconds=30, max_workers=4)
+        VideoFile.translator = TranslationEngine(cache_path='.translation_cache.sqlite', max_concurrency=4)
+        return None
+
+    from backends import FaultProfile, FakeRecognizer, FakeTranslationBackend, FakeVideoServer
+    from benchmarks import make_fixture_video
+    VideoFile.transcriber = ChunkedTranscriber(FakeRecognizer(FaultProfile(latency)), chunk_seconds=30, max_workers=4)
+    VideoFile.translator = TranslationEngine(FakeTranslationBackend(FaultProfile(latency)), cache_path=None, max_concurrency=4, retries=0)
+    #the server runs in this process, the worker processes are forked from it and download from it over HTTP.
+    server = FakeVideoServer(make_fixture_video(os.path.join(work_folder, 'fixture.mp4'), 2.0), FaultProfile(latency))
+    server.start()
+    VideoFile.video_source = server
+    return server
+
+def main(argv:Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Runs the stages of CineSense on several nodes that share a SQLite task queue.')
+    parser.add_argument('command', choices=('enqueue', 'worker', 'status', 'local'),
+                        help='enqueue the videos, run a worker node, show the queue, or enqueue and run worker processes on this machine')
+    parser.add_argument('--queue', default='video_data/tasks.sqlite', help='SQLite file of the task queue, on storage shared by all the nodes')
+    parser.add_argument('--urls', default='video_urls.txt', help='file of the URLs to enqueue')
+    parser.add_argument('--data-folder', default='video_data/', help='folder on shared storage the outputs are written to')
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES), help='comma separated stages to run')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes of this node')
+    parser.add_argument('--lease', type=float, default=60.0, help='seconds a task is leased for between two heartbeats')
+    parser.add_argument('--reset', action='store_true', help='empty the queue before enqueueing')
+    parser.add_argument('--wal', action='store_true', help='use write-ahead logging, only when every worker runs on the machine that holds the queue')
+    parser.add_argument('--fake-services', action='store_true', help='use the local stand-ins of backends.py instead of YouTube and the Google services')
+    parser.add_argument('--fake-videos', type=int, default=0, help='with --fake-services, enqueue this many made-up videos instead of the URL file')
+    parser.add_argument('--metrics-folder', default=None, help='folder each worker writes the metrics of its stages to when it stops')
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds each call of a stand-in service takes')
+    args = parser.parse_args(argv)
+
+    stages = [stage for stage in args.stages.split(',') if stage != '']
+    for stage in stages:
+        if(stage not in UPSTREAM):
+            parser.error(f'unknown stage {stage}, expected one of {", ".join(UPSTREAM)}')
+
+    queue = TaskQueue(args.queue, wal=args.wal)
+    if(args.command == 'status'):
+        for stage, statuses in queue.summary().items():
+            print(f"DISTRIBUTED :: {stage}: " + ', '.join(f'{count} {status}' for status, count in sorted(statuses.items())))
+        for url, stage, error in queue.failures():
+            print(f"DISTRIBUTED :: {stage} failed for {url}: {error}")
+        return
+
+    if(args.command in ('enqueue', 'local')):
+        if(args.reset):
+            queue.reset()
+        if(args.fake_videos > 0):
+            videos = (VideoFile(f'https://www.youtube.com/watch?v=node{index:07d}') for index in range(args.fake_videos))
+        else:
+            videos = url_ingestion.ingest_videos(args.urls)
+        print(f"DISTRIBUTED :: {enqueue_videos(queue, videos, args.data_folder, stages)} task(s) enqueued in {args.queue}")
+        if(args.command == 'enqueue'):
+            return
+
+    server = configure_services(args.fake_services, os.path.join(os.path.dirname(args.queue) or '.', 'fixtures'), args.latency)
+    try:
+        start = time.perf_counter()
+        #every process of a node is a worker of its own, with its own leases.
+        if(args.command == 'local' or args.processes > 1):
+            run_local_workers(args.queue, args.processes, args.lease, metrics_folder=args.metrics_folder)
+        else:
+            run_worker(args.queue, lease_seconds=args.lease, metrics_folder=args.metrics_folder)
+        end = time.perf_counter()
+    finally:
+        if(server != None):
+            server.stop()
+            VideoFile.video_source = None
+
+    done = sum(count for worker, count in queue.worker_summary().items())
+    print(f"DISTRIBUTED :: {done} task(s) done, {round(done/(end-start),2)} task(s) per second")
+    print(f"Time took to run the queue with {args.processes} worker process(es): {round(end-start,2)} second(s)")
+    for url, stage, error in queue.failures():
+        print(f"DISTRIBUTED :: {stage} failed for {url}: {error}")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,154 @@
+import numpy as np
+import nlp_models
+from collections import Counter
+from typing import Iterable
+
+# the keys of NRCLex.affect_frequencies, in the order NRCLex creates them. NRCLex initialises 'anticip' and adds the
+# 'anticipation' key of its lexicon after the others when it occurs, which is kept so that the files stay the same.
+NRC_AFFECT_KEYS = ('fear', 'anger', 'anticip', 'trust', 'surprise', 'positive', 'negative', 'sadness', 'disgust', 'joy')
+
+# <-------------------------------- Lexicon Index ------------------------------->
+
+class EmotionIndex:
+
+    def __init__(self, lexicon:dict[str,list[str]]) -> None:
+        """
+        Precomputes the NRC lexicon into a vocabulary of token ids and a matrix with a row per token and a column per
+        emotion, holding how many times the lexicon lists the emotion for the token.
+
+        Parameters:
+            lexicon: the NRC lexicon, mapping each word to its emotions.
+
+        Returns:
+            None
+        """
+        self.emotions:list[str] = sorted({emotion for emotions in lexicon.values() for emotion in emotions})
+        emotion_ids = {emotion: i for i, emotion in enumerate(self.emotions)}
+
+        self.vocabulary:dict[str,int] = {}
+        self.matrix = np.zeros((len(lexicon), len(self.emotions)), dtype=np.uint8)
+        for token_id, (word, emotions) in enumerate(lexicon.items()):
+            self.vocabulary[word] = token_id
+            for emotion in emotions:
+                self.matrix[token_id, emotion_ids[emotion]] += 1
+
+    def token_counts(self, words:Iterable[str]) -> tuple[np.ndarray,np.ndarray]:
+        """
+        Counts the words of a text that are in the lexicon. Each distinct word is looked up once.
+
+        Parameters:
+            words: the words of the text.
+
+        Returns:
+            the token ids of the distinct lexicon words and the number of times each of them occurs.
+        """
+        ids = []
+        counts = []
+        for word, count in Counter(words).items():
+            token_id = self.vocabulary.get(word)
+            if(token_id != None):
+                ids.append(token_id)
+                counts.append(count)
+        return np.array(ids, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+    def emotion_counts(self, word_lists:list[Iterable[str]]) -> np.ndarray:
+        """
+        Counts the emotions of many texts with one vectorized sum over their token ids.
+
+        Parameters:
+            word_lists: the words of each text.
+
+        Returns:
+            a matrix with a row per text and a column per emotion of self.emotions.
+        """
+        doc_ids = []
+        token_ids = []
+        token_counts = []
+        for doc_id, words in enumerate(word_lists):
+            ids, counts = self.token_counts(words)
+            doc_ids.append(np.full(len(ids), doc_id, dtype=np.int64))
+            token_ids.append(ids)
+            token_counts.append(counts)
+
+        result = np.zeros((len(doc_ids), len(self.emotions)), dtype=np.int64)
+        if(len(doc_ids) == 0):
+            return result
+
+        doc_ids = np.concatenate(doc_ids)
+        weighted_rows = self.matrix[np.concatenate(token_ids)].astype(np.int64) * np.concatenate(token_counts)[:, None]
+        np.add.at(result, doc_ids, weighted_rows)
+        return result
+
+    def to_affect_frequencies(self, counts:np.ndarray) -> dict[str,float]:
+        """
+        Turns the emotion counts of a text into the dictionary of NRCLex.affect_frequencies.
+
+        Parameters:
+            counts: the count of each emotion of self.emotions in the text.
+
+        Returns:
+            the frequency of each emotion among the emotions of the text.
+        """
+        total = int(counts.sum())
+        frequencies = {key: 0.0 for key in NRC_AFFECT_KEYS}
+        if(total == 0):
+            return frequencies
+
+        #emotions that are not keys of NRC_AFFECT_KEYS are only added when they occur, after the others, like NRCLex does.
+        for i, emotion in enumerate(self.emotions):
+            if(counts[i] > 0):
+                frequencies[emotion] = float(counts[i]) / float(total)
+        return frequencies
+
+# <-------------------------------- Scoring Functions ------------------------------->
+
+def get_emotion_index() -> EmotionIndex:
+    """
+    Returns the emotion index of the process, building it from the NRC lexicon on first use.
+
+    Parameters:
+        None
+
+    Returns:
+        the EmotionIndex.
+    """
+    return nlp_models.get_model('nrc_index')
+
+def affect_frequencies(words:Iterable[str]) -> dict[str,float]:
+    """
+    Computes the NRC affect frequencies of already tokenized words, giving the same dictionary as
+    NRCLex(text).affect_frequencies for the words of TextBlob(text).
+
+    Parameters:
+        words: the words of the text, as tokenized by TextBlob.
+
+    Returns:
+        the frequency of each emotion among the emotions of the words.
+    """
+    return affect_frequencies_batch([words])[0]
+
+def affect_frequencies_batch(word_lists:list[Iterable[str]]) -> list[dict[str,float]]:
+    """
+    Computes the NRC affect frequencies of many tokenized texts at once.
+
+    Parameters:
+        word_lists: the words of each text, as tokenized by TextBlob.
+
+    Returns:
+        the affect frequencies of each text, in the order of the texts.
+    """
+    index = get_emotion_index()
+    counts = index.emotion_counts(word_lists)
+    return [index.to_affect_frequencies(row) for row in counts]
+
+def score_texts(texts:list[str]) -> list[dict[str,float]]:
+    """
+    Computes the NRC affect frequencies of many raw texts, tokenizing them with TextBlob like NRCLex does.
+
+    Parameters:
+        texts: the texts to be scored.
+
+    Returns:
+        the affect frequencies of each text, in the order of the texts.
+    """
+    return affect_frequencies_batch([nlp_models.text_blob(text).words for text in texts])
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import nlp_models
+from stage_tasks import STAGE_OUTPUTS
+from sqlite_connection import ProcessConnection
+from typing import Any, Optional
+
+# the states of a stage of a video, a stage left RUNNING by a crashed run is run again
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# the transcript itself is kept in its text file, only its path is recorded
+UNRECORDED_OUTPUTS = {'subtitles'}
+
+# <-------------------------------- Job Manifest ------------------------------->
+
+class JobManifest:
+
+    def __init__(self, path:str) -> None:
+        """
+        Initialises a durable record of a batch run in a SQLite file: every video of the batch, and for each of its
+        stages the status, the attributes the stage set (the paths of its outputs, the sentiment and the emotions) and
+        the error of its last failure. Each update is committed as the stage finishes, so a run that crashes can be
+        resumed from the manifest without repeating the stages that were done.
+
+        Parameters:
+            path: the path of the SQLite file.
+
+        Returns:
+            None
+        """
+        self.path:str = path
+        self.lock = threading.Lock()
+        self.database = ProcessConnection(path, ['CREATE TABLE IF NOT EXISTS videos (video_key TEXT PRIMARY KEY, url TEXT, registered_at REAL)',
+                                                 'CREATE TABLE IF NOT EXISTS stages (video_key TEXT, stage TEXT, status TEXT, artifacts TEXT, error TEXT, '
+                                                 'attempts INTEGER, updated_at REAL, PRIMARY KEY (video_key, stage))'], wal=True)
+
+    def key(self, video:Any) -> str:
+        #the id of a YouTube video stays the same across the URL forms, other videos are known by their URL.
+        return video.video_id if video.video_id != None else video.url.strip()
+
+    def register(self, video:Any) -> None:
+        """
+        Adds a video to the batch, keeping its record if it is already there.
+
+        Parameters:
+            video: the VideoFile object.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT OR IGNORE INTO videos (video_key, url, registered_at) VALUES (?, ?, ?)', (self.key(video), video.url.strip(), time.time()))
+
+    def start_stage(self, video:Any, stage:str) -> None:
+        """
+        Records that a stage started on a video.
+
+        Parameters:
+            video: the VideoFile object.
+            stage: the name of the stage.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT INTO stages (video_key, stage, status, attempts, updated_at) VALUES (?, ?, ?, 1, ?) '
+                                   'ON CONFLICT (video_key, stage) DO UPDATE SET status = excluded.status, attempts = attempts + 1, updated_at = excluded.updated_at',
+                                   (self.key(video), stage, RUNNING, time.time()))
+
+    def finish_stage(self, video:Any, stage:str) -> None:
+        """
+        Records that a stage completed on a video, with the attributes it set.
+
+        Parameters:
+            video: the VideoFile object.
+            stage: the name of the stage.
+
+        Returns:
+            None
+        """
+        outputs = {name: getattr(video, name) for name in STAGE_OUTPUTS.get(stage, ())}
+        self.update_stage(video, stage, DONE, encode_outputs(outputs), None)
+
+    def fail_stage(self, video:Any, stage:str, error:Optional[BaseException]) -> None:
+        """
+        Records that a stage failed on a video.
+
+        Parameters:
+            video: the VideoFile object.
+            stage: the name of the stage.
+            error [optional]: the exception of the stage, None if the stage returned without producing its output.
+
+        Returns:
+            None
+        """
+        message = f'{type(error).__name__}: {error}' if error != None else 'the stage did not produce its output'
+        self.update_stage(video, stage, FAILED, None, message)
+
+    def statuses(self, video:Any) -> dict[str,str]:
+        """
+        Returns the status of each recorded stage of a video.
+
+        Parameters:
+            video: the VideoFile object.
+
+        Returns:
+            the status, by stage name.
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT stage, status FROM stages WHERE video_key = ?', (self.key(video),)).fetchall()
+        return dict(rows)
+
+    def restore(self, video:Any) -> dict[str,str]:
+        """
+        Sets on a video the attributes recorded by its completed stages, so the following stages find their inputs.
+
+        Parameters:
+            video: the VideoFile object.
+
+        Returns:
+            the status of each recorded stage of the video, by stage name.
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT stage, status, artifacts FROM stages WHERE video_key = ?', (self.key(video),)).fetchall()
+
+        #the download is applied first, the later stages build their paths on its folder.
+        for stage, status, artifacts in sorted(rows, key=lambda row: list(STAGE_OUTPUTS).index(row[0]) if row[0] in STAGE_OUTPUTS else len(STAGE_OUTPUTS)):
+            if(status != DONE or artifacts == None):
+                continue
+            video.apply_result(decode_outputs(artifacts))
+        return {stage: status for stage, status, _ in rows}
+
+    def summary(self) -> dict[str,dict[str,int]]:
+        """
+        Counts the videos in each status for each stage.
+
+        Parameters:
+            None
+
+        Returns:
+            the number of videos of each status, by stage name.
+        """
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute('SELECT stage, status, COUNT(*) FROM stages GROUP BY stage, status').fetchall()
+            total = connection.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+        summary = {'videos': {'registered': total}}
+        for stage, status, count in rows:
+            summary.setdefault(stage, {})[status] = count
+        return summary
+
+    def failures(self) -> list[tuple[str,str,str]]:
+        """
+        Returns the stages that failed.
+
+        Parameters:
+            None
+
+        Returns:
+            the URL of the video, the name of the stage and the error of each failure.
+        """
+        with self.lock:
+            return self.connect().execute('SELECT videos.url, stages.stage, stages.error FROM stages JOIN videos ON videos.video_key = stages.video_key '
+                                          'WHERE stages.status = ? ORDER BY videos.registered_at', (FAILED,)).fetchall()
+
+    def reset(self) -> None:
+        """
+        Forgets the previous run, for a batch that starts from scratch.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('DELETE FROM stages')
+                connection.execute('DELETE FROM videos')
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+    def update_stage(self, video:Any, stage:str, status:str, artifacts:Optional[str], error:Optional[str]) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT INTO stages (video_key, stage, status, artifacts, error, attempts, updated_at) VALUES (?, ?, ?, ?, ?, 1, ?) '
+                                   'ON CONFLICT (video_key, stage) DO UPDATE SET status = excluded.status, artifacts = excluded.artifacts, '
+                                   'error = excluded.error, updated_at = excluded.updated_at',
+                                   (self.key(video), stage, status, artifacts, error, time.time()))
+
+    def connect(self) -> sqlite3.Connection:
+        return self.database.get()
+
+def encode_outputs(outputs:dict[str,Any]) -> str:
+    """
+    Encodes the attributes set by a stage as JSON, leaving out the empty ones and the transcript itself.
+
+    Parameters:
+        outputs: the attributes, by name.
+
+    Returns:
+        the JSON text.
+    """
+    encoded = {}
+    for name, value in outputs.items():
+        if(name in UNRECORDED_OUTPUTS or value is None):
+            continue
+        #the sentiment is a named tuple, it is stored as its polarity and subjectivity.
+        encoded[name] = [value.polarity, value.subjectivity] if name == 'sentiment' else value
+    return json.dumps(encoded)
+
+def decode_outputs(text:str) -> dict[str,Any]:
+    """
+    Decodes the attributes encoded by encode_outputs, ready for VideoFile.apply_result.
+
+    Parameters:
+        text: the JSON text.
+
+    Returns:
+        the attributes, by name.
+    """
+    outputs = json.loads(text)
+    if('sentiment' in outputs):
+        outputs['sentiment'] = nlp_models.sentiment_result(*outputs['sentiment'])
+    return outputs
@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import multiprocessing
+import numpy as np
+from VideoFile import VideoFile
+from transcription import ChunkedTranscriber
+from translation import TranslationEngine
+from backends import FaultProfile, FakeRecognizer, FakeTranslationBackend, FakeVideoServer
+from benchmarks import make_fixture_video, ResourceSampler, cpu_seconds, comma_separated
+import audio_extraction
+import adaptive_concurrency
+import artifact_store
+import threads_executions
+import process_executions
+import concurrent_executions
+from typing import Callable, Optional
+
+STAGES = ('download', 'transcribe', 'translate')
+BACKENDS = ('threads', 'processes', 'concurrent', 'async')
+
+LANG_FROM, LANG_TO, LANG_NAME = 'en', 'es', 'Spanish'
+
+# <-------------------------------- Load Test Corpus ------------------------------->
+
+def make_videos(stage:str, count:int, run_folder:str, audio_path:str) -> list[VideoFile]:
+    """
+    Builds the videos of a run with the inputs of the stage under test: only a URL for the downloads, a shared short
+    .wav file for the transcriptions and a transcript of its own for each translation, so that the translation engine
+    cannot deduplicate the requests of different videos.
+
+    Parameters:
+        stage: the name of the stage under test.
+        count: the number of videos.
+        run_folder: the folder the outputs of the run are written to.
+        audio_path: the path of the fixture audio.
+
+    Returns:
+        the array of VideoFile objects.
+    """
+    videos = []
+    for index in range(count):
+        video = VideoFile(f'https://www.youtube.com/watch?v=load{index:07d}')
+        if(stage != 'download'):
+            video.title = f'Load video {index}'
+            video.filename = f'load_{index}'
+            video.folder_name = os.path.join(run_folder, video.filename)
+            os.makedirs(video.folder_name, exist_ok=True)
+            video.audio_path = audio_path
+        if(stage == 'translate'):
+            video.text_path = os.path.join(video.folder_name, video.filename+'.txt')
+            with open(video.text_path, 'w') as text_file:
+                text_file.write(f'This is the transcript of the load test video number {index}. It is translated by the stand-in service.')
+        videos.append(video)
+    return videos
+
+def stage_runner(stage:str, backend:str, data_folder:str, server:FakeVideoServer) -> Callable[[list[VideoFile],Optional[int]],list]:
+    """
+    Returns the function of a backend that runs a stage over the videos with a number of workers.
+
+    Parameters:
+        stage: the name of the stage.
+        backend: the name of the backend, async only downloads.
+        data_folder: the folder the videos are downloaded to.
+        server: the stand-in video server, the video source of the async downloader.
+
+    Returns:
+        the function, called with the videos and the number of workers (None for the adaptive thread limiter).
+    """
+    if(backend == 'async'):
+        import async_executions
+        return lambda videos, workers: async_executions.parallel_video_downloader(videos, data_folder, max_concurrency=workers or 32, resolver=server)
+
+    module = {'threads': threads_executions, 'processes': process_executions, 'concurrent': concurrent_executions}[backend]
+    if(stage == 'download'):
+        return lambda videos, workers: module.parallel_video_downloader(videos, data_folder, max_no_of_threads=workers)
+    if(stage == 'transcribe'):
+        return lambda videos, workers: module.parallel_audio_transcriber(videos, max_no_of_threads=workers)
+    return lambda videos, workers: module.parallel_text_translator(videos, LANG_FROM, LANG_TO, LANG_NAME, max_no_of_threads=workers)
+
+# <-------------------------------- Load Test ------------------------------->
+
+def run_load(stage:str, backend:str, workers:Optional[int], count:int, work_folder:str, audio_path:str, server:FakeVideoServer) -> dict:
+    """
+    Runs a stage over a corpus of videos with a backend against the stand-in services and measures it.
+
+    Parameters:
+        stage: the name of the stage.
+        backend: the name of the backend.
+        workers [optional]: the number of workers, None lets the thread backend tune it with its adaptive limiter.
+        count: the number of videos.
+        work_folder: the folder of the fixtures and of the outputs of the run.
+        audio_path: the path of the fixture audio.
+        server: the stand-in video server.
+
+    Returns:
+        the result of the run: wall time, throughput, failures, throttled calls, CPU utilisation and peak memory.
+    """
+    run_folder = os.path.join(work_folder, 'run')
+    shutil.rmtree(run_folder, ignore_errors=True)
+    videos = make_videos(stage, count, run_folder, audio_path)
+
+    run = stage_runner(stage, backend, run_folder+'/', server)
+    start_cpu = cpu_seconds()
+    start = time.perf_counter()
+    with ResourceSampler() as sampler:
+        results = run(videos, workers)
+    wall = time.perf_counter() - start
+    cpu = cpu_seconds() - start_cpu
+    threads_executions.shutdown_shared_executors()
+    #the folder of the run is removed, and its artifact index with it, the next run starts a store of its own.
+    artifact_store.release_store(run_folder+'/')
+
+    #the thread and process backends return a TaskResult per video, the async downloader an exception per video.
+    errors = [getattr(result, 'error', result) for result in results]
+    failed = sum(1 for error in errors if error != None)
+    throttled = sum(1 for error in errors if error != None and adaptive_concurrency.is_rate_limited(error))
+    shutil.rmtree(run_folder, ignore_errors=True)
+    return {
+        'stage': stage,
+        'backend': backend,
+        'workers': workers if workers != None else 'adaptive',
+        'videos': count,
+        'completed': count - failed,
+        'failed': failed,
+        'throttled': throttled,
+        'wall_seconds': round(wall, 4),
+        'throughput_videos_per_second': round((count - failed) / wall, 4) if wall > 0 else None,
+        'cpu_utilization': round(cpu / (wall * (os.cpu_count() or 1)), 4) if wall > 0 else None,
+        'peak_rss_mb': round(sampler.peak_bytes / 1024**2, 2),
+        'adaptive_limit': adaptive_concurrency.limiter_snapshots() if workers == None else None,
+    }
+
+def run_load_tests(stages:list[str], backends:list[str], workers:list[Optional[int]], corpus_sizes:list[int], work_folder:str, latency:float,
+                   jitter:float, error_rate:float, throttle_rate:float, capacity:Optional[int], seed:int, translator_concurrency:int) -> dict:
+    """
+    Points the download, transcription and translation of VideoFile at local stand-in services with the same latency
+    and faults, and runs every stage under every backend, worker count and corpus size.
+
+    Parameters:
+        stages: the names of the stages to be tested.
+        backends: the names of the backends to be compared.
+        workers: the numbers of workers to be tried, None for the adaptive limiter of the thread backend.
+        corpus_sizes: the numbers of videos to be tried.
+        work_folder: the folder of the fixtures and of the outputs.
+        latency: the number of seconds each call of a service takes.
+        jitter: the largest random change of the latency.
+        error_rate: the share of calls that fail.
+        throttle_rate: the share of calls that are throttled.
+        capacity [optional]: the number of calls a service serves at one time, the others are throttled.
+        seed: the seed of the delays and faults.
+        translator_concurrency: the number of requests the translation engine sends at one time.
+
+    Returns:
+        the settings of the load test and the result of each run.
+    """
+    #the process backends rely on fork to hand the stand-ins to the workers; the video server runs in this process and
+    #is shared by all of them, while each worker process has its own copy of the recognizer and the translator.
+    make_profile = lambda: FaultProfile(latency, jitter, error_rate, throttle_rate, capacity, seed)
+    VideoFile.transcriber = ChunkedTranscriber(FakeRecognizer(make_profile()), chunk_seconds=30, max_workers=4)
+    VideoFile.translator = TranslationEngine(FakeTranslationBackend(make_profile()), cache_path=None, max_concurrency=translator_concurrency, retries=0)
+    VideoFile.cache = None
+    VideoFile.log_path = None
+    VideoFile.transcript_store = None
+
+    fixture_path = make_fixture_video(os.path.join(work_folder, 'fixture.mp4'), 2.0)
+    audio_path = os.path.join(work_folder, 'fixture.wav')
+    samples = (3000*np.sin(2*np.pi*440*np.arange(audio_extraction.RECOGNIZER_SAMPLE_RATE)/audio_extraction.RECOGNIZER_SAMPLE_RATE)).astype(np.int16)
+    audio_extraction.write_wav(audio_path, samples)
+
+    results = []
+    with FakeVideoServer(fixture_path, make_profile()) as server:
+        VideoFile.video_source = server
+        for size in corpus_sizes:
+            for stage in stages:
+                for backend in backends:
+                    if(backend == 'async' and stage != 'download'):
+                        continue
+                    for worker_count in workers:
+                        if(worker_count == None and backend != 'threads'):
+                            continue
+                        print(f'LOAD TEST :: {stage} with {backend} backend, {worker_count or "adaptive"} worker(s), {size} video(s)')
+                        results.append(run_load(stage, backend, worker_count, size, work_folder, audio_path, server))
+        VideoFile.video_source = None
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'start_method': multiprocessing.get_start_method(),
+        },
+        'services': {'latency': latency, 'jitter': jitter, 'error_rate': error_rate, 'throttle_rate': throttle_rate, 'capacity': capacity, 'seed': seed},
+        'results': results,
+    }
+
+def worker_counts(value:str) -> list[Optional[int]]:
+    return [None if item == 'auto' else int(item) for item in value.split(',') if item != '']
+
+def main(argv:Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Load tests the concurrency backends of CineSense against local stand-ins of YouTube, the speech API and the translator.')
+    parser.add_argument('--stages', type=comma_separated(str), default=list(STAGES), help='comma separated stages to test')
+    parser.add_argument('--backends', type=comma_separated(str), default=['threads', 'processes', 'concurrent'], help='comma separated backends to compare')
+    parser.add_argument('--workers', type=worker_counts, default=[8, 32, None], help='comma separated worker counts, auto for the adaptive thread limiter')
+    parser.add_argument('--corpus-sizes', type=comma_separated(int), default=[1000], help='comma separated numbers of videos')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each call of a service takes')
+    parser.add_argument('--jitter', type=float, default=0.02, help='largest random change of the latency, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of the calls that fail with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of the calls that are refused with a 429')
+    parser.add_argument('--capacity', type=int, default=None, help='calls a service serves at one time, the others are refused with a 429')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the delays and faults')
+    parser.add_argument('--translator-concurrency', type=int, default=32, help='requests the translation engine sends at one time')
+    parser.add_argument('--work-folder', default='load_test_data', help='folder of the fixtures and outputs')
+    parser.add_argument('--output', default='load_test_results.json', help='file the results are written to')
+    args = parser.parse_args(argv)
+
+    for stage in args.stages:
+        if(stage not in STAGES):
+            parser.error(f'unknown stage {stage}, expected one of {", ".join(STAGES)}')
+    for backend in args.backends:
+        if(backend not in BACKENDS):
+            parser.error(f'unknown backend {backend}, expected one of {", ".join(BACKENDS)}')
+
+    report = run_load_tests(args.stages, args.backends, args.workers, args.corpus_sizes, args.work_folder, args.latency, args.jitter,
+                            args.error_rate, args.throttle_rate, args.capacity, args.seed, args.translator_concurrency)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f'LOAD TEST :: {len(report["results"])} result(s) written to {args.output}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
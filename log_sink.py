@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import queue
+import functools
+import threading
+import multiprocessing.util
+from typing import Any, Callable, Optional
+
+# marks the end of the records for the writer thread
+_CLOSE = object()
+
+#one sink per process and file, a forked worker gets its own writer thread instead of the parent's.
+_sinks:dict[tuple[int,str],'JsonLinesLogSink'] = {}
+_sinks_lock = threading.Lock()
+
+# <-------------------------------- Log Sink ------------------------------->
+
+class JsonLinesLogSink:
+
+    def __init__(self, path:str, batch_size:int = 256, flush_interval:float = 0.2) -> None:
+        """
+        Initialises a sink that appends JSON Lines records to a file from a writer thread. Logging only puts the record
+        in a queue, so the caller never waits for the file, and the writer appends the queued records in batches.
+
+        Parameters:
+            path: the path of the log file.
+            batch_size: the largest number of records written at a time.
+            flush_interval: the longest time, in seconds, a record waits in the queue before it is written.
+
+        Returns:
+            None
+        """
+        self.path:str = path
+        self.batch_size:int = batch_size
+        self.flush_interval:float = flush_interval
+        self.records:queue.SimpleQueue = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self._write_records, name='log-sink-writer', daemon=True)
+        self.writer.start()
+
+    def log(self, **record:Any) -> None:
+        """
+        Queues a record, adding the time and the ids of the process and thread that logged it.
+
+        Parameters:
+            record: the fields of the record.
+
+        Returns:
+            None
+        """
+        now = time.time()
+        record.setdefault('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)) + f'.{int(now*1000) % 1000:03d}Z')
+        record.setdefault('process_id', os.getpid())
+        record.setdefault('thread_id', threading.get_ident())
+        self.records.put(record)
+
+    def close(self) -> None:
+        """
+        Writes the queued records and stops the writer thread.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        if(self.writer.is_alive()):
+            self.records.put(_CLOSE)
+            self.writer.join()
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+    def _write_records(self) -> None:
+        """
+        Waits for records and appends them to the file in batches. Each batch is written with a single write on a file
+        opened in append mode, so the lines of several processes logging to the same file are not interleaved.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        file_descriptor = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            closing = False
+            while not closing:
+                batch = []
+                try:
+                    batch.append(self.records.get(timeout=self.flush_interval))
+                    while len(batch) < self.batch_size:
+                        batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    pass
+
+                #records queued after a close request are still written before the thread stops.
+                closing = any(record is _CLOSE for record in batch)
+                batch = [record for record in batch if record is not _CLOSE]
+
+                if(len(batch) > 0):
+                    lines = ''.join(json.dumps(record, default=str) + '\n' for record in batch)
+                    os.write(file_descriptor, lines.encode('utf-8'))
+        finally:
+            os.close(file_descriptor)
+
+def get_log_sink(path:str) -> JsonLinesLogSink:
+    """
+    Returns the sink of a log file for the current process, starting it on first use. The sink is closed, writing
+    the remaining records, when the process exits.
+
+    Parameters:
+        path: the path of the log file.
+
+    Returns:
+        the JsonLinesLogSink.
+    """
+    #the same file given by another path shares the sink, so two writer threads never append to one file.
+    key = (os.getpid(), os.path.abspath(path))
+    sink = _sinks.get(key)
+    if(sink == None):
+        with _sinks_lock:
+            sink = _sinks.get(key)
+            if(sink == None):
+                sink = JsonLinesLogSink(path)
+                _sinks[key] = sink
+                #the multiprocessing finalizers also run when pool workers exit, unlike atexit handlers.
+                multiprocessing.util.Finalize(sink, sink.close, exitpriority=10)
+    return sink
+
+def logged_stage(stage:str, output_attribute:str) -> Callable:
+    """
+    A decorator for the VideoFile stage methods that logs the duration, output size and outcome of every call to the
+    log file of the class (VideoFile.log_path), when one is set.
+
+    Parameters:
+        stage: the name of the stage in the records.
+        output_attribute: the attribute of the VideoFile that holds the path of the output of the stage.
+
+    Returns:
+        the decorator.
+    """
+    def decorator(method:Callable) -> Callable:
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            log_path = getattr(type(self), 'log_path', None)
+            if(log_path == None):
+                return method(self, *args, **kwargs)
+
+            start = time.perf_counter()
+            error = None
+            try:
+                return method(self, *args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                output_path = getattr(self, output_attribute, None)
+                output_bytes = os.path.getsize(output_path) if error == None and isinstance(output_path, str) and os.path.exists(output_path) else 0
+                get_log_sink(log_path).log(url=self.url.strip(), stage=stage, duration=round(time.perf_counter()-start, 6),
+                                           bytes=output_bytes, success=error == None, error=None if error == None else str(error))
+
+        return wrapper
+
+    return decorator
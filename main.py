@@ -1,8 +1,19 @@
+import argparse
 from VideoFile import VideoFile
+from transcription import ChunkedTranscriber
+from stage_cache import StageCache
+from translation import TranslationEngine
+from transcript_store import TranscriptStore
+from video_batch import VideoBatch
+from job_manifest import JobManifest
 import serial_executions
 import process_executions
 import threads_executions
 import concurrent_executions
+import pipeline_executions
+import metrics
+import async_executions
+import url_ingestion
 
 
 def read_urls(filepath):
@@ -13,51 +24,89 @@ def read_urls(filepath):
         filepath: the file containing the URLs of youtube videos
     
     Returns:
-        urls: A list of strings containing the URLs
+        urls: A list of strings containing the URLs, without the newlines and blank lines
     """
-    file = open(filepath, "r")
-    urls=[]
-    for line in file:
-        urls.append(line)
-    file.close()
-    return urls
+    return list(url_ingestion.iter_urls(filepath))
 
 
 if __name__=="__main__":
 
+    parser = argparse.ArgumentParser(description='Downloads and analyses the YouTube videos of video_urls.txt.')
+    parser.add_argument('--resume', action='store_true', help='continue the batch recorded in the manifest, skipping the stages that were done')
+    parser.add_argument('--retry-failed', action='store_true', help='run again only the stages that failed in the batch recorded in the manifest')
+    parser.add_argument('--manifest', default='video_data/manifest.sqlite', help='SQLite file that records the status of every stage of every video')
+    args = parser.parse_args()
+
     #----------------- Task 2 ----------------------
-    urls = read_urls('video_urls.txt')
-    videos=[]
-    for url in urls:
-        videos.append(VideoFile(url))
+    #the URLs are read lazily, normalised to their video ids and deduplicated, and each VideoFile is only created when
+    #the pipeline is ready for it. The older tasks below need the whole list: videos = list(url_ingestion.ingest_videos(...))
+    #the set of seen videos is sized from the file, a file of millions of URLs is deduplicated by a Bloom filter of fixed
+    #size that may drop about one new video in a thousand, smaller ones by an exact set
+    videos = url_ingestion.ingest_videos('video_urls.txt')
     
+    #long audios are split at silences into 30 second chunks that are transcribed 4 at a time
+    VideoFile.transcriber = ChunkedTranscriber(chunk_seconds=30, max_workers=4)
+
+    #reruns reuse the outputs of the stages whose inputs have not changed, keeping at most 20 GB of cached outputs
+    VideoFile.cache = StageCache('.stage_cache', max_bytes=20*1024**3)
+
+    #transcripts are translated a sentence at a time, repeated sentences are translated once and kept in a phrase cache
+    VideoFile.translator = TranslationEngine(cache_path='.translation_cache.sqlite', max_concurrency=4)
+
     parallel_data_folder = 'video_data/'
     serial_data_folder = 'serial_video_data/'
 
+    #the transcripts are read by the text subtasks from a shared memory mapped arena instead of their text files
+    VideoFile.transcript_store = TranscriptStore(parallel_data_folder+'transcripts.arena')
+    #a resumed batch keeps the latest transcript of each video, a new one starts from an empty arena.
+    if(args.resume or args.retry_failed):
+        VideoFile.transcript_store.compact()
+    else:
+        VideoFile.transcript_store.reset()
+
+    #the results of every video are collected into one columnar table as the stages complete
+    results = VideoBatch()
+    videos = results.attach(videos)
+
+    #every stage of every video is recorded as it finishes, so a crashed batch is resumed with --resume instead of
+    #being started over, and --retry-failed reruns only the failed stages (with --resume too, the unfinished ones as well).
+    manifest = JobManifest(args.manifest)
+    if(not args.resume and not args.retry_failed):
+        manifest.reset()
+
+    #-------------- Pipeline: every video streams through all the stages ----------------
+    #the silences, music intros and dead air of the audios are dropped before they are sent to the recognizer, the
+    #subtitles are written as the audio is transcribed and the mood of every segment is scored into a timeline
+    pipeline_executions.pipelined_video_processor(videos, parallel_data_folder, 'en', 'es', 'Spanish', manifest=manifest,
+                                                  retry_failed=args.retry_failed, failed_only=args.retry_failed and not args.resume, trim_silence=True,
+                                                  timeline=True)
+    for url, stage, error in manifest.failures():
+        print(f"MANIFEST :: {stage} failed for {url}: {error}")
+    results.save(parallel_data_folder+'results.npz')
+
+    #the timings, bytes and failures of every stage, to find the stage that limits the throughput of the batch
+    metrics.registry.write_json('metrics.json')
+    metrics.registry.write_prometheus('metrics.prom')
+
     #------- Task 3 ----------
-    threads_executions.parallel_video_downloader(videos,parallel_data_folder,5)
+    # threads_executions.parallel_video_downloader(videos,parallel_data_folder,5)
+    # async_executions.parallel_video_downloader(videos,parallel_data_folder,max_concurrency=32,per_host=8)
     # threads_executions.parallel_audio_extractor(videos,1)
 
     # serial_executions.serial_video_downloader(videos,serial_data_folder)
-    serial_executions.serial_audio_extractor(videos)
+    # serial_executions.serial_audio_extractor(videos)
 
     #-------------------- Task 4 ---------------------
     # threads_executions.parallel_video_downloader_and_logger(videos,'download_log.txt',parallel_data_folder)
     
     #-------------- Task 5: Subtasks -----------------
     #comparing threads, processes and concurrent execution for audio transcriber
-    threads_executions.parallel_audio_transcriber(videos)
+    # threads_executions.parallel_audio_transcriber(videos)
     # process_executions.parallel_audio_transcriber(videos)
     # serial_executions.serial_audio_transcriber(videos)
     # concurrent_executions.parallel_audio_transcriber(videos)
 
-    threads_executions.parallel_sentiment_analyser(videos)
-    threads_executions.parallel_text_translator(videos, 'en', 'es', 'Spanish')
-    threads_executions.parallel_emotion_extractor(videos)
-
-
-
-
-
-
-
+    # threads_executions.parallel_sentiment_analyser(videos)
+    # threads_executions.parallel_text_translator(videos, 'en', 'es', 'Spanish')
+    # threads_executions.parallel_multi_language_translator(videos, 'en', {'es': 'Spanish', 'fr': 'French', 'de': 'German'})
+    # threads_executions.parallel_emotion_extractor(videos)
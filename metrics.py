@@ -0,0 +1,459 @@
+import os
+import json
+import time
+import bisect
+import inspect
+import cProfile
+import pstats
+import functools
+import threading
+from artifact_store import atomic_open
+from typing import Any, Callable, Optional
+
+# the upper bounds, in seconds, of the buckets of the latency histograms, from a cached lookup to a long transcription
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+METRIC_PREFIX = 'cinesense'
+
+# <-------------------------------- Metric Types ------------------------------->
+
+class Histogram:
+
+    def __init__(self, buckets:tuple[float,...] = LATENCY_BUCKETS) -> None:
+        """
+        Initialises a histogram that counts the observed values into buckets, like a Prometheus histogram.
+
+        Parameters:
+            buckets: the increasing upper bounds of the buckets, a last bucket without a bound is added.
+
+        Returns:
+            None
+        """
+        self.buckets:tuple[float,...] = tuple(buckets)
+        self.counts:list[int] = [0]*(len(self.buckets)+1)
+        self.sum:float = 0.0
+        self.count:int = 0
+
+    def observe(self, value:float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q:float) -> Optional[float]:
+        """
+        Estimates a quantile of the observed values as the upper bound of the bucket it falls in.
+
+        Parameters:
+            q: the quantile, between 0 and 1.
+
+        Returns:
+            the estimate, infinite if it falls in the last bucket, None if nothing was observed.
+        """
+        if(self.count == 0):
+            return None
+        rank = q*self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if(seen >= rank):
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> dict[str,Any]:
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets.append(['+Inf' if bound == float('inf') else bound, cumulative])
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+# <-------------------------------- Metrics Registry ------------------------------->
+
+class MetricsRegistry:
+
+    def __init__(self) -> None:
+        """
+        Initialises a registry of counters and histograms, each identified by a name and a set of labels. The registry
+        belongs to one process, the workers of the process backends record into registries of their own.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        self.lock = threading.Lock()
+        self.counters:dict[tuple[str,tuple],float] = {}
+        self.histograms:dict[tuple[str,tuple],Histogram] = {}
+        self.profiled_stages:set[str] = set()
+        self.profiles:dict[str,pstats.Stats] = {}
+        #only one profiler can be active in a process at a time, calls that find it busy are not profiled.
+        self.profiler_lock = threading.Lock()
+
+    def inc(self, name:str, value:float = 1, **labels:Any) -> None:
+        """
+        Adds to a counter.
+
+        Parameters:
+            name: the name of the counter.
+            value: the amount added.
+            labels: the labels of the counter.
+
+        Returns:
+            None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name:str, value:float, **labels:Any) -> None:
+        """
+        Records a value in a histogram.
+
+        Parameters:
+            name: the name of the histogram.
+            value: the observed value, in seconds for the latency histograms.
+            labels: the labels of the histogram.
+
+        Returns:
+            None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if(histogram == None):
+                histogram = Histogram()
+                self.histograms[key] = histogram
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.profiles.clear()
+
+    def snapshot(self) -> dict[str,Any]:
+        """
+        Copies the current values of all the metrics.
+
+        Parameters:
+            None
+
+        Returns:
+            the counters and histograms with their labels, and the process and time of the snapshot.
+        """
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self.counters.items())]
+            histograms = [dict({'name': name, 'labels': dict(labels)}, **histogram.to_dict()) for (name, labels), histogram in sorted(self.histograms.items())]
+        return {'process_id': os.getpid(), 'timestamp': time.time(), 'counters': counters, 'histograms': histograms}
+
+    def stage_summary(self) -> dict[str,dict[str,Any]]:
+        """
+        Summarises each stage, to see which one limits the throughput of a batch.
+
+        Parameters:
+            None
+
+        Returns:
+            for each stage, the number of calls and failures, the total and mean run and wait times, the estimated 95th
+            percentile of the run time and the bytes read and written, and the calls, failures and total run time of
+            the stages that ran in worker processes.
+        """
+        summary:dict[str,dict[str,Any]] = {}
+        with self.lock:
+            for (name, labels), histogram in self.histograms.items():
+                labels = dict(labels)
+                if(name not in (f'{METRIC_PREFIX}_stage_run_seconds', f'{METRIC_PREFIX}_stage_wait_seconds', f'{METRIC_PREFIX}_remote_stage_seconds')):
+                    continue
+                stage = summary.setdefault(labels['stage'], {})
+                kind = 'remote' if name.endswith('_remote_stage_seconds') else 'run' if name.endswith('_run_seconds') else 'wait'
+                stage[f'{kind}_seconds_total'] = stage.get(f'{kind}_seconds_total', 0) + histogram.sum
+                if(kind == 'run'):
+                    stage['run_p95_seconds'] = max(stage.get('run_p95_seconds', 0), histogram.quantile(0.95) or 0)
+
+            for (name, labels), value in self.counters.items():
+                labels = dict(labels)
+                if('stage' not in labels or not name.startswith((f'{METRIC_PREFIX}_stage_', f'{METRIC_PREFIX}_remote_stage_'))):
+                    continue
+                stage = summary.setdefault(labels['stage'], {})
+                if(name == f'{METRIC_PREFIX}_remote_stage_calls_total'):
+                    stage['remote_calls'] = stage.get('remote_calls', 0) + value
+                    if(labels.get('outcome') == 'failure'):
+                        stage['remote_failures'] = stage.get('remote_failures', 0) + value
+                elif(name == f'{METRIC_PREFIX}_stage_calls_total'):
+                    stage['calls'] = stage.get('calls', 0) + value
+                    if(labels.get('outcome') == 'failure'):
+                        stage['failures'] = stage.get('failures', 0) + value
+                else:
+                    field = name[len(f'{METRIC_PREFIX}_stage_'):-len('_total')]
+                    stage[field] = stage.get(field, 0) + value
+
+        for stage in summary.values():
+            stage.setdefault('failures', 0)
+            calls = stage.get('calls', 0)
+            stage['run_seconds_mean'] = stage.get('run_seconds_total', 0) / calls if calls > 0 else None
+            stage['wait_seconds_mean'] = stage.get('wait_seconds_total', 0) / calls if calls > 0 else None
+        return summary
+
+# <-------------------------------- Exporters ------------------------------->
+
+    def write_json(self, path:str) -> None:
+        """
+        Writes a snapshot of the metrics, with the summary of the stages, to a JSON file.
+
+        Parameters:
+            path: the path of the file.
+
+        Returns:
+            None
+        """
+        snapshot = self.snapshot()
+        snapshot['stages'] = self.stage_summary()
+        with atomic_open(path, 'w') as metrics_file:
+            json.dump(snapshot, metrics_file, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Formats the metrics in the Prometheus text exposition format.
+
+        Parameters:
+            None
+
+        Returns:
+            the metrics as text.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        for counter in snapshot['counters']:
+            if(counter['name'] not in declared):
+                lines.append(f"# TYPE {counter['name']} counter")
+                declared.add(counter['name'])
+            lines.append(f"{counter['name']}{prometheus_labels(counter['labels'])} {counter['value']}")
+
+        for histogram in snapshot['histograms']:
+            if(histogram['name'] not in declared):
+                lines.append(f"# TYPE {histogram['name']} histogram")
+                declared.add(histogram['name'])
+            for bound, count in histogram['buckets']:
+                lines.append(f"{histogram['name']}_bucket{prometheus_labels(dict(histogram['labels'], le=bound))} {count}")
+            lines.append(f"{histogram['name']}_sum{prometheus_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{histogram['name']}_count{prometheus_labels(histogram['labels'])} {histogram['count']}")
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path:str) -> None:
+        """
+        Writes the metrics to a Prometheus text file, for example for the textfile collector of the node exporter.
+
+        Parameters:
+            path: the path of the file.
+
+        Returns:
+            None
+        """
+        #the file is renamed into place so a collector never reads half of it.
+        with atomic_open(path, 'w') as metrics_file:
+            metrics_file.write(self.to_prometheus())
+
+# <-------------------------------- Profiling ------------------------------->
+
+    def enable_profiling(self, stage:str) -> None:
+        """
+        Profiles the calls of a stage with cProfile, adding them up until the profile is written.
+
+        Parameters:
+            stage: the name of the stage.
+
+        Returns:
+            None
+        """
+        self.profiled_stages.add(stage)
+
+    def disable_profiling(self, stage:str) -> None:
+        self.profiled_stages.discard(stage)
+
+    def add_profile(self, stage:str, profiler:cProfile.Profile) -> None:
+        with self.lock:
+            if(stage in self.profiles):
+                self.profiles[stage].add(profiler)
+            else:
+                self.profiles[stage] = pstats.Stats(profiler)
+
+    def write_profile(self, stage:str, path:str) -> bool:
+        """
+        Writes the added up profile of a stage in the pstats format, which snakeviz or gprof2dot can read.
+
+        Parameters:
+            stage: the name of the stage.
+            path: the path of the file.
+
+        Returns:
+            whether the stage had been profiled.
+        """
+        with self.lock:
+            stats = self.profiles.get(stage)
+            if(stats == None):
+                return False
+            stats.dump_stats(path)
+        return True
+
+# the registry of the process, the decorators record into it
+registry = MetricsRegistry()
+
+# <-------------------------------- Instrumentation ------------------------------->
+
+class TimedSemaphore:
+
+    def __init__(self, semaphore:Any) -> None:
+        """
+        Wraps the semaphore passed to a stage method to measure how long the method is blocked on it.
+
+        Parameters:
+            semaphore: the semaphore, or any object with acquire and release methods.
+
+        Returns:
+            None
+        """
+        self.semaphore = semaphore
+        self.waited:float = 0.0
+
+    def acquire(self, *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        try:
+            return self.semaphore.acquire(*args, **kwargs)
+        finally:
+            self.waited += time.perf_counter() - start
+
+    def release(self, *args, **kwargs) -> Any:
+        return self.semaphore.release(*args, **kwargs)
+
+def instrument_stage(stage:str, input_attribute:Optional[str], output_attribute:str) -> Callable:
+    """
+    A decorator for the VideoFile stage methods that records the time the call is blocked on its semaphore, the time
+    it runs for, the bytes of its input and output files and whether it succeeded, and profiles the call when the
+    stage is profiled.
+
+    Parameters:
+        stage: the name of the stage in the metrics.
+        input_attribute: the attribute of the VideoFile that holds the path of the input of the stage, if it has one.
+        output_attribute: the attribute of the VideoFile that holds the path of the output of the stage.
+
+    Returns:
+        the decorator.
+    """
+    def decorator(method:Callable) -> Callable:
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            semaphore = bound.arguments.get('semaphore')
+            if(semaphore != None):
+                semaphore = TimedSemaphore(semaphore)
+                bound.arguments['semaphore'] = semaphore
+
+            profiler = None
+            if(stage in registry.profiled_stages and registry.profiler_lock.acquire(blocking=False)):
+                profiler = cProfile.Profile()
+
+            #the input is measured before the call, a stage like trim_audio replaces the path it reads with its output.
+            input_bytes = file_size(getattr(self, input_attribute, None) if input_attribute != None else None)
+            outcome = 'failure'
+            start = time.perf_counter()
+            try:
+                if(profiler != None):
+                    result = profiler.runcall(method, *bound.args, **bound.kwargs)
+                else:
+                    result = method(*bound.args, **bound.kwargs)
+                outcome = 'success'
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                if(profiler != None):
+                    registry.profiler_lock.release()
+                    registry.add_profile(stage, profiler)
+
+                waited = semaphore.waited if semaphore != None else 0.0
+                registry.observe(f'{METRIC_PREFIX}_stage_wait_seconds', waited, stage=stage)
+                registry.observe(f'{METRIC_PREFIX}_stage_run_seconds', elapsed - waited, stage=stage)
+                registry.inc(f'{METRIC_PREFIX}_stage_calls_total', stage=stage, outcome=outcome)
+                if(outcome == 'success'):
+                    registry.inc(f'{METRIC_PREFIX}_stage_bytes_read_total', input_bytes, stage=stage)
+                    registry.inc(f'{METRIC_PREFIX}_stage_bytes_written_total', file_size(getattr(self, output_attribute, None)), stage=stage)
+
+        return wrapper
+
+    return decorator
+
+def instrument_runner(backend:str) -> Callable:
+    """
+    A decorator for the functions that run a stage over an array of videos, recording how long each run takes.
+
+    Parameters:
+        backend: the name of the backend of the function, serial, threads, processes, concurrent or asyncio.
+
+    Returns:
+        the decorator.
+    """
+    def decorator(function:Callable) -> Callable:
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            outcome = 'failure'
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+                outcome = 'success'
+                return result
+            finally:
+                registry.observe(f'{METRIC_PREFIX}_runner_seconds', time.perf_counter() - start, runner=function.__name__, backend=backend)
+                registry.inc(f'{METRIC_PREFIX}_runner_calls_total', runner=function.__name__, backend=backend, outcome=outcome)
+
+        return wrapper
+
+    return decorator
+
+def observe_queue_wait(task:str, seconds:float) -> None:
+    """
+    Records the time a video waited in the queue of an executor before a worker started on it.
+
+    Parameters:
+        task: the description of the task.
+        seconds: the time waited.
+
+    Returns:
+        None
+    """
+    registry.observe(f'{METRIC_PREFIX}_runner_queue_wait_seconds', seconds, task=task)
+
+def observe_remote_stage(stage:str, seconds:Optional[float], succeeded:bool) -> None:
+    """
+    Records a stage that ran in another process, when its result is merged into the video, as the timings that
+    instrument_stage takes in the worker stay in the registry of the worker.
+
+    Parameters:
+        stage: the name of the stage.
+        seconds [optional]: the time the stage took in the worker, None if the worker died before it reported it.
+        succeeded: whether the stage produced its output.
+
+    Returns:
+        None
+    """
+    if(seconds != None):
+        registry.observe(f'{METRIC_PREFIX}_remote_stage_seconds', seconds, stage=stage)
+    registry.inc(f'{METRIC_PREFIX}_remote_stage_calls_total', stage=stage, outcome='success' if succeeded else 'failure')
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+def file_size(path:Any) -> int:
+    if(isinstance(path, str) and os.path.exists(path)):
+        return os.path.getsize(path)
+    return 0
+
+def prometheus_labels(labels:dict[str,Any]) -> str:
+    if(len(labels) == 0):
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels.keys(), escaped)) + '}'
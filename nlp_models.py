@@ -0,0 +1,264 @@
+import os
+import json
+import resource
+import threading
+import multiprocessing
+from typing import Any, Callable, Optional
+
+SPACY_MODEL = 'en_core_web_sm'
+
+# nltk resources that are needed by TextBlob, as (path looked up by nltk.data.find, package passed to nltk.download)
+# (NLTK 3.8.2 and later tokenize with punkt_tab, the older releases with punkt)
+NLTK_RESOURCES = [('tokenizers/punkt', 'punkt'), ('tokenizers/punkt_tab', 'punkt_tab')]
+
+#the models are loaded on first use and kept for the lifetime of the process.
+_models:dict[str,Any] = {}
+#reentrant since a model can be built from another one of the registry.
+_models_lock = threading.RLock()
+
+# <-------------------------------- Model Loaders ------------------------------->
+
+def _load_nlp() -> Any:
+    import spacy
+    return spacy.load(SPACY_MODEL)
+
+def _load_sentiment_analyzer() -> Any:
+    from textblob.sentiments import PatternAnalyzer
+    return PatternAnalyzer()
+
+def _load_nrc_lexicon() -> dict[str,list[str]]:
+    import nrclex
+    #the lexicon is installed next to the nrclex module, or in its data folder in newer releases.
+    package_folder = os.path.dirname(nrclex.__file__)
+    for path in [os.path.join(package_folder, 'nrc_en.json'), os.path.join(package_folder, 'data', 'nrc_en.json')]:
+        if(os.path.exists(path)):
+            with open(path, 'r') as lexicon_file:
+                return json.load(lexicon_file)
+    raise FileNotFoundError(f'Could not find the NRC lexicon of the nrclex package in {package_folder}')
+
+def _load_nrc_index() -> Any:
+    import emotion_scorer
+    return emotion_scorer.EmotionIndex(get_nrc_lexicon())
+
+_LOADERS:dict[str,Callable[[],Any]] = {
+    'nlp': _load_nlp,
+    'sentiment_analyzer': _load_sentiment_analyzer,
+    'nrc_lexicon': _load_nrc_lexicon,
+    'nrc_index': _load_nrc_index,
+}
+
+ALL_MODELS = tuple(_LOADERS)
+
+# the models each stage of the VideoFile needs, so that worker pools only load what their stage uses
+STAGE_MODELS:dict[str,tuple[str,...]] = {
+    'download': (),
+    'extract_audio': (),
+    'trim_audio': (),
+    'transcribe': (),
+    'sentiment': ('sentiment_analyzer',),
+    'translate': (),
+    'emotions': ('nlp','sentiment_analyzer','nrc_index'),
+    'timeline': ('sentiment_analyzer','nrc_index'),
+    'text_batch': ('nlp','sentiment_analyzer','nrc_index'),
+}
+
+# the spaCy components that sentence segmentation depends on, the others are turned off when only sentences are used
+SENTENCE_COMPONENTS = ('tok2vec', 'parser', 'senter', 'sentencizer')
+
+# <-------------------------------- Model Registry ------------------------------->
+
+def get_model(name:str) -> Any:
+    """
+    Returns a model of the registry, loading it if this process has not used it yet.
+
+    Parameters:
+        name: one of 'nlp', 'sentiment_analyzer', 'nrc_lexicon' or 'nrc_index'.
+
+    Returns:
+        the loaded model.
+    """
+    model = _models.get(name)
+    if(model == None):
+        with _models_lock:
+            #checking again since another thread could have loaded the model while this one waited for the lock.
+            model = _models.get(name)
+            if(model == None):
+                #TextBlob tokenizes with the nltk resources.
+                if(name == 'sentiment_analyzer'):
+                    ensure_nltk_resources()
+                model = _LOADERS[name]()
+                _models[name] = model
+    return model
+
+def get_nlp() -> Any:
+    """
+    Returns the spaCy pipeline.
+
+    Parameters:
+        None
+
+    Returns:
+        the spaCy Language object.
+    """
+    return get_model('nlp')
+
+def get_sentiment_analyzer() -> Any:
+    """
+    Returns the TextBlob sentiment analyzer shared by all the TextBlob objects of the process.
+
+    Parameters:
+        None
+
+    Returns:
+        the PatternAnalyzer object.
+    """
+    return get_model('sentiment_analyzer')
+
+def get_nrc_lexicon() -> dict[str,list[str]]:
+    """
+    Returns the NRC lexicon of the nrclex package, mapping each word to its emotions.
+
+    Parameters:
+        None
+
+    Returns:
+        the lexicon dictionary.
+    """
+    return get_model('nrc_lexicon')
+
+def text_blob(text:str) -> Any:
+    """
+    Creates a TextBlob of a text that uses the shared sentiment analyzer.
+
+    Parameters:
+        text: the text to be analysed.
+
+    Returns:
+        the TextBlob object.
+    """
+    from textblob import TextBlob
+    return TextBlob(text, analyzer=get_sentiment_analyzer())
+
+def sentence_only_components() -> list[str]:
+    """
+    Returns the components of the spaCy pipeline that are not needed for sentence segmentation.
+
+    Parameters:
+        None
+
+    Returns:
+        the names of the components to be disabled.
+    """
+    return [name for name in get_nlp().pipe_names if name not in SENTENCE_COMPONENTS]
+
+def sentiment_result(polarity:float, subjectivity:float) -> tuple:
+    """
+    Creates a sentiment of the same type as TextBlob(text).sentiment from stored values.
+
+    Parameters:
+        polarity: the polarity of the text.
+        subjectivity: the subjectivity of the text.
+
+    Returns:
+        the Sentiment named tuple.
+    """
+    return get_sentiment_analyzer().RETURN_TYPE(polarity, subjectivity)
+
+def ensure_nltk_resources() -> None:
+    """
+    Downloads the nltk resources that are not already installed, so no network request is made when they are present.
+    A resource that cannot be downloaded, offline or behind a proxy, is reported here rather than as a missing corpus
+    of TextBlob in the middle of a stage.
+
+    Parameters:
+        None
+
+    Returns:
+        None
+    """
+    import nltk
+    for path, package in NLTK_RESOURCES:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            if(not nltk.download(package, quiet=True)):
+                raise RuntimeError(f"The nltk resource '{package}' needed by TextBlob is not installed and could not be downloaded, "
+                                   f"install it with: python -m nltk.downloader {package}")
+
+def warm_models(names:tuple[str,...] = ALL_MODELS) -> None:
+    """
+    Loads the given models in the current process.
+
+    Parameters:
+        names: the names of the models to be loaded.
+
+    Returns:
+        None
+    """
+    for name in names:
+        get_model(name)
+
+# <-------------------------------- Worker Pools ------------------------------->
+
+def init_worker(names:tuple[str,...] = ALL_MODELS) -> None:
+    """
+    The initializer of the pool workers, it loads the models once per worker and prints the memory the worker uses.
+
+    Parameters:
+        names: the names of the models to be loaded.
+
+    Returns:
+        None
+    """
+    warm_models(names)
+    print(f'Worker {os.getpid()} loaded the models {list(names)}, resident memory: {current_rss_mb()} MB')
+
+def prepare_worker_pool(names:tuple[str,...] = ALL_MODELS) -> tuple[Optional[Callable[...,None]],tuple]:
+    """
+    Prepares the models for a pool of worker processes. When the workers are forked the models are loaded once in the
+    parent and shared with the workers copy-on-write, otherwise each worker loads them once through the initializer.
+
+    Parameters:
+        names: the names of the models the workers need.
+
+    Returns:
+        the initializer and initargs to be passed to the pool.
+    """
+    if(len(names) == 0):
+        return None, ()
+
+    if(multiprocessing.get_start_method(allow_none=False) == 'fork'):
+        warm_models(names)
+        return None, ()
+
+    return init_worker, (names,)
+
+def current_rss_mb() -> float:
+    """
+    Returns the resident memory of the current process, or its peak when the current value cannot be read.
+
+    Parameters:
+        None
+
+    Returns:
+        the resident memory in MB.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return round(resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024*1024), 2)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident memory of the current process.
+
+    Parameters:
+        None
+
+    Returns:
+        the peak resident memory in MB.
+    """
+    #ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
@@ -0,0 +1,435 @@
+import os
+import time
+import queue
+import threading
+import concurrent.futures
+from VideoFile import VideoFile
+import nlp_models
+import stage_tasks
+import job_manifest
+from job_manifest import JobManifest
+import adaptive_concurrency
+from adaptive_concurrency import AdaptiveLimiter
+from metrics import instrument_runner
+from typing import Callable, Iterable, Optional
+
+# marks the end of the input for the workers of a stage
+_END_OF_INPUT = object()
+
+# <-------------------------------- Pipeline Stage ------------------------------->
+
+class Stage:
+
+    def __init__(self, name:str, task:Callable[[VideoFile],None], produces:str, workers:int = 1, queue_size:int = 16, limiter:Optional[AdaptiveLimiter] = None) -> None:
+        """
+        Initialises a stage of the pipeline: the function applied to each video, the attribute that it produces and the
+        bounded queue of videos waiting for it.
+
+        Parameters:
+            name: The name of the stage, used in the printed summaries.
+            task: The function that is called on each video, usually a VideoFile method.
+            produces: The attribute of the VideoFile that holds the output of the stage, or the path of its output file.
+            workers: The number of threads that run the stage, the number it starts with when it has a limiter.
+            queue_size: The number of videos that can wait for the stage before upstream stages are blocked.
+            limiter [optional]: The adaptive limiter that decides how many of the threads run the task at one time. A
+                                thread is added while videos are waiting and the limit is above the number of threads,
+                                up to the highest limit, so the threads follow the limit instead of being started at once.
+
+        Returns:
+            None
+        """
+        self.name:str = name
+        self.task:Callable[[VideoFile],None] = task
+        self.produces:str = produces
+        self.workers:int = workers
+        self.limiter:Optional[AdaptiveLimiter] = limiter
+        self.max_workers:int = max(workers, limiter.max_limit) if limiter != None else workers
+        self.queue:queue.Queue = queue.Queue(maxsize=queue_size)
+        self.successors:list[Stage] = []
+        self.completed:int = 0
+        self.failed:int = 0
+        self.skipped:int = 0
+        self.active_workers:int = 0
+        self.lock = threading.Lock()
+
+    def has_output(self, video:VideoFile) -> bool:
+        """
+        Checks whether the stage produced its output for a video, so that a task which returned without writing its
+        output is treated as a failure too.
+
+        Parameters:
+            video: the VideoFile object that went through the stage.
+
+        Returns:
+            True if the output of the stage exists, either a file at the path it holds or a value kept in memory.
+        """
+        output = getattr(video, self.produces)
+        if(isinstance(output, str)):
+            return os.path.exists(output)
+        return output is not None
+
+# <-------------------------------- Pipeline ------------------------------->
+
+class Pipeline:
+
+    def __init__(self, queue_size:int = 16, manifest:Optional[JobManifest] = None, retry_failed:bool = False, failed_only:bool = False) -> None:
+        """
+        Initialises an empty pipeline. Stages are connected as a tree: each stage has at most one upstream stage and
+        any number of downstream stages, which all receive every video that the stage completes.
+
+        With a manifest, every stage of every video is recorded as it finishes, and a video recorded by an earlier run
+        gets back the outputs of its completed stages, which are skipped, so an interrupted batch resumes where it stopped.
+
+        Parameters:
+            queue_size: The default size of the bounded queue in front of each stage.
+            manifest [optional]: the job manifest of the batch.
+            retry_failed: whether the stages that failed in an earlier run are run again, they are skipped otherwise.
+            failed_only: whether only the videos with a failed stage are processed, for a run that retries the failures of a batch.
+
+        Returns:
+            None
+        """
+        self.queue_size:int = queue_size
+        self.manifest:Optional[JobManifest] = manifest
+        self.retry_failed:bool = retry_failed
+        self.failed_only:bool = failed_only
+        self.stages:dict[str,Stage] = {}
+        self.roots:list[Stage] = []
+        self.failures:list[tuple[str,str]] = []
+        self.failures_lock = threading.Lock()
+        self.threads:list[threading.Thread] = []
+
+    def add_stage(self, name:str, task:Callable[[VideoFile],None], produces:str, workers:int = 1, after:Optional[str] = None,
+                  limiter:Optional[AdaptiveLimiter] = None) -> Stage:
+        """
+        Adds a stage to the pipeline.
+
+        Parameters:
+            name: The unique name of the stage.
+            task: The function that is called on each video.
+            produces: The attribute of the VideoFile that holds the path of the output of the stage.
+            workers: The number of threads that run the stage.
+            after [optional]: The name of the upstream stage, the stage is fed by the input videos if it is not given.
+            limiter [optional]: The adaptive limiter of the stage, the threads then run the task only when it lets them.
+
+        Returns:
+            the created Stage.
+        """
+        if(name in self.stages):
+            raise ValueError(f'A stage named {name} already exists in the pipeline')
+
+        stage = Stage(name, task, produces, workers, self.queue_size, limiter)
+        if(after == None):
+            self.roots.append(stage)
+        else:
+            self.stages[after].successors.append(stage)
+        self.stages[name] = stage
+        return stage
+
+    def run(self, videos:Iterable[VideoFile]) -> dict[str,dict[str,int]]:
+        """
+        Streams the videos through the stages. Every stage has its own threads, so a video moves on to the next stage
+        as soon as it is done with the current one, while the bounded queues keep fast stages from running ahead.
+
+        Parameters:
+            videos: the VideoFile objects to be processed, it is consumed lazily.
+
+        Returns:
+            the number of completed, failed and skipped videos of each stage.
+        """
+        start = time.perf_counter()
+
+        self.threads = []
+        for stage in self.stages.values():
+            stage.active_workers = stage.workers
+            for _ in range(stage.workers):
+                self._start_worker(stage)
+
+        self._feed(videos)
+
+        #the workers added while the pipeline runs are appended before the worker that adds them ends.
+        joined = 0
+        while joined < len(self.threads):
+            self.threads[joined].join()
+            joined += 1
+
+        end = time.perf_counter()
+        print(f'Time took to process the videos through the pipeline: {round(end-start,2)} second(s)')
+
+        return {stage.name: {'completed': stage.completed, 'failed': stage.failed, 'skipped': stage.skipped} for stage in self.stages.values()}
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+    def _feed(self, videos:Iterable[VideoFile]) -> None:
+        """
+        Puts the input videos in the queues of the root stages, blocking while those queues are full, and then signals
+        the end of the input.
+
+        Parameters:
+            videos: the VideoFile objects to be processed.
+
+        Returns:
+            None
+        """
+        for video in videos:
+            if(self.manifest != None):
+                self.manifest.register(video)
+                statuses = self.manifest.restore(video)
+                if(self.failed_only and job_manifest.FAILED not in statuses.values()):
+                    continue
+            for stage in self.roots:
+                stage.queue.put(video)
+
+        for stage in self.roots:
+            stage.queue.put(_END_OF_INPUT)
+
+    def _start_worker(self, stage:Stage) -> None:
+        thread = threading.Thread(target=self._worker, args=(stage,), name=f'{stage.name}-worker', daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def _grow(self, stage:Stage) -> None:
+        """
+        Adds a thread to a stage with a limiter when videos are waiting for it and its limit has grown above its
+        number of threads, so the threads of a stage follow its limit instead of all being started at once.
+
+        Parameters:
+            stage: the stage.
+
+        Returns:
+            None
+        """
+        if(stage.limiter == None):
+            return
+        with stage.lock:
+            if(stage.workers >= min(stage.max_workers, int(stage.limiter.limit)) or stage.queue.empty()):
+                return
+            stage.workers += 1
+            stage.active_workers += 1
+        self._start_worker(stage)
+
+    def _worker(self, stage:Stage) -> None:
+        """
+        Runs the task of a stage on the videos of its queue and hands every successful video to the downstream stages.
+        The end of the input is put back in the queue for the other workers of the stage, and the last worker of a stage
+        to finish signals it to the downstream stages, even if the worker stops on an error, so the stages after it are
+        never left waiting.
+
+        Parameters:
+            stage: the stage that the worker belongs to.
+
+        Returns:
+            None
+        """
+        try:
+            while True:
+                video = stage.queue.get()
+                if(video is _END_OF_INPUT):
+                    stage.queue.put(_END_OF_INPUT)
+                    break
+                self._grow(stage)
+                try:
+                    self._process(stage, video)
+                except Exception as e:
+                    #the manifest could not be read or written, like a database that stays locked, the video goes no further.
+                    print(f"UNSUCCESSFUL - stage {stage.name} could not record the video {video.url}")
+                    print(e)
+                    with stage.lock:
+                        stage.failed += 1
+                    with self.failures_lock:
+                        self.failures.append((stage.name, video.url))
+        finally:
+            with stage.lock:
+                stage.active_workers -= 1
+                last_worker = stage.active_workers == 0
+
+            if(last_worker):
+                for successor in stage.successors:
+                    successor.queue.put(_END_OF_INPUT)
+
+    def _process(self, stage:Stage, video:VideoFile) -> None:
+        """
+        Runs the task of a stage on a video, unless an earlier run finished it, and records the outcome in the manifest
+        before counting it and handing the video on, so a video whose outcome could not be recorded is counted once,
+        as a failure, by the worker.
+
+        Parameters:
+            stage: the stage.
+            video: the VideoFile object.
+
+        Returns:
+            None
+        """
+        status = self.manifest.statuses(video).get(stage.name) if self.manifest != None else None
+        if(status == job_manifest.DONE and stage.has_output(video)) or (status == job_manifest.FAILED and not self.retry_failed):
+            #a stage finished by an earlier run is not repeated, a video that failed it goes no further.
+            with stage.lock:
+                stage.skipped += 1
+            if(status == job_manifest.DONE):
+                for successor in stage.successors:
+                    successor.queue.put(video)
+            return
+
+        if(self.manifest != None):
+            self.manifest.start_stage(video, stage.name)
+        error = None
+        try:
+            if(stage.limiter == None):
+                stage.task(video)
+            else:
+                with stage.limiter:
+                    stage.task(video)
+            succeeded = stage.has_output(video)
+        except Exception as e:
+            print(f"UNSUCCESSFUL - stage {stage.name} failed for the video {video.url}")
+            print(e)
+            error = e
+            succeeded = False
+
+        if(self.manifest != None):
+            if(succeeded):
+                self.manifest.finish_stage(video, stage.name)
+            else:
+                self.manifest.fail_stage(video, stage.name, error)
+
+        with stage.lock:
+            if(succeeded):
+                stage.completed += 1
+            else:
+                stage.failed += 1
+
+        if(succeeded):
+            for successor in stage.successors:
+                successor.queue.put(video)
+        else:
+            with self.failures_lock:
+                self.failures.append((stage.name, video.url))
+
+# <-------------------------------- Default Pipeline ------------------------------->
+
+DEFAULT_STAGE_WORKERS = {
+    'download': 5,
+    'extract_audio': 1,
+    'trim_audio': 1,
+    'transcribe': 4,
+    'sentiment': 2,
+    'translate': 4,
+    'emotions': 2,
+    'timeline': 2,
+}
+
+def build_video_pipeline(data_folder:str, lang_from:str = 'en', lang_to:str = 'es', lang_name:str = 'Spanish', workers:Optional[dict[str,int]] = None, queue_size:int = 16,
+                         executors:Optional[dict[str,concurrent.futures.Executor]] = None, manifest:Optional[JobManifest] = None, retry_failed:bool = False,
+                         failed_only:bool = False, trim_silence:bool = False, timeline:bool = False, adaptive:bool = True) -> Pipeline:
+    """
+    Builds the pipeline download -> extract_audio -> [trim_audio] -> transcribe -> {sentiment, translate, emotions, [timeline]} out of the VideoFile methods.
+
+    Parameters:
+        data_folder: the folder name where all videos are to be downloaded.
+        lang_from: The original language of the text.
+        lang_to: The language to translate the text into.
+        lang_name: The name in English of the language that the text is to be translated into.
+        workers [optional]: the number of threads of each stage, overriding DEFAULT_STAGE_WORKERS.
+        queue_size: the size of the bounded queue in front of each stage.
+        executors [optional]: the pools of processes that the threads of some stages hand their videos to, by stage name.
+        manifest [optional]: the job manifest that records the stages and lets an interrupted batch resume.
+        retry_failed: whether the stages that failed in an earlier run of the manifest are run again.
+        failed_only: whether only the videos with a failed stage in the manifest are processed.
+        trim_silence: whether the parts of the audio without speech are dropped before the transcription.
+        timeline: whether the sentiment and emotions of every segment of the transcript are scored, VideoFile.transcriber must be set.
+        adaptive: whether the stages without a number of threads in workers, and without a pool of processes, are run under
+                  the adaptive limiter of the stage, starting with their DEFAULT_STAGE_WORKERS threads and adding threads
+                  as the limit grows.
+
+    Returns:
+        the Pipeline, ready to be run.
+    """
+    stage_workers = dict(DEFAULT_STAGE_WORKERS)
+    if(workers != None):
+        stage_workers.update(workers)
+    #the limiters are shared with the other backends, so what a stage learned in one batch carries over to the next.
+    limiters:dict[str,AdaptiveLimiter] = {}
+    if(adaptive):
+        for stage_name in DEFAULT_STAGE_WORKERS:
+            if(stage_name not in (workers or {}) and stage_name not in (executors or {})):
+                limiters[stage_name] = adaptive_concurrency.get_limiter(stage_name)
+
+    tasks = {
+        'download': lambda video: video.download_video(data_folder),
+        'extract_audio': lambda video: video.extract_audio(audio_only=True),
+        'trim_audio': lambda video: video.trim_audio(),
+        'transcribe': lambda video: video.transcribe_audio(timeline=timeline),
+        'sentiment': lambda video: video.sentiment_analysis(),
+        'translate': lambda video: video.translate_text(lang_from, lang_to, lang_name),
+        'emotions': lambda video: video.extract_emotions(),
+        'timeline': lambda video: video.analyse_timeline(),
+    }
+    params = {
+        'download': {'data_folder': data_folder},
+        'extract_audio': {'audio_only': True},
+        'transcribe': {'timeline': timeline},
+        'translate': {'lang_from': lang_from, 'lang_to': lang_to, 'lang_to_name': lang_name},
+    }
+    #a stage with a pool of processes runs in the workers and merges their results back into the videos.
+    for stage_name, executor in (executors or {}).items():
+        tasks[stage_name] = stage_tasks.remote_stage(stage_name, executor, params.get(stage_name))
+    #the timeline is scored while the audio is transcribed, the stage only scores the segments file when that failed or was cached.
+    score_timeline = tasks['timeline']
+    tasks['timeline'] = lambda video: score_timeline(video) if video.timeline_path == None else None
+
+    pipeline = Pipeline(queue_size, manifest, retry_failed, failed_only)
+    pipeline.add_stage('download', tasks['download'], stage_tasks.STAGE_PRODUCES['download'], stage_workers['download'], limiter=limiters.get('download'))
+    pipeline.add_stage('extract_audio', tasks['extract_audio'], stage_tasks.STAGE_PRODUCES['extract_audio'], stage_workers['extract_audio'], after='download', limiter=limiters.get('extract_audio'))
+    if(trim_silence):
+        pipeline.add_stage('trim_audio', tasks['trim_audio'], stage_tasks.STAGE_PRODUCES['trim_audio'], stage_workers['trim_audio'], after='extract_audio', limiter=limiters.get('trim_audio'))
+    pipeline.add_stage('transcribe', tasks['transcribe'], stage_tasks.STAGE_PRODUCES['transcribe'], stage_workers['transcribe'], after='trim_audio' if trim_silence else 'extract_audio', limiter=limiters.get('transcribe'))
+    pipeline.add_stage('sentiment', tasks['sentiment'], stage_tasks.STAGE_PRODUCES['sentiment'], stage_workers['sentiment'], after='transcribe', limiter=limiters.get('sentiment'))
+    pipeline.add_stage('translate', tasks['translate'], stage_tasks.STAGE_PRODUCES['translate'], stage_workers['translate'], after='transcribe', limiter=limiters.get('translate'))
+    pipeline.add_stage('emotions', tasks['emotions'], stage_tasks.STAGE_PRODUCES['emotions'], stage_workers['emotions'], after='transcribe', limiter=limiters.get('emotions'))
+    if(timeline):
+        pipeline.add_stage('timeline', tasks['timeline'], stage_tasks.STAGE_PRODUCES['timeline'], stage_workers['timeline'], after='transcribe', limiter=limiters.get('timeline'))
+    return pipeline
+
+@instrument_runner('pipeline')
+def pipelined_video_processor(videos:Iterable[VideoFile], data_folder:str, lang_from:str = 'en', lang_to:str = 'es', lang_name:str = 'Spanish', workers:Optional[dict[str,int]] = None,
+                              process_workers:Optional[dict[str,int]] = None, manifest:Optional[JobManifest] = None, retry_failed:bool = False,
+                              failed_only:bool = False, trim_silence:bool = False, timeline:bool = False, adaptive:bool = True) -> dict[str,dict[str,int]]:
+    """
+    Downloads and analyses the videos by streaming each one through all the stages as soon as its previous stage finishes.
+
+    Parameters:
+        videos: the VideoFile objects to be processed.
+        data_folder: the folder name where all videos are to be downloaded.
+        lang_from: The original language of the text.
+        lang_to: The language to translate the text into.
+        lang_name: The name in English of the language that the text is to be translated into.
+        workers [optional]: the number of threads of each stage, overriding DEFAULT_STAGE_WORKERS.
+        process_workers [optional]: the number of processes of the stages that run in a pool of processes, like the CPU bound emotion extraction.
+        manifest [optional]: the job manifest that records the stages and lets an interrupted batch resume.
+        retry_failed: whether the stages that failed in an earlier run of the manifest are run again.
+        failed_only: whether only the videos with a failed stage in the manifest are processed.
+        trim_silence: whether the parts of the audio without speech are dropped before the transcription.
+        timeline: whether the sentiment and emotions of every segment of the transcript are scored, VideoFile.transcriber must be set.
+        adaptive: whether the threads of the stages are run under their adaptive limiters, as build_video_pipeline does.
+
+    Returns:
+        the number of completed, failed and skipped videos of each stage.
+    """
+    executors = {}
+    try:
+        for stage_name, process_count in (process_workers or {}).items():
+            initializer, initargs = nlp_models.prepare_worker_pool(nlp_models.STAGE_MODELS[stage_name])
+            executors[stage_name] = concurrent.futures.ProcessPoolExecutor(max_workers=process_count, initializer=initializer, initargs=initargs)
+
+        pipeline = build_video_pipeline(data_folder, lang_from, lang_to, lang_name, workers, executors=executors, manifest=manifest,
+                                        retry_failed=retry_failed, failed_only=failed_only, trim_silence=trim_silence,
+                                        timeline=timeline, adaptive=adaptive)
+        summary = pipeline.run(videos)
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+    for stage_name, counts in summary.items():
+        print(f"PIPELINE :: {stage_name}: {counts['completed']} completed, {counts['failed']} failed, {counts['skipped']} skipped")
+
+    return summary
@@ -1,6 +1,8 @@
 import time
 from VideoFile import VideoFile
+from metrics import instrument_runner
 
+@instrument_runner('serial')
 def serial_video_downloader(videos:list[VideoFile], data_folder:str) -> None:
     """
     Downloads an array of videos provided, one after another.
@@ -15,12 +17,17 @@ def serial_video_downloader(videos:list[VideoFile], data_folder:str) -> None:
     start=time.perf_counter()
 
     for video in videos:
-        video.download_video(data_folder)
+        try:
+            video.download_video(data_folder)
+        except Exception:
+            #the failure has already been printed by the method, the remaining videos are still processed.
+            continue
 
     end=time.perf_counter()
 
     print(f'Time took to download the videos serially: {round(end-start,2)} second(s)')
 
+@instrument_runner('serial')
 def serial_audio_extractor(videos: list[VideoFile]) -> None:
     """
     Extracts audios from an array of VideoFile objects provided, one after another.
@@ -34,12 +41,17 @@ def serial_audio_extractor(videos: list[VideoFile]) -> None:
     start=time.perf_counter()
 
     for video in videos:
-        video.extract_audio()
+        try:
+            video.extract_audio()
+        except Exception:
+            #the failure has already been printed by the method, the remaining videos are still processed.
+            continue
 
     end=time.perf_counter()
     
     print(f'Time took to extract audios from the videos serially: {round(end-start,2)} second(s)')
 
+@instrument_runner('serial')
 def serial_audio_transcriber(videos: list[VideoFile]) -> None:
     """
     Transcribers audios from an array of VideoFile objects provided, one after another.
@@ -53,8 +65,108 @@ def serial_audio_transcriber(videos: list[VideoFile]) -> None:
     start=time.perf_counter()
 
     for video in videos:
-        video.transcribe_audio()
+        try:
+            video.transcribe_audio()
+        except Exception:
+            #the failure has already been printed by the method, the remaining videos are still processed.
+            continue
 
     end=time.perf_counter()
     
-    print(f'Time took to transcribe audios from the videos serially: {round(end-start,2)} second(s)')
\ No newline at end of file
+    print(f'Time took to transcribe audios from the videos serially: {round(end-start,2)} second(s)')
+
+@instrument_runner('serial')
+def serial_sentiment_analyser(videos: list[VideoFile]) -> None:
+    """
+    Performs sentiment analysis on an array of VideoFile objects provided, one after another.
+
+    Parameters:
+        videos: the array of videos that are to be analysed
+    
+    Returns:
+        None    
+    """
+    start=time.perf_counter()
+
+    for video in videos:
+        try:
+            video.sentiment_analysis()
+        except Exception:
+            #the failure has already been printed by the method, the remaining videos are still processed.
+            continue
+
+    end=time.perf_counter()
+    
+    print(f'Time took to perform sentiment analysis on the videos serially: {round(end-start,2)} second(s)')
+
+@instrument_runner('serial')
+def serial_text_translator(videos: list[VideoFile], lang_from: str, lang_to: str, lang_name: str) -> None:
+    """
+    Translates the transcribed texts of an array of VideoFile objects provided, one after another.
+
+    Parameters:
+        videos: the array of videos whose texts are to be translated
+        lang_from: The original language of the text.
+        lang_to: The language to translate the text into.
+        lang_name: The name in English of the language that the text is to be translated into.
+    
+    Returns:
+        None    
+    """
+    start=time.perf_counter()
+
+    for video in videos:
+        try:
+            video.translate_text(lang_from, lang_to, lang_name)
+        except Exception:
+            #the failure has already been printed by the method, the remaining videos are still processed.
+            continue
+
+    end=time.perf_counter()
+    
+    print(f'Time took to translate the videos in {lang_name} serially: {round(end-start,2)} second(s)')
+
+@instrument_runner('serial')
+def serial_emotion_extractor(videos: list[VideoFile]) -> None:
+    """
+    Extracts emotions from an array of VideoFile objects provided, one after another.
+
+    Parameters:
+        videos: the array of videos whose emotions are to be extracted
+    
+    Returns:
+        None    
+    """
+    start=time.perf_counter()
+
+    for video in videos:
+        try:
+            video.extract_emotions()
+        except Exception:
+            #the failure has already been printed by the method, the remaining videos are still processed.
+            continue
+
+    end=time.perf_counter()
+    
+    print(f'Time took to extract emotions from the videos serially: {round(end-start,2)} second(s)')
+
+@instrument_runner('serial')
+def batch_text_analyser(videos: list[VideoFile], batch_size: int = 32, n_process: int = 1) -> None:
+    """
+    Performs sentiment analysis and emotion extraction on an array of VideoFile objects in one batched pass over their texts.
+
+    Parameters:
+        videos: the array of videos that are to be analysed
+        batch_size: the number of texts that spaCy processes together.
+        n_process: the number of processes that spaCy uses.
+    
+    Returns:
+        None    
+    """
+    start=time.perf_counter()
+
+    VideoFile.analyse_text_batch(videos, batch_size, n_process)
+
+    end=time.perf_counter()
+    
+    print(f'Time took to analyse the texts of the videos in batches: {round(end-start,2)} second(s)')
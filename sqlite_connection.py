@@ -0,0 +1,65 @@
+import os
+import sqlite3
+from typing import Iterable, Optional
+
+# <-------------------------------- Process Local Connections ------------------------------->
+
+class ProcessConnection:
+
+    def __init__(self, path:str, schema:Iterable[str], wal:bool = False, timeout:float = 30.0, autocommit:bool = False) -> None:
+        """
+        Initialises the connection to a SQLite file that the manifests, queues and caches share between their threads.
+        A connection cannot be shared with a forked process, so each process opens its own; the file is also opened
+        again when it was deleted or replaced since it was opened, like the index of a data folder that is removed
+        between two runs, which the old connection could no longer write to.
+
+        Parameters:
+            path: the path of the SQLite file.
+            schema: the statements that create the tables and indexes, run each time the file is opened.
+            wal: whether the file is put in write-ahead log mode, which is only safe when every process that opens the
+                 file runs on the machine that holds it.
+            timeout: the number of seconds to wait for the lock of another connection.
+            autocommit: whether the connection leaves the transactions to the caller (BEGIN IMMEDIATE and COMMIT).
+
+        Returns:
+            None
+        """
+        self.path:str = path
+        self.schema:list[str] = list(schema)
+        self.wal:bool = wal
+        self.timeout:float = timeout
+        self.autocommit:bool = autocommit
+        self.connection:Optional[sqlite3.Connection] = None
+        self.pid:Optional[int] = None
+        self.inode:Optional[int] = None
+
+    def get(self) -> sqlite3.Connection:
+        """
+        Returns the connection of the current process, opening it if needed. The callers hold their own lock.
+
+        Parameters:
+            None
+
+        Returns:
+            the connection.
+        """
+        if(self.connection == None or self.pid != os.getpid() or self.inode != file_inode(self.path)):
+            if(self.connection != None and self.pid == os.getpid()):
+                self.connection.close()
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None if self.autocommit else '')
+            if(self.wal):
+                connection.execute('PRAGMA journal_mode=WAL')
+            with connection:
+                for statement in self.schema:
+                    connection.execute(statement)
+            self.connection = connection
+            self.pid = os.getpid()
+            self.inode = file_inode(self.path)
+        return self.connection
+
+def file_inode(path:str) -> Optional[int]:
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
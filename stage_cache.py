@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from artifact_store import atomic_path
+from typing import Any, NamedTuple, Optional
+
+# the version of the code of each stage, bumping one invalidates the cached outputs of that stage only
+STAGE_VERSIONS = {
+    'download': 1,
+    #2: keyed by the download of the video instead of the hash of the video file.
+    'extract_audio': 2,
+    #2: the transcription also caches its segments and the .srt and .vtt subtitles.
+    'transcribe': 2,
+    'translate': 1,
+    'sentiment': 1,
+    'emotions': 1,
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+class CacheEntry(NamedTuple):
+    key: str
+    folder: str
+    stage: str
+    artifacts: dict[str,dict[str,Any]]
+    metadata: dict[str,Any]
+
+# <-------------------------------- Hashing Helpers ------------------------------->
+
+def hash_file(path:str, block_size:int = 1024*1024) -> str:
+    """
+    Computes the sha256 of a file, reading it a block at a time.
+
+    Parameters:
+        path: the path of the file.
+        block_size: the number of bytes read at a time.
+
+    Returns:
+        the hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_bytes(data:bytes) -> str:
+    """
+    Computes the sha256 of bytes held in memory.
+
+    Parameters:
+        data: the bytes to be hashed.
+
+    Returns:
+        the hex digest of the bytes.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+def hash_text(text:str) -> str:
+    """
+    Computes the sha256 of a text.
+
+    Parameters:
+        text: the text to be hashed.
+
+    Returns:
+        the hex digest of the UTF-8 encoded text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# <-------------------------------- Stage Cache ------------------------------->
+
+class StageCache:
+
+    def __init__(self, cache_folder:str = '.stage_cache', max_bytes:int = 20*1024**3, verify_hashes:bool = False, evict_to:float = 0.8) -> None:
+        """
+        Initialises a persistent cache of the outputs of the stages. Each entry is a folder named after the hash of the
+        stage, its input, its parameters and the version of its code, holding copies of the output files and a manifest.
+        The size of the cache is counted once and then kept up to date as entries are stored, so it is only listed
+        again when it outgrows max_bytes, and then enough entries are evicted at once to bring it down to evict_to.
+
+        Parameters:
+            cache_folder: the folder where the entries are stored.
+            max_bytes: the size above which the least recently used entries are evicted.
+            verify_hashes: whether the content of the cached files is hashed and checked against the manifest each time
+                           they are read, only their sizes are checked otherwise.
+            evict_to: the fraction of max_bytes the cache is brought down to by an eviction.
+
+        Returns:
+            None
+        """
+        self.cache_folder:str = cache_folder
+        self.max_bytes:int = max_bytes
+        self.verify_hashes:bool = verify_hashes
+        self.evict_to:float = evict_to
+        #the size of the entries, None until they are first listed.
+        self.total_bytes:Optional[int] = None
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_folder, exist_ok=True)
+
+    def key(self, stage:str, input_id:str, params:Optional[dict[str,Any]] = None) -> str:
+        """
+        Computes the key of a stage run.
+
+        Parameters:
+            stage: the name of the stage.
+            input_id: the URL of the video, or the hash of the input file or text of the stage.
+            params: the parameters of the stage that change its output.
+
+        Returns:
+            the key of the cache entry.
+        """
+        identity = json.dumps([stage, STAGE_VERSIONS.get(stage, 0), input_id, params or {}], sort_keys=True)
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def entry_folder(self, key:str) -> str:
+        """
+        Returns the folder of an entry, sharded by the first two characters of the key.
+
+        Parameters:
+            key: the key of the entry.
+
+        Returns:
+            the path of the folder.
+        """
+        return os.path.join(self.cache_folder, key[:2], key)
+
+    def get(self, key:str) -> Optional[CacheEntry]:
+        """
+        Looks up an entry and checks that its files are intact. An entry that fails the check is removed.
+
+        Parameters:
+            key: the key of the entry.
+
+        Returns:
+            the entry, or None if it is not cached.
+        """
+        folder = self.entry_folder(key)
+        manifest_path = os.path.join(folder, MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+        for name, artifact in manifest['artifacts'].items():
+            path = os.path.join(folder, name)
+            if(not os.path.exists(path) or os.path.getsize(path) != artifact['size'] or (self.verify_hashes and hash_file(path) != artifact['sha256'])):
+                print(f"CACHE :: the cached {name} of the stage {manifest['stage']} is corrupted, removing the entry {key}")
+                self.remove(key)
+                return None
+
+        #the manifest modification time records when the entry was last used, for the LRU eviction.
+        try:
+            os.utime(manifest_path)
+        except OSError:
+            return None
+        return CacheEntry(key, folder, manifest['stage'], manifest['artifacts'], manifest['metadata'])
+
+    def put(self, key:str, stage:str, artifacts:dict[str,str], metadata:Optional[dict[str,Any]] = None) -> None:
+        """
+        Stores copies of the output files of a stage run. The entry is written in a temporary folder and renamed into
+        place, so readers never see a partial entry. The copies keep the modification times of the files, which
+        restore compares to tell an identical file from a different one.
+
+        Parameters:
+            key: the key of the entry.
+            stage: the name of the stage.
+            artifacts: the paths of the output files, by name.
+            metadata [optional]: the values of the stage run that are restored with the files.
+
+        Returns:
+            None
+        """
+        folder = self.entry_folder(key)
+        if(os.path.exists(folder)):
+            return
+
+        os.makedirs(os.path.dirname(folder), exist_ok=True)
+        temporary_folder = tempfile.mkdtemp(prefix=f'.{key}.', dir=os.path.dirname(folder))
+        try:
+            manifest = {'stage': stage, 'created': time.time(), 'artifacts': {}, 'metadata': metadata or {}}
+            size = 0
+            for name, path in artifacts.items():
+                cached_path = os.path.join(temporary_folder, name)
+                shutil.copy2(path, cached_path)
+                manifest['artifacts'][name] = {'size': os.path.getsize(cached_path), 'sha256': hash_file(cached_path)}
+                size += manifest['artifacts'][name]['size']
+
+            manifest_path = os.path.join(temporary_folder, MANIFEST_NAME)
+            with open(manifest_path, 'w') as manifest_file:
+                json.dump(manifest, manifest_file)
+            size += os.path.getsize(manifest_path)
+
+            os.rename(temporary_folder, folder)
+        except OSError:
+            #another worker stored the same entry first, or the copy failed, either way the temporary folder is dropped.
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+            return
+
+        with self.lock:
+            if(self.total_bytes != None):
+                self.total_bytes += size
+                if(self.total_bytes <= self.max_bytes):
+                    return
+        self.evict()
+
+    def restore(self, entry:CacheEntry, name:str, destination:str) -> str:
+        """
+        Copies a cached file to where the stage would have written it, unless an identical file is already there: one
+        with the size and the modification time of the cached file, as the copies keep it, so it is never hashed.
+
+        Parameters:
+            entry: the cache entry.
+            name: the name of the file in the entry.
+            destination: the path the file is copied to.
+
+        Returns:
+            the destination path.
+        """
+        cached_path = os.path.join(entry.folder, name)
+        try:
+            cached, existing = os.stat(cached_path), os.stat(destination)
+            if(existing.st_size == entry.artifacts[name]['size'] and existing.st_mtime_ns == cached.st_mtime_ns):
+                return destination
+        except FileNotFoundError:
+            pass
+
+        with atomic_path(destination) as temporary_path:
+            shutil.copy2(cached_path, temporary_path)
+        return destination
+
+    def remove(self, key:str) -> None:
+        """
+        Removes an entry.
+
+        Parameters:
+            key: the key of the entry.
+
+        Returns:
+            None
+        """
+        shutil.rmtree(self.entry_folder(key), ignore_errors=True)
+
+    def invalidate(self, stage:Optional[str] = None) -> int:
+        """
+        Removes the entries of a stage, or all the entries.
+
+        Parameters:
+            stage [optional]: the name of the stage whose entries are removed, all entries are removed if it is not given.
+
+        Returns:
+            the number of removed entries.
+        """
+        removed = 0
+        for key, folder, _, _ in self.entries():
+            if(stage == None or self.entry_stage(folder) == stage):
+                self.remove(key)
+                removed += 1
+        with self.lock:
+            self.total_bytes = None
+        return removed
+
+    def evict(self) -> None:
+        """
+        Counts the size of the cache from its entries, which other workers may have added to, and removes the least
+        recently used entries until it is no larger than evict_to of max_bytes, if it is larger than max_bytes.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self.lock:
+            entries = list(self.entries())
+            total = sum(size for _, _, size, _ in entries)
+            if(total > self.max_bytes):
+                for key, _, size, _ in sorted(entries, key=lambda entry: entry[3]):
+                    self.remove(key)
+                    total -= size
+                    print(f"CACHE :: evicted the entry {key} ({size} bytes)")
+                    if(total <= self.evict_to*self.max_bytes):
+                        break
+            self.total_bytes = total
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+    def entries(self):
+        """
+        Lists the entries of the cache.
+
+        Parameters:
+            None
+
+        Returns:
+            a generator of the key, folder, size in bytes and last use time of each entry.
+        """
+        for shard in os.scandir(self.cache_folder):
+            if(not shard.is_dir()):
+                continue
+            for entry in os.scandir(shard.path):
+                manifest_path = os.path.join(entry.path, MANIFEST_NAME)
+                if(entry.name.startswith('.') or not os.path.exists(manifest_path)):
+                    continue
+                try:
+                    size = sum(file.stat().st_size for file in os.scandir(entry.path))
+                    yield entry.name, entry.path, size, os.path.getmtime(manifest_path)
+                except OSError:
+                    #the entry was removed by another worker while it was being listed.
+                    continue
+
+    def entry_stage(self, folder:str) -> Optional[str]:
+        """
+        Reads the stage of an entry from its manifest.
+
+        Parameters:
+            folder: the folder of the entry.
+
+        Returns:
+            the name of the stage, or None if the manifest cannot be read.
+        """
+        try:
+            with open(os.path.join(folder, MANIFEST_NAME), 'r') as manifest_file:
+                return json.load(manifest_file)['stage']
+        except (OSError, ValueError):
+            return None
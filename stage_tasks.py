@@ -0,0 +1,196 @@
+import time
+import pickle
+import concurrent.futures
+import adaptive_concurrency
+import metrics
+from VideoFile import VideoFile
+from typing import Any, Callable, NamedTuple, Optional
+
+class StageTask(NamedTuple):
+    index: int
+    stage: str
+    inputs: dict[str,Any]
+    params: dict[str,Any]
+
+class StageResult(NamedTuple):
+    index: int
+    stage: str
+    updates: dict[str,Any]
+    error: Optional[BaseException]
+    duration: float
+
+# the VideoFile attributes that each stage reads, only these are sent to a worker process
+STAGE_INPUTS = {
+    'download': ('url',),
+    'extract_audio': ('url', 'title', 'filename', 'folder_name', 'video_path'),
+    'trim_audio': ('url', 'title', 'filename', 'folder_name', 'audio_path'),
+    'transcribe': ('url', 'title', 'filename', 'folder_name', 'audio_path', 'speech_map_path'),
+    'sentiment': ('url', 'title', 'filename', 'folder_name', 'text_path', 'subtitles'),
+    'translate': ('url', 'title', 'filename', 'folder_name', 'text_path', 'subtitles'),
+    'emotions': ('url', 'title', 'filename', 'folder_name', 'text_path', 'subtitles'),
+    'timeline': ('url', 'title', 'filename', 'folder_name', 'segments_path'),
+}
+
+# the VideoFile attributes that each stage sets, only these are sent back to be merged into the video of the parent
+STAGE_OUTPUTS = {
+    'download': ('title', 'filename', 'folder_name', 'video_path'),
+    'extract_audio': ('audio_path',),
+    'trim_audio': ('audio_path', 'speech_map_path'),
+    'transcribe': ('text_path', 'subtitles', 'segments_path', 'srt_path', 'vtt_path', 'timeline_path'),
+    'sentiment': ('sentiments_path', 'sentiment'),
+    'translate': ('translated_text_path', 'translated_text_paths'),
+    'emotions': ('emotions_path', 'emotions'),
+    'timeline': ('timeline_path',),
+}
+
+# the attribute whose value shows that a stage produced its output, a stage can swallow its error and leave it unset
+STAGE_PRODUCES = {
+    'download': 'video_path',
+    'extract_audio': 'audio_path',
+    'trim_audio': 'speech_map_path',
+    'transcribe': 'text_path',
+    'sentiment': 'sentiments_path',
+    'translate': 'translated_text_path',
+    'emotions': 'emotions_path',
+    'timeline': 'timeline_path',
+}
+
+# how each stage is called on the video rebuilt in the worker, with the parameters of the task
+STAGE_CALLS:dict[str,Callable[[VideoFile,dict[str,Any]],None]] = {
+    'download': lambda video, params: video.download_video(params['data_folder']),
+    #the samples of an audio only extraction would not come back from the worker, so the audio is always written to disk.
+    'extract_audio': lambda video, params: video.extract_audio(audio_only=params.get('audio_only', False), write_to_disk=True),
+    'trim_audio': lambda video, params: video.trim_audio(),
+    'transcribe': lambda video, params: video.transcribe_audio(timeline=params.get('timeline', False)),
+    'sentiment': lambda video, params: video.sentiment_analysis(),
+    'translate': lambda video, params: video.translate_text(params['lang_from'], params['lang_to'], params['lang_to_name']),
+    'emotions': lambda video, params: video.extract_emotions(),
+    'timeline': lambda video, params: video.analyse_timeline(),
+}
+
+# <-------------------------------- Task Descriptors ------------------------------->
+
+def make_task(video:VideoFile, index:int, stage:str, params:Optional[dict[str,Any]] = None) -> StageTask:
+    """
+    Describes a stage run on a video with only the paths and values the stage reads, instead of the whole VideoFile.
+
+    Parameters:
+        video: the VideoFile object.
+        index: the position of the video, to merge the result back into it.
+        stage: the name of the stage.
+        params [optional]: the parameters of the stage, like the languages of a translation.
+
+    Returns:
+        the task.
+    """
+    return StageTask(index, stage, {name: getattr(video, name) for name in STAGE_INPUTS[stage]}, params or {})
+
+def run_stage_task(task:StageTask) -> StageResult:
+    """
+    Runs a stage in a worker process on a video rebuilt from the task, and collects the attributes the stage set.
+
+    Parameters:
+        task: the task.
+
+    Returns:
+        the result of the task, with the error of the stage if it failed.
+    """
+    start = time.perf_counter()
+    video = VideoFile(task.inputs['url'])
+    for name, value in task.inputs.items():
+        setattr(video, name, value)
+
+    error = None
+    try:
+        STAGE_CALLS[task.stage](video, task.params)
+    except Exception as e:
+        error = picklable_error(e)
+
+    updates = {name: getattr(video, name) for name in STAGE_OUTPUTS[task.stage]}
+    return StageResult(task.index, task.stage, updates, error, time.perf_counter() - start)
+
+def run_stage_tasks(tasks:list[StageTask]) -> list[StageResult]:
+    """
+    Runs a chunk of tasks in a worker process, so a chunk is sent and returned in one round trip.
+
+    Parameters:
+        tasks: the tasks of the chunk.
+
+    Returns:
+        the result of each task, in order.
+    """
+    return [run_stage_task(task) for task in tasks]
+
+def default_chunksize(task_count:int, workers:int) -> int:
+    """
+    Picks the number of tasks sent to a worker at a time: about four chunks per worker, so the round trips are few
+    while a slow chunk at the end does not hold back the whole run.
+
+    Parameters:
+        task_count: the number of tasks.
+        workers: the number of worker processes.
+
+    Returns:
+        the chunk size.
+    """
+    return max(1, task_count // (4*max(1, workers)))
+
+def default_pool_size(stage:str, task_count:int) -> int:
+    """
+    Picks the number of worker processes of a stage when it is not given: no more than the tasks, and no more than the
+    limiter of the stage ever lets run at one time, the number of cores for the CPU bound stages.
+
+    Parameters:
+        stage: the name of the stage.
+        task_count: the number of tasks.
+
+    Returns:
+        the number of worker processes.
+    """
+    return max(1, min(task_count, adaptive_concurrency.get_limiter(stage).max_limit))
+
+def apply_stage_result(video:VideoFile, result:StageResult) -> None:
+    """
+    Merges the result of a stage that ran in a worker process into the video, and records its duration and outcome in
+    the metrics of this process.
+
+    Parameters:
+        video: the VideoFile object the task was made from.
+        result: the result of the task.
+
+    Returns:
+        None
+    """
+    video.apply_result(result.updates)
+    metrics.observe_remote_stage(result.stage, result.duration, result.error == None)
+
+def remote_stage(stage:str, executor:concurrent.futures.Executor, params:Optional[dict[str,Any]] = None) -> Callable[[VideoFile],None]:
+    """
+    Wraps a stage so that calling it on a video runs the stage in a pool of processes and merges the result into the
+    video, for the threads of a pipeline stage to hand their work to processes.
+
+    Parameters:
+        stage: the name of the stage.
+        executor: the pool of processes.
+        params [optional]: the parameters of the stage.
+
+    Returns:
+        a function that runs the stage on a video, raising the error of the stage if it failed.
+    """
+    def run(video:VideoFile) -> None:
+        result = executor.submit(run_stage_task, make_task(video, 0, stage, params)).result()
+        apply_stage_result(video, result)
+        if(result.error != None):
+            raise result.error
+
+    return run
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+def picklable_error(error:BaseException) -> BaseException:
+    #an exception that cannot be pickled would break the pool, so it is sent back as a message.
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f'{type(error).__name__}: {error}')
@@ -0,0 +1,155 @@
+import json
+from artifact_store import partial_open, partial_path
+from transcription import TranscriptSegment
+from typing import ContextManager, Iterable, Iterator, Optional, TextIO
+
+# the longest subtitle, about two lines on screen
+MAX_CUE_CHARS = 84
+
+# <-------------------------------- Subtitle Cues ------------------------------->
+
+def format_timestamp(seconds:float, decimal_separator:str = ',') -> str:
+    """
+    Formats a time as the timestamp of a subtitle, HH:MM:SS,mmm for SubRip and HH:MM:SS.mmm for WebVTT.
+
+    Parameters:
+        seconds: the time in seconds.
+        decimal_separator: ',' for SubRip, '.' for WebVTT.
+
+    Returns:
+        the timestamp.
+    """
+    milliseconds = max(0, int(round(seconds * 1000)))
+    hours, milliseconds = divmod(milliseconds, 3600*1000)
+    minutes, milliseconds = divmod(milliseconds, 60*1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}{decimal_separator}{milliseconds:03d}'
+
+def split_cues(segment:TranscriptSegment, max_chars:int = MAX_CUE_CHARS) -> list[TranscriptSegment]:
+    """
+    Splits the text of a segment into subtitles short enough to be read on screen. The recognizer gives no timing of
+    the words, so the time of the segment is shared between its subtitles by the length of their text.
+
+    Parameters:
+        segment: the transcribed segment.
+        max_chars: the longest subtitle.
+
+    Returns:
+        the subtitles of the segment, in order, none if the segment has no text.
+    """
+    lines:list[str] = []
+    for word in segment.text.split():
+        if(len(lines) > 0 and len(lines[-1]) + 1 + len(word) <= max_chars):
+            lines[-1] += ' ' + word
+        else:
+            lines.append(word)
+
+    total = sum(len(line) for line in lines)
+    cues = []
+    position = 0
+    for line in lines:
+        start = segment.start + (segment.end - segment.start) * position / total
+        position += len(line)
+        end = segment.start + (segment.end - segment.start) * position / total
+        cues.append(TranscriptSegment(segment.index, start, end, line))
+    return cues
+
+# <-------------------------------- Incremental Writers ------------------------------->
+
+class SubtitleWriter:
+
+    def __init__(self, path:str) -> None:
+        """
+        Initialises a writer of a subtitle file that is written a cue at a time and flushed after every segment, so a
+        player or another process can follow the subtitles of a long video in <path>.partial (partial_path) before it
+        is fully transcribed. The file is renamed into place once the transcription completes. The format is picked
+        from the extension of the file, .srt (SubRip) or .vtt (WebVTT).
+
+        Parameters:
+            path: the path of the subtitle file.
+
+        Returns:
+            None
+        """
+        if(not path.endswith(('.srt', '.vtt'))):
+            raise ValueError(f'Subtitles are written to .srt or .vtt files, not {path}')
+        self.path:str = path
+        self.is_vtt:bool = path.endswith('.vtt')
+        self.partial_path:str = partial_path(path)
+        self.writing:Optional[ContextManager[TextIO]] = None
+        self.file:Optional[TextIO] = None
+        self.cue_count:int = 0
+
+    def __enter__(self) -> 'SubtitleWriter':
+        self.writing = partial_open(self.path, 'w', encoding='utf-8')
+        self.file = self.writing.__enter__()
+        if(self.is_vtt):
+            self.file.write('WEBVTT\n\n')
+        return self
+
+    def __exit__(self, *exc) -> None:
+        #an interrupted transcription drops its temporary file instead of leaving partial subtitles in place.
+        self.writing.__exit__(*exc)
+
+    def write(self, cues:Iterable[TranscriptSegment]) -> None:
+        """
+        Appends subtitles to the file.
+
+        Parameters:
+            cues: the subtitles, with their times on the timeline of the video.
+
+        Returns:
+            None
+        """
+        separator = '.' if self.is_vtt else ','
+        for cue in cues:
+            self.cue_count += 1
+            #WebVTT cues need no number, it is kept as their identifier so both files number the cues the same way.
+            self.file.write(f'{self.cue_count}\n{format_timestamp(cue.start, separator)} --> {format_timestamp(cue.end, separator)}\n{cue.text}\n\n')
+        self.file.flush()
+
+class SegmentWriter:
+
+    def __init__(self, path:str) -> None:
+        """
+        Initialises a writer of the transcribed segments as JSON Lines, one segment per line, flushed as each segment
+        is written, so the text subtasks can read the segments of a video as a stream. Like the subtitles, the file is
+        written to <path>.partial and renamed into place once it is complete.
+
+        Parameters:
+            path: the path of the .jsonl file.
+
+        Returns:
+            None
+        """
+        self.path:str = path
+        self.partial_path:str = partial_path(path)
+        self.writing:Optional[ContextManager[TextIO]] = None
+        self.file:Optional[TextIO] = None
+
+    def __enter__(self) -> 'SegmentWriter':
+        self.writing = partial_open(self.path, 'w', encoding='utf-8')
+        self.file = self.writing.__enter__()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.writing.__exit__(*exc)
+
+    def write(self, segment:TranscriptSegment) -> None:
+        self.file.write(json.dumps(segment._asdict()) + '\n')
+        self.file.flush()
+
+def read_segments(path:str) -> Iterator[TranscriptSegment]:
+    """
+    Reads the segments written by a SegmentWriter, a line at a time.
+
+    Parameters:
+        path: the path of the .jsonl file.
+
+    Returns:
+        a generator of the segments, in order.
+    """
+    with open(path, 'r', encoding='utf-8') as segments_file:
+        for line in segments_file:
+            if(line.strip() != ''):
+                yield TranscriptSegment(**json.loads(line))
@@ -0,0 +1,88 @@
+import time
+import pytest
+import stage_tasks
+from VideoFile import VideoFile
+from distributed_executions import TaskQueue, enqueue_videos, run_local_workers, configure_services, DONE, FAILED, BLOCKED
+
+STAGES = ('download', 'extract_audio', 'transcribe')
+
+@pytest.fixture
+def services(tmp_path):
+    previous = (VideoFile.transcriber, VideoFile.translator)
+    server = configure_services(True, str(tmp_path / 'fixtures'), 0.01)
+    yield tmp_path
+    server.stop()
+    VideoFile.video_source = None
+    VideoFile.transcriber, VideoFile.translator = previous
+
+def fake_videos(count:int) -> list[VideoFile]:
+    return [VideoFile(f'https://www.youtube.com/watch?v=node{index:07d}') for index in range(count)]
+
+def statuses(queue:TaskQueue) -> dict[str,int]:
+    counts:dict[str,int] = {}
+    for stage_statuses in queue.summary().values():
+        for status, count in stage_statuses.items():
+            counts[status] = counts.get(status, 0) + count
+    return counts
+
+def test_local_workers_run_every_stage_of_every_video(services):
+    path = str(services / 'tasks.sqlite')
+    queue = TaskQueue(path)
+    assert enqueue_videos(queue, fake_videos(4), str(services / 'data'), STAGES) == 12
+
+    run_local_workers(path, 2, lease_seconds=5, poll_seconds=0.05)
+
+    assert statuses(queue) == {DONE: 12}
+    assert sum(queue.worker_summary().values()) == 12
+    video = fake_videos(1)[0]
+    queue.restore(video)
+    assert video.text_path != None and video.srt_path != None
+
+def test_expired_lease_is_leased_again_and_the_late_worker_cannot_complete(services):
+    path = str(services / 'tasks.sqlite')
+    queue = TaskQueue(path, retry_seconds=0.0)
+    enqueue_videos(queue, fake_videos(1), str(services / 'data'), STAGES)
+
+    #the first worker leases the download and stops beating, as a worker whose node went away.
+    lost = queue.lease('lost-worker', 0.05)
+    assert lost.stage == 'download'
+    time.sleep(0.1)
+
+    #the expired lease goes back to the queue when the next worker asks for a task, and the same task is handed out.
+    task = queue.lease('second-worker', 5)
+    assert task.index == lost.index
+    assert not queue.heartbeat(lost.index, 'lost-worker', 5)
+
+    result = stage_tasks.run_stage_task(task)
+    assert result.error == None
+    #the late worker comes back with its result after the task went to another worker, and it is not recorded.
+    assert not queue.complete(lost.index, 'lost-worker', result.updates)
+    assert not queue.fail(lost.index, 'lost-worker', 'too late')
+    assert queue.complete(task.index, 'second-worker', result.updates)
+
+    #the worker processes pick up the stages that depend on the download.
+    run_local_workers(path, 2, lease_seconds=5, poll_seconds=0.05)
+    assert statuses(queue) == {DONE: 3}
+
+def test_failed_attempts_are_retried_then_block_the_stages_that_depend_on_them(services):
+    path = str(services / 'tasks.sqlite')
+    queue = TaskQueue(path, max_attempts=2, retry_seconds=0.0)
+    enqueue_videos(queue, fake_videos(2), str(services / 'data'), STAGES)
+
+    #the download of the first video fails on every attempt.
+    first = queue.lease('worker', 5)
+    assert queue.fail(first.index, 'worker', 'HTTPError: 503')
+    retry = queue.lease('worker', 5)
+    assert retry.index == first.index
+    assert queue.fail(retry.index, 'worker', 'HTTPError: 503')
+
+    summary = queue.summary()
+    assert summary['download'][FAILED] == 1
+    assert summary['extract_audio'][BLOCKED] == 1
+    assert summary['transcribe'][BLOCKED] == 1
+    assert queue.failures() == [('https://www.youtube.com/watch?v=node0000000', 'download', 'HTTPError: 503')]
+
+    #the other video is not held back by the failure, and the workers stop once only blocked tasks are left.
+    run_local_workers(path, 2, lease_seconds=5, poll_seconds=0.05)
+    assert statuses(queue) == {DONE: 3, FAILED: 1, BLOCKED: 2}
+    assert queue.is_finished()
@@ -0,0 +1,72 @@
+import os
+import pytest
+from transcription import TranscriptSegment
+from subtitles import format_timestamp, split_cues, SubtitleWriter, SegmentWriter, read_segments
+
+def test_format_timestamp_rounds_to_milliseconds_and_carries_into_hours():
+    assert format_timestamp(0) == '00:00:00,000'
+    assert format_timestamp(3.2) == '00:00:03,200'
+    assert format_timestamp(59.9996) == '00:01:00,000'
+    assert format_timestamp(3725.5, '.') == '01:02:05.500'
+    #a time placed before the start of the video by rounding is shown as the start.
+    assert format_timestamp(-0.01) == '00:00:00,000'
+
+def test_split_cues_shares_the_time_of_the_segment_by_the_length_of_the_text():
+    segment = TranscriptSegment(3, 10.0, 16.0, 'aaaa bbbb cccc dddd eeee ffff')
+    cues = split_cues(segment, max_chars=9)
+
+    assert [cue.text for cue in cues] == ['aaaa bbbb', 'cccc dddd', 'eeee ffff']
+    assert [cue.index for cue in cues] == [3, 3, 3]
+    assert [(cue.start, cue.end) for cue in cues] == [pytest.approx((10.0, 12.0)), pytest.approx((12.0, 14.0)), pytest.approx((14.0, 16.0))]
+
+def test_split_cues_keeps_a_short_segment_whole_and_drops_an_empty_one():
+    segment = TranscriptSegment(0, 1.5, 4.0, '  hello   there ')
+    assert split_cues(segment) == [TranscriptSegment(0, 1.5, 4.0, 'hello there')]
+    assert split_cues(TranscriptSegment(1, 4.0, 6.0, '   ')) == []
+
+def test_a_word_longer_than_a_cue_gets_a_cue_of_its_own():
+    cues = split_cues(TranscriptSegment(0, 0.0, 3.0, 'a ' + 'x'*20 + ' b'), max_chars=10)
+    assert [cue.text for cue in cues] == ['a', 'x'*20, 'b']
+    assert cues[-1].end == pytest.approx(3.0)
+
+def test_subtitle_writer_writes_numbered_srt_and_vtt_cues(tmp_path):
+    cues = [TranscriptSegment(0, 0.0, 1.25, 'first line'), TranscriptSegment(1, 61.5, 63.0, 'second line')]
+    srt_path, vtt_path = str(tmp_path / 'video.srt'), str(tmp_path / 'video.vtt')
+    with SubtitleWriter(srt_path) as srt, SubtitleWriter(vtt_path) as vtt:
+        srt.write(cues[:1])
+        vtt.write(cues[:1])
+        #the cues are readable in the partial file while the transcription goes on.
+        assert not os.path.exists(srt_path)
+        with open(srt.partial_path, 'r', encoding='utf-8') as partial_file:
+            assert partial_file.read() == '1\n00:00:00,000 --> 00:00:01,250\nfirst line\n\n'
+        srt.write(cues[1:])
+        vtt.write(cues[1:])
+
+    with open(srt_path, 'r', encoding='utf-8') as srt_file:
+        assert srt_file.read() == ('1\n00:00:00,000 --> 00:00:01,250\nfirst line\n\n'
+                                   '2\n00:01:01,500 --> 00:01:03,000\nsecond line\n\n')
+    with open(vtt_path, 'r', encoding='utf-8') as vtt_file:
+        assert vtt_file.read() == ('WEBVTT\n\n'
+                                   '1\n00:00:00.000 --> 00:00:01.250\nfirst line\n\n'
+                                   '2\n00:01:01.500 --> 00:01:03.000\nsecond line\n\n')
+    assert not os.path.exists(srt_path + '.partial')
+
+def test_interrupted_writers_leave_no_file_behind(tmp_path):
+    srt_path, segments_path = str(tmp_path / 'video.srt'), str(tmp_path / 'video.jsonl')
+    with pytest.raises(RuntimeError):
+        with SubtitleWriter(srt_path) as srt, SegmentWriter(segments_path) as segments:
+            srt.write([TranscriptSegment(0, 0.0, 1.0, 'cut short')])
+            segments.write(TranscriptSegment(0, 0.0, 1.0, 'cut short'))
+            raise RuntimeError('the transcription failed')
+    assert os.listdir(tmp_path) == []
+
+    with pytest.raises(ValueError):
+        SubtitleWriter(str(tmp_path / 'video.txt'))
+
+def test_segments_are_read_back_as_written(tmp_path):
+    path = str(tmp_path / 'video.jsonl')
+    segments = [TranscriptSegment(0, 0.0, 2.5, 'one'), TranscriptSegment(1, 2.5, 5.0, 'two')]
+    with SegmentWriter(path) as writer:
+        for segment in segments:
+            writer.write(segment)
+    assert list(read_segments(path)) == segments
@@ -0,0 +1,92 @@
+import os
+import multiprocessing
+from transcript_store import TranscriptStore
+
+def open_descriptors() -> int:
+    return len(os.listdir('/proc/self/fd'))
+
+def test_interleaved_puts_and_gets_keep_one_mapping(tmp_path):
+    store = TranscriptStore(str(tmp_path / 'transcripts.arena'))
+    descriptors = open_descriptors()
+    mappings = set()
+    for index in range(2000):
+        text = f'transcript {index} ' * 500
+        store.put(f'video_{index}.txt', text)
+        assert store.get(f'video_{index}.txt') == text
+        mappings.add(id(store.mapping))
+
+    #the arena is grown by doubling, so it is mapped again a handful of times, and each old mapping is closed: the
+    #store holds its own descriptor and the one the mapping duplicates.
+    assert len(mappings) < 20
+    assert open_descriptors() <= descriptors + 2
+    assert store.get('video_7.txt') == 'transcript 7 ' * 500
+    store.close()
+
+def test_repeated_puts_are_not_appended_and_compact_drops_replaced_records(tmp_path):
+    path = str(tmp_path / 'transcripts.arena')
+    store = TranscriptStore(path)
+    for _ in range(10):
+        store.put('video.txt', 'the same transcript')
+    store.put('other.txt', 'a first transcript')
+    store.put('other.txt', 'a second transcript')
+    used = store.used_length()
+    store.compact()
+
+    assert store.used_length() < used
+    assert store.get('video.txt') == 'the same transcript'
+    assert store.get('other.txt') == 'a second transcript'
+
+    #another process, or the next run, sees the compacted records.
+    assert TranscriptStore(path).get('other.txt') == 'a second transcript'
+    store.reset()
+    assert store.get('video.txt') == None
+    store.close()
+
+def grow_arena(path:str, count:int) -> None:
+    store = TranscriptStore(path)
+    for index in range(count):
+        store.put(f'video_{index}.txt', f'transcript {index} ' * (100 + index))
+    store.close()
+
+def test_reader_sees_whole_records_while_another_process_grows_the_arena(tmp_path):
+    path = str(tmp_path / 'transcripts.arena')
+    reader = TranscriptStore(path)
+    reader.put('first.txt', 'a first transcript')
+    count = 3000
+    writer = multiprocessing.get_context('fork').Process(target=grow_arena, args=(path, count))
+    writer.start()
+    #the reader keeps refreshing while the writer grows the file past the size it mapped.
+    while writer.is_alive():
+        for index in range(0, count, 97):
+            text = reader.get(f'video_{index}.txt')
+            assert text == None or text == f'transcript {index} ' * (100 + index)
+    writer.join()
+    assert writer.exitcode == 0
+
+    for index in range(count):
+        assert reader.get(f'video_{index}.txt') == f'transcript {index} ' * (100 + index)
+    assert all(key == 'first.txt' or key.startswith('video_') for key in reader.index)
+    reader.close()
+
+def test_reader_does_not_index_a_record_cut_off_by_its_mapping(tmp_path, monkeypatch):
+    path = str(tmp_path / 'transcripts.arena')
+    reader = TranscriptStore(path)
+    reader.put('first.txt', 'a first transcript')
+    size = os.fstat(reader.file_descriptor).st_size
+    text = 'a transcript longer than the arena ' * (size // 20)
+
+    #the other process grows the arena and appends a record right after the reader looked up the size of the file.
+    fstat = os.fstat
+    def fstat_then_grow(file_descriptor):
+        result = fstat(file_descriptor)
+        monkeypatch.setattr(os, 'fstat', fstat)
+        writer = multiprocessing.get_context('fork').Process(target=TranscriptStore(path).put, args=('grown.txt', text))
+        writer.start()
+        writer.join()
+        return result
+    monkeypatch.setattr(os, 'fstat', fstat_then_grow)
+
+    assert reader.get('grown.txt') in (None, text)
+    assert reader.get('grown.txt') == text
+    assert sorted(reader.index) == ['first.txt', 'grown.txt']
+    reader.close()
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from voice_activity import detect_speech, trim_silence, TimestampMap, FRAME_SECONDS, GAP_SECONDS
+
+SAMPLE_RATE = 16000
+
+def tone_and_silence(*parts:tuple[str,float]) -> np.ndarray:
+    #a 440 Hz tone stands in for speech, between runs of digital silence.
+    pieces = []
+    for kind, seconds in parts:
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        pieces.append(8000*np.sin(2*np.pi*440*t) if kind == 'tone' else np.zeros(len(t)))
+    return np.concatenate(pieces).astype(np.int16)
+
+def seconds(regions:list[tuple[int,int]]) -> list[tuple[float,float]]:
+    return [(start / SAMPLE_RATE, end / SAMPLE_RATE) for start, end in regions]
+
+def test_detect_speech_finds_the_tones_with_their_padding():
+    samples = tone_and_silence(('silence', 1.0), ('tone', 1.0), ('silence', 2.0), ('tone', 0.5), ('silence', 1.0))
+    regions = seconds(detect_speech(samples, SAMPLE_RATE, padding_seconds=0.2))
+
+    #the edges fall on frames, so they are placed within a frame of the tone padded by 0.2 seconds.
+    assert len(regions) == 2
+    assert regions[0] == pytest.approx((0.8, 2.2), abs=FRAME_SECONDS)
+    assert regions[1] == pytest.approx((3.8, 4.7), abs=FRAME_SECONDS)
+
+def test_detect_speech_keeps_short_pauses_and_drops_short_bursts():
+    samples = tone_and_silence(('silence', 1.0), ('tone', 0.6), ('silence', 0.2), ('tone', 0.6), ('silence', 1.0),
+                               ('tone', 0.1), ('silence', 1.0))
+    regions = seconds(detect_speech(samples, SAMPLE_RATE, padding_seconds=0.0, min_speech_seconds=0.25, min_silence_seconds=0.4))
+
+    assert len(regions) == 1
+    assert regions[0] == pytest.approx((1.0, 2.4), abs=FRAME_SECONDS)
+
+def test_detect_speech_of_silence_or_nothing_finds_no_region():
+    assert detect_speech(tone_and_silence(('silence', 2.0)), SAMPLE_RATE) == []
+    assert detect_speech(np.zeros(0, dtype=np.int16), SAMPLE_RATE) == []
+
+def test_trim_silence_keeps_the_regions_with_a_gap_and_maps_times_back(tmp_path):
+    samples = tone_and_silence(('silence', 1.0), ('tone', 1.0), ('silence', 2.0), ('tone', 0.5), ('silence', 1.0))
+    regions = detect_speech(samples, SAMPLE_RATE)
+    trimmed, timestamps = trim_silence(samples, SAMPLE_RATE)
+
+    (first_start, first_end), (second_start, second_end) = regions
+    gap = int(GAP_SECONDS * SAMPLE_RATE)
+    assert len(trimmed) == (first_end - first_start) + gap + (second_end - second_start)
+    assert np.array_equal(trimmed[:first_end - first_start], samples[first_start:first_end])
+    assert not trimmed[first_end - first_start:first_end - first_start + gap].any()
+    assert timestamps.original_seconds == pytest.approx(5.5)
+    assert timestamps.kept_seconds == pytest.approx((len(trimmed) - gap) / SAMPLE_RATE)
+
+    #the start of each region of the trimmed audio is the start of the region in the original audio.
+    first_length = (first_end - first_start) / SAMPLE_RATE
+    second_trimmed_start = (first_end - first_start + gap) / SAMPLE_RATE
+    assert timestamps.to_original(0.0) == pytest.approx(first_start / SAMPLE_RATE)
+    assert timestamps.to_original(0.5) == pytest.approx(first_start / SAMPLE_RATE + 0.5)
+    assert timestamps.to_original(second_trimmed_start) == pytest.approx(second_start / SAMPLE_RATE)
+    assert timestamps.to_original(second_trimmed_start + 0.3) == pytest.approx(second_start / SAMPLE_RATE + 0.3)
+
+    #a time inside the gap is placed at the end of the region before it, never inside the silence that was dropped.
+    assert timestamps.to_original(first_length + GAP_SECONDS / 2) == pytest.approx(first_end / SAMPLE_RATE)
+
+    path = str(tmp_path / 'speech_map.json')
+    timestamps.save(path)
+    loaded = TimestampMap.load(path)
+    assert loaded.regions == timestamps.regions
+    assert loaded.to_original(second_trimmed_start + 0.3) == pytest.approx(timestamps.to_original(second_trimmed_start + 0.3))
+
+def test_trim_silence_of_silence_is_empty_and_keeps_times():
+    trimmed, timestamps = trim_silence(tone_and_silence(('silence', 1.0)), SAMPLE_RATE)
+    assert len(trimmed) == 0
+    assert timestamps.to_original(0.4) == 0.4
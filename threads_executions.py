@@ -1,40 +1,123 @@
 import time
 import threading
+import concurrent.futures
 from VideoFile import VideoFile
-from typing import Callable, Optional
+from translation import TranslationEngine
+import metrics
+import adaptive_concurrency
+from metrics import instrument_runner
+from typing import Any, Callable, NamedTuple, Optional
+
+# the types of stage, downloads, transcriptions and translations wait on the network while audio extraction, sentiment
+# analysis and emotion extraction keep a core busy. Unless the number of threads is set by hand, the concurrency of each
+# stage is tuned at runtime by its adaptive limiter, within the bounds of its type.
+IO_BOUND = 'io'
+CPU_BOUND = 'cpu'
+
+#the executors are shared between calls so their threads are reused instead of being created for every video.
+_shared_executors:dict[tuple[str,int],concurrent.futures.ThreadPoolExecutor] = {}
+_shared_executors_lock = threading.Lock()
+
+class TaskResult(NamedTuple):
+    video: VideoFile
+    result: Any
+    error: Optional[BaseException]
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+def get_shared_executor(stage_type:str, max_workers:int) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Returns the executor of a stage type with the given number of workers, creating it on first use.
+
+    Parameters:
+        stage_type: IO_BOUND or CPU_BOUND.
+        max_workers: the number of threads of the executor.
+
+    Returns:
+        the shared ThreadPoolExecutor.
+    """
+    with _shared_executors_lock:
+        executor = _shared_executors.get((stage_type,max_workers))
+        if(executor == None):
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{stage_type}-worker')
+            _shared_executors[(stage_type,max_workers)] = executor
+        return executor
+
+def shutdown_shared_executors() -> None:
+    """
+    Shuts down all the shared executors, waiting for their running tasks to finish.
+
+    Parameters:
+        None
 
-# <-------------------------------- Helper Function ------------------------------->
+    Returns:
+        None
+    """
+    with _shared_executors_lock:
+        for executor in _shared_executors.values():
+            executor.shutdown(wait=True)
+        _shared_executors.clear()
 
-def parallel_downloader_helper(videos:list[VideoFile],thread_builder:Callable[[VideoFile,int],threading.Thread],descriptive_text:str) -> None:
+def parallel_executor_helper(videos:list[VideoFile], task:Callable[[VideoFile,int],Any], stage:str, descriptive_text:str, stage_type:str, max_no_of_threads:Optional[int] = None) -> list[TaskResult]:
     """
-    A helper function that creates threads/process for each video and joins them.
+    A helper function that runs a task on each video using the shared executor of the stage type and waits for them.
+    At most twice as many videos as there are workers are submitted at a time, so the number of pending tasks stays bounded.
+    When the number of threads is not set, the executor has as many workers as the stage may ever use and the adaptive
+    limiter of the stage decides how many of them run the task at one time, from the latency and the failures of the tasks.
 
     Parameters:
         videos: the array of VideoFile objects
-        thread_builder: a function that is passed that is called to get a customised thread.
+        task: a function that is called with each video and its index.
+        stage: the name of the stage, which names its limiter, so the translations into every language share one.
         descriptive_text: to print out the specific functionality of the function that calls this helper function.
+        stage_type: IO_BOUND or CPU_BOUND, which sets the bounds of the limiter.
+        max_no_of_threads [optional]: to fix the number of threads that could execute the task at one time.
     
     Returns:
-        None
+        the result or the exception of the task for each video, in the order of the videos.
     """
 
-    threads=[]
+    limiter = None
+    if(max_no_of_threads == None):
+        limiter = adaptive_concurrency.get_limiter(stage, stage_type == CPU_BOUND)
+        max_no_of_threads = limiter.max_limit
+
+    executor = get_shared_executor(stage_type, max_no_of_threads)
+    submission_slots = threading.BoundedSemaphore(2*max_no_of_threads)
+
+    #records how long each video waits for a free worker and a place under the limit, on top of the timings of the stage method itself.
+    def timed_task(video:VideoFile, i:int, submitted:float) -> Any:
+        if(limiter == None):
+            metrics.observe_queue_wait(stage, time.perf_counter()-submitted)
+            return task(video,i)
+        with limiter:
+            metrics.observe_queue_wait(stage, time.perf_counter()-submitted)
+            return task(video,i)
+
+    futures=[]
     start=time.perf_counter()
     for i,video in enumerate(videos):
-        thread = thread_builder(video,i)
-        threads.append(thread)
-        thread.start()
-   
-    # Wait for all threads to finish
-    for thread in threads:
-        thread.join()
+        submission_slots.acquire()
+        future = executor.submit(timed_task,video,i,time.perf_counter())
+        future.add_done_callback(lambda _: submission_slots.release())
+        futures.append(future)
+
+    # Wait for all tasks to finish
+    results=[]
+    for video,future in zip(videos,futures):
+        error = future.exception()
+        results.append(TaskResult(video, None if error != None else future.result(), error))
 
     end=time.perf_counter()
-    print(f'Time took to {descriptive_text} the videos in parallel [threads]: {round(end-start,2)} second(s)')
+    failed = sum(1 for result in results if result.error != None)
+    concurrency = f', concurrency {limiter.current_limit}' if limiter != None else ''
+    print(f'Time took to {descriptive_text} the videos in parallel [threads]: {round(end-start,2)} second(s), {failed} failed{concurrency}')
+    return results
 
 # <-------------------------------- Parallel Downloading Functions ------------------------------->
 
-def parallel_video_downloader(videos:list[VideoFile], data_folder:str, max_no_of_threads:Optional[int] = None) -> None:
+@instrument_runner('threads')
+def parallel_video_downloader(videos:list[VideoFile], data_folder:str, max_no_of_threads:Optional[int] = None) -> list[TaskResult]:
     """
     Downloads an array of videos provided, using threads.
 
@@ -44,23 +127,13 @@ def parallel_video_downloader(videos:list[VideoFile], data_folder:str, max_no_of
         max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
     
     Returns:
-        None    
+        the result or the exception of the download of each video.
     """
 
-    #if the max_no_of_threads are not defined, it is creates as many threads as there are videos in the array.
-    if(max_no_of_threads == None):
-        max_no_of_threads = len(videos)
-
-    semaphore = threading.Semaphore(max_no_of_threads)
-
-    def thread_builder(video: VideoFile,_) -> threading.Thread:
-        thread = threading.Thread(target=video.download_video,args=(data_folder,semaphore))
-        return thread
-
-    #calling the helper function by passing it the thread_builder function.
-    parallel_downloader_helper(videos,thread_builder,'download')
+    return parallel_executor_helper(videos, lambda video,_: video.download_video(data_folder), 'download', 'download', IO_BOUND, max_no_of_threads)
 
-def parallel_video_downloader_and_logger(videos: list[VideoFile], filename: str, data_folder: str) -> None:
+@instrument_runner('threads')
+def parallel_video_downloader_and_logger(videos: list[VideoFile], filename: str, data_folder: str, max_no_of_threads:Optional[int] = None) -> list[TaskResult]:
     """
     Downloads an array of videos provided, using threads and logs the details in the logger file.
 
@@ -68,23 +141,22 @@ def parallel_video_downloader_and_logger(videos: list[VideoFile], filename: str,
         videos: the array of VideoFile objects
         filename: the path of the logger file
         data_folder: the folder name where all videos are to be downloaded.
+        max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
     
     Returns:
-        None
+        the result or the exception of the download of each video.
     """
 
-    #using a mutex instead of a sempahore since only one thread should be able to access the logger file at a time.
-    lock = threading.Lock()
-   
-    def thread_builder(video: VideoFile,index):
-        thread = threading.Thread(target=video.download_video_and_log,args=(filename,data_folder, lock,index))
-        return thread
+    #the log records are appended by the writer thread of the log file, so the downloads do not wait for each other.
+    def task(video: VideoFile,index:int) -> None:
+        video.download_video_and_log(filename,data_folder,index)
 
-    parallel_downloader_helper(videos,thread_builder,'download and log')
+    return parallel_executor_helper(videos,task,'download','download and log',IO_BOUND,max_no_of_threads)
 
 # <-------------------------------- Parallel Analysis Functions ------------------------------->
 
-def parallel_audio_extractor(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> None:
+@instrument_runner('threads')
+def parallel_audio_extractor(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
     """
     Extracts the audios of all VideoFile objects using threads for parallelism.
 
@@ -93,47 +165,48 @@ def parallel_audio_extractor(videos: list[VideoFile], max_no_of_threads: Optiona
         max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
 
     Returns:
-        None    
+        the result or the exception of the extraction of each video.
     """
 
-    if(max_no_of_threads == None):
-        max_no_of_threads = len(videos)
+    return parallel_executor_helper(videos, lambda video,_: video.extract_audio(), 'extract_audio', 'extract audio from', CPU_BOUND, max_no_of_threads)
+
 
-    semaphore = threading.Semaphore(max_no_of_threads)
 
-    def thread_builder(video: VideoFile,_) -> threading.Thread:
-        thread = threading.Thread(target=video.extract_audio,args=[semaphore])
-        return thread
+@instrument_runner('threads')
+def parallel_silence_trimmer(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Drops the parts of the extracted audios without speech, before they are transcribed, using threads for parallelism.
 
-    parallel_downloader_helper(videos,thread_builder,'extract audio from')
+    Parameters:
+        videos: the array of VideoFile objects
+        max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
 
+    Returns:
+        the result or the exception of the trimming of each video.
+    """
 
+    return parallel_executor_helper(videos, lambda video,_: video.trim_audio(), 'trim_audio', 'trim silences from', CPU_BOUND, max_no_of_threads)
 
-def parallel_audio_transcriber(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> None:
+@instrument_runner('threads')
+def parallel_audio_transcriber(videos: list[VideoFile], max_no_of_threads: Optional[int] = None, timeline:bool = False) -> list[TaskResult]:
     """
     Transcribes the audios of all VideoFile objects using threads for parallelism.
 
     Parameters:
         videos: the array of VideoFile objects.
         max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
+        timeline [optional]: whether the timeline of each video is scored from its segments as they are transcribed.
 
     Returns:
-        None    
+        the result or the exception of the transcription of each video.
     """
-    if(max_no_of_threads == None):
-        max_no_of_threads = len(videos)
 
-    semaphore = threading.Semaphore(max_no_of_threads)
-    
-    def thread_builder(video: VideoFile,_):
-        thread = threading.Thread(target=video.transcribe_audio,args=[semaphore])
-        return thread
+    return parallel_executor_helper(videos, lambda video,_: video.transcribe_audio(timeline=timeline), 'transcribe', 'transcribe audio from', IO_BOUND, max_no_of_threads)
 
-    parallel_downloader_helper(videos,thread_builder,'transcribe audio from')
 
 
-
-def parallel_sentiment_analyser(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> None:
+@instrument_runner('threads')
+def parallel_sentiment_analyser(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
     """
     Performs sentiment analysis on all VideoFile objects using threads for parallelism.
 
@@ -142,23 +215,15 @@ def parallel_sentiment_analyser(videos: list[VideoFile], max_no_of_threads: Opti
         max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
 
     Returns:
-        None    
+        the result or the exception of the sentiment analysis of each video.
     """
 
-    if(max_no_of_threads == None):
-        max_no_of_threads = len(videos)
-
-    semaphore = threading.Semaphore(max_no_of_threads)
-
-    def thread_builder(video: VideoFile,_):
-        thread = threading.Thread(target=video.sentiment_analysis,args=[semaphore])
-        return thread
-
-    parallel_downloader_helper(videos,thread_builder,'perform sentiment analysis on')
+    return parallel_executor_helper(videos, lambda video,_: video.sentiment_analysis(), 'sentiment', 'perform sentiment analysis on', CPU_BOUND, max_no_of_threads)
       
 
 
-def parallel_text_translator(videos: list[VideoFile], lang_from: str, lang_to: str, lang_name: str, max_no_of_threads: Optional[int] = None) -> None:
+@instrument_runner('threads')
+def parallel_text_translator(videos: list[VideoFile], lang_from: str, lang_to: str, lang_name: str, max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
     """
     Translates the transcribed text of all VideoFile objects using threads for parallelism.
 
@@ -170,39 +235,112 @@ def parallel_text_translator(videos: list[VideoFile], lang_from: str, lang_to: s
         max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
 
     Returns:
-        None    
+        the result or the exception of the translation of each video.
+    """
+
+    return parallel_executor_helper(videos, lambda video,_: video.translate_text(lang_from, lang_to, lang_name), 'translate', f'translate in {lang_name}', IO_BOUND, max_no_of_threads)
+
+@instrument_runner('threads')
+def parallel_multi_language_translator(videos: list[VideoFile], lang_from: str, languages: dict[str,str], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Translates the transcribed text of all VideoFile objects into several languages in one pass, using threads for
+    parallelism. Each transcript is read, and split into sentences by the translation engine, once. Every (video, language)
+    pair is then translated through the same pool, and each file is written as soon as its translation completes. A
+    transcript is read only when the pairs of the previous video are submitted, and no more than twice as many pairs as
+    there are workers wait at a time, so the memory does not grow with the number of videos.
+
+    Parameters:
+        videos: the array of VideoFile objects.
+        lang_from: The original language of the text.
+        languages: The languages to translate the text into, mapped to their names in English.
+        max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
+
+    Returns:
+        the result (the language and the path of the translated text) or the exception of each pair, ordered by video and then by language.
     """
+
+    limiter = None
     if(max_no_of_threads == None):
-        max_no_of_threads = len(videos)
-    
-    semaphore = threading.Semaphore(max_no_of_threads)
+        limiter = adaptive_concurrency.get_limiter('translate', cpu_bound=False)
+        max_no_of_threads = limiter.max_limit
+    executor = get_shared_executor(IO_BOUND, max_no_of_threads)
+    engine = VideoFile.translator if isinstance(VideoFile.translator, TranslationEngine) else None
+
+    #each pair goes through the stage method, so it is logged, recorded in the batch and timed like a single translation.
+    def translate_pair(video:VideoFile, text:str, segments:Optional[list[str]], lang_to:str, lang_name:str) -> tuple[str,str]:
+        if(limiter == None):
+            video.translate_text(lang_from, lang_to, lang_name, text=text, segments=segments)
+        else:
+            with limiter:
+                video.translate_text(lang_from, lang_to, lang_name, text=text, segments=segments)
+        return lang_to, video.translated_text_paths[lang_to]
+
+    #at most twice as many pairs as there are workers are pending at a time, as in parallel_executor_helper. The
+    #transcript of a video is read, once for all its languages, only when the pairs of the previous video are submitted,
+    #so the transcripts held in memory are those of the pending pairs.
+    submission_slots = threading.BoundedSemaphore(2*max_no_of_threads)
+    def submit_pair(video:VideoFile, text:str, segments:Optional[list[str]], lang_to:str, lang_name:str) -> concurrent.futures.Future:
+        submission_slots.acquire()
+        future = executor.submit(translate_pair, video, text, segments, lang_to, lang_name)
+        future.add_done_callback(lambda _: submission_slots.release())
+        return future
 
-    def thread_builder(video: VideoFile,_):
-        thread = threading.Thread(target=video.translate_text,args=( lang_from, lang_to, lang_name,semaphore))
-        return thread
+    start=time.perf_counter()
+    pairs:list[tuple[VideoFile,Any]] = []
+    for video in videos:
+        try:
+            print(f"SUBTASK 4 :: started translating the video {video.title} to {', '.join(languages.values())}")
+            text = video.get_text_from_file()
+            segments = engine.segment(text) if engine != None else None
+        except Exception as e:
+            print(f"UNSUCCESSFUL - failed to read the transcript of the video {video.title}.")
+            print(e)
+            pairs.extend((video, e) for _ in languages)
+            continue
+        pairs.extend((video, submit_pair(video, text, segments, lang_to, lang_name)) for lang_to, lang_name in languages.items())
+
+    results=[]
+    for video,pair in pairs:
+        if(isinstance(pair, BaseException)):
+            results.append(TaskResult(video, None, pair))
+            continue
+        error = pair.exception()
+        results.append(TaskResult(video, None if error != None else pair.result(), error))
 
-    parallel_downloader_helper(videos,thread_builder,f'translate in {lang_name}')
+    end=time.perf_counter()
+    failed = sum(1 for result in results if result.error != None)
+    print(f'Time took to translate the videos in {len(languages)} languages in parallel [threads]: {round(end-start,2)} second(s), {failed} failed')
+    return results
       
 
       
-def parallel_emotion_extractor(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> None:
+@instrument_runner('threads')
+def parallel_timeline_analyser(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
     """
-    Extracts the emotions of all VideoFile objects using threads for parallelism.
+    Scores the sentiment and emotions of every transcript segment of all VideoFile objects using threads for parallelism.
+    The videos whose timeline was scored while they were transcribed are skipped.
 
     Parameters:
         videos: the array of VideoFile objects.
         max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
 
     Returns:
-        None    
+        the result or the exception of the timeline of each video.
     """
-    if(max_no_of_threads == None):
-        max_no_of_threads = len(videos)
 
-    semaphore = threading.Semaphore(max_no_of_threads)
+    return parallel_executor_helper(videos, lambda video,_: video.analyse_timeline() if video.timeline_path == None else None, 'timeline', 'score the timeline of', CPU_BOUND, max_no_of_threads)
 
-    def thread_builder(video: VideoFile,_):
-        thread = threading.Thread(target=video.extract_emotions,args=[semaphore])
-        return thread
+@instrument_runner('threads')
+def parallel_emotion_extractor(videos: list[VideoFile], max_no_of_threads: Optional[int] = None) -> list[TaskResult]:
+    """
+    Extracts the emotions of all VideoFile objects using threads for parallelism.
+
+    Parameters:
+        videos: the array of VideoFile objects.
+        max_no_of_threads [optional]: to define the number of threads that could execute a function at one time.
+
+    Returns:
+        the result or the exception of the emotion extraction of each video.
+    """
 
-    parallel_downloader_helper(videos,thread_builder,'extract emotion from')
\ No newline at end of file
+    return parallel_executor_helper(videos, lambda video,_: video.extract_emotions(), 'emotions', 'extract emotion from', CPU_BOUND, max_no_of_threads)
@@ -0,0 +1,252 @@
+import os
+import mmap
+import fcntl
+import struct
+import threading
+from typing import Optional
+
+# the arena starts with a header (magic, length of the records written so far) and is grown by doubling, so the
+# readers map it again only a few times however many transcripts are appended
+ARENA_MAGIC = b'CSTA'
+ARENA_HEADER = struct.Struct('<4s4xQ')
+INITIAL_CAPACITY = 1024*1024
+
+# each record is a header (magic, length of the key, length of the text) followed by the UTF-8 key and text
+RECORD_MAGIC = b'CSTR'
+RECORD_HEADER = struct.Struct('<4sIQ')
+
+# <-------------------------------- Transcript Store ------------------------------->
+
+class TranscriptStore:
+
+    def __init__(self, path:str) -> None:
+        """
+        Initialises a store of transcripts in an arena file that every reader maps into memory. Transcribing a video
+        appends its text, and the text stages read it back from the mapping instead of opening the text file, in the
+        threads of this process as well as in worker processes, which see the records the others appended. The latest
+        record of a key wins. The file is grown to twice its size when it is full, so each process holds one mapping
+        and one file descriptor, and maps the file again only when it has grown.
+
+        Parameters:
+            path: the path of the arena file.
+
+        Returns:
+            None
+        """
+        self.path:str = path
+        self.lock = threading.Lock()
+        self.index:dict[str,tuple[int,int]] = {}
+        self.scanned:int = ARENA_HEADER.size
+        self.file_descriptor:Optional[int] = None
+        self.mapping:Optional[mmap.mmap] = None
+        self.pid:Optional[int] = None
+
+    def put(self, key:str, text:str) -> None:
+        """
+        Appends a transcript to the arena, unless the same text is already the latest record of the key.
+
+        Parameters:
+            key: the key of the transcript, the path of its text file.
+            text: the transcript.
+
+        Returns:
+            None
+        """
+        key_bytes = key.encode('utf-8')
+        text_bytes = text.encode('utf-8')
+        record = RECORD_HEADER.pack(RECORD_MAGIC, len(key_bytes), len(text_bytes)) + key_bytes + text_bytes
+
+        with self.lock:
+            file_descriptor = self.open()
+            #the lock keeps the records of several processes from being interleaved.
+            fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            try:
+                #a cached transcription or a text read back from its file is usually stored already.
+                self.refresh()
+                if(self.read(key) == text_bytes):
+                    return
+                used = self.used_length()
+                end = used + len(record)
+                size = os.fstat(file_descriptor).st_size
+                if(end > size):
+                    os.ftruncate(file_descriptor, max(end, 2*size))
+                write_all(file_descriptor, record, used)
+                #the length is updated after the record is written, so a reader never indexes a partial record.
+                write_all(file_descriptor, ARENA_HEADER.pack(ARENA_MAGIC, end), 0)
+            finally:
+                fcntl.flock(file_descriptor, fcntl.LOCK_UN)
+
+    def get(self, key:str) -> Optional[str]:
+        """
+        Looks up a transcript.
+
+        Parameters:
+            key: the key of the transcript.
+
+        Returns:
+            the transcript, copied out of the mapping, None if it is not stored.
+        """
+        with self.lock:
+            self.open()
+            if(key not in self.index):
+                self.refresh()
+            text_bytes = self.read(key)
+        return str(text_bytes, 'utf-8') if text_bytes != None else None
+
+    def __contains__(self, key:str) -> bool:
+        with self.lock:
+            self.open()
+            if(key not in self.index):
+                self.refresh()
+            return key in self.index
+
+    def reset(self) -> None:
+        """
+        Empties the arena, for a batch that starts from scratch. It is called before the worker processes are started,
+        as they would keep the records of the old arena in their indexes.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self.lock:
+            file_descriptor = self.open()
+            fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            try:
+                write_all(file_descriptor, ARENA_HEADER.pack(ARENA_MAGIC, ARENA_HEADER.size), 0)
+                os.ftruncate(file_descriptor, INITIAL_CAPACITY)
+                self.close_mapping()
+                self.index = {}
+                self.scanned = ARENA_HEADER.size
+            finally:
+                fcntl.flock(file_descriptor, fcntl.LOCK_UN)
+
+    def compact(self) -> None:
+        """
+        Rewrites the arena with only the latest record of each key, dropping the transcripts that were replaced. Like
+        reset, it is called before the worker processes are started.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self.lock:
+            file_descriptor = self.open()
+            fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                records = [(key, self.read(key)) for key in self.index]
+                self.close_mapping()
+                self.index = {}
+                self.scanned = ARENA_HEADER.size
+                write_all(file_descriptor, ARENA_HEADER.pack(ARENA_MAGIC, ARENA_HEADER.size), 0)
+                os.ftruncate(file_descriptor, INITIAL_CAPACITY)
+                for key, text_bytes in records:
+                    key_bytes = key.encode('utf-8')
+                    record = RECORD_HEADER.pack(RECORD_MAGIC, len(key_bytes), len(text_bytes)) + key_bytes + text_bytes
+                    used = self.used_length()
+                    size = os.fstat(file_descriptor).st_size
+                    if(used + len(record) > size):
+                        os.ftruncate(file_descriptor, max(used + len(record), 2*size))
+                    write_all(file_descriptor, record, used)
+                    write_all(file_descriptor, ARENA_HEADER.pack(ARENA_MAGIC, used + len(record)), 0)
+            finally:
+                fcntl.flock(file_descriptor, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        with self.lock:
+            self.close_mapping()
+            if(self.file_descriptor != None and self.pid == os.getpid()):
+                os.close(self.file_descriptor)
+            self.file_descriptor = None
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+    def open(self) -> int:
+        """
+        Opens the arena file, again in a forked process, so every process writes through a descriptor of its own. A
+        new or empty file is given its header.
+
+        Parameters:
+            None
+
+        Returns:
+            the file descriptor of the arena.
+        """
+        if(self.file_descriptor == None or self.pid != os.getpid()):
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            #the mapping of the parent is left to the parent, the forked process maps the file itself.
+            self.mapping = None
+            self.file_descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self.pid = os.getpid()
+            fcntl.flock(self.file_descriptor, fcntl.LOCK_EX)
+            try:
+                header = os.pread(self.file_descriptor, ARENA_HEADER.size, 0)
+                #an arena of an older format, or a new file, is started afresh, its transcripts are still in their text files.
+                if(len(header) < ARENA_HEADER.size or ARENA_HEADER.unpack(header)[0] != ARENA_MAGIC):
+                    write_all(self.file_descriptor, ARENA_HEADER.pack(ARENA_MAGIC, ARENA_HEADER.size), 0)
+                    os.ftruncate(self.file_descriptor, INITIAL_CAPACITY)
+            finally:
+                fcntl.flock(self.file_descriptor, fcntl.LOCK_UN)
+        return self.file_descriptor
+
+    def refresh(self) -> None:
+        """
+        Maps the arena again if it has grown, closing the previous mapping, and indexes the records appended since the
+        last refresh.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        #the readers hold no lock, so the length is read before the size: a writer grows the file before it writes a
+        #record and updates the length after, so the file is always at least as long as the records it counts.
+        used = self.used_length()
+        size = os.fstat(self.file_descriptor).st_size
+        if(self.mapping == None or len(self.mapping) < max(used, size)):
+            #get copies the transcripts out of the mapping, no view into it outlives the call, so it can be closed.
+            self.close_mapping()
+            self.mapping = mmap.mmap(self.file_descriptor, size, access=mmap.ACCESS_READ)
+
+        used = min(used, len(self.mapping))
+        position = self.scanned
+        while position + RECORD_HEADER.size <= used:
+            magic, key_length, text_length = RECORD_HEADER.unpack_from(self.mapping, position)
+            if(magic != RECORD_MAGIC):
+                raise ValueError(f'The transcript store {self.path} is corrupted at byte {position}')
+            key_start = position + RECORD_HEADER.size
+            text_start = key_start + key_length
+            end = text_start + text_length
+            if(end > used):
+                #a record that is not all counted yet is indexed by the next refresh.
+                break
+            key = str(self.mapping[key_start:text_start], 'utf-8')
+            self.index[key] = (text_start, text_length)
+            position = end
+        self.scanned = position
+
+    def read(self, key:str) -> Optional[bytes]:
+        location = self.index.get(key)
+        if(location == None):
+            return None
+        offset, length = location
+        return self.mapping[offset:offset+length]
+
+    def used_length(self) -> int:
+        return ARENA_HEADER.unpack(os.pread(self.file_descriptor, ARENA_HEADER.size, 0))[1]
+
+    def close_mapping(self) -> None:
+        if(self.mapping != None):
+            self.mapping.close()
+            self.mapping = None
+
+def write_all(file_descriptor:int, data:bytes, offset:int) -> None:
+    written = 0
+    while written < len(data):
+        written += os.pwrite(file_descriptor, data[written:], offset + written)
@@ -0,0 +1,266 @@
+import wave
+import collections
+import concurrent.futures
+import numpy as np
+import speech_recognition as sr
+from typing import Callable, Iterator, NamedTuple
+
+# the recognizers are given 16 bit mono audio
+SAMPLE_WIDTH = 2
+
+class AudioChunk(NamedTuple):
+    index: int
+    start: float
+    end: float
+    samples: np.ndarray
+    sample_rate: int
+
+    def to_audio_data(self) -> sr.AudioData:
+        return sr.AudioData(self.samples.tobytes(), self.sample_rate, SAMPLE_WIDTH)
+
+class TranscriptSegment(NamedTuple):
+    # the position of the chunk, its start and end in seconds, and its text
+    index: int
+    start: float
+    end: float
+    text: str
+
+# <-------------------------------- Recognizer Backends ------------------------------->
+
+def google_recognizer(audio:sr.AudioData) -> str:
+    """
+    Transcribes a piece of audio with the Google Web Speech API.
+
+    Parameters:
+        audio: the audio to be transcribed.
+
+    Returns:
+        the transcribed text, empty if no speech was recognised in the audio.
+    """
+    recognizer = sr.Recognizer()
+    try:
+        return recognizer.recognize_google(audio)
+    except sr.UnknownValueError:
+        #a chunk of silence or music is not a failure of the whole transcription.
+        return ''
+
+# <-------------------------------- Audio Chunking ------------------------------->
+
+def to_mono_int16(frames:bytes, sample_width:int, channels:int) -> np.ndarray:
+    """
+    Converts raw PCM frames to 16 bit mono samples.
+
+    Parameters:
+        frames: the raw frames read from the audio.
+        sample_width: the number of bytes of each sample.
+        channels: the number of channels of the audio.
+
+    Returns:
+        the samples, averaged over the channels.
+    """
+    if(sample_width == 1):
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.int32) - 128) << 8
+    elif(sample_width == 2):
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.int32)
+    elif(sample_width == 4):
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.int64) >> 16
+    else:
+        raise ValueError(f'Audio with {sample_width} bytes per sample is not supported')
+
+    if(channels > 1):
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples.astype(np.int16)
+
+def wav_sample_reader(path:str) -> tuple[Callable[[int],np.ndarray],int,Callable[[],None]]:
+    """
+    Opens a .wav file to be read as 16 bit mono samples, a few at a time.
+
+    Parameters:
+        path: the path of the .wav file.
+
+    Returns:
+        a function that reads up to the given number of samples, the sample rate, and a function that closes the file.
+    """
+    wav_file = wave.open(path, 'rb')
+    sample_width = wav_file.getsampwidth()
+    channels = wav_file.getnchannels()
+
+    def read(count:int) -> np.ndarray:
+        return to_mono_int16(wav_file.readframes(count), sample_width, channels)
+
+    return read, wav_file.getframerate(), wav_file.close
+
+def quietest_point(samples:np.ndarray, sample_rate:int, frame_seconds:float = 0.02) -> int:
+    """
+    Finds the quietest short frame of the samples, which is where a chunk can be cut without splitting a word.
+
+    Parameters:
+        samples: the samples to be searched.
+        sample_rate: the number of samples per second.
+        frame_seconds: the length of the frames whose energy is compared.
+
+    Returns:
+        the index of the sample in the middle of the quietest frame.
+    """
+    frame_length = max(1, int(sample_rate * frame_seconds))
+    frame_count = len(samples) // frame_length
+    if(frame_count == 0):
+        return len(samples)
+
+    frames = samples[:frame_count*frame_length].astype(np.float32).reshape(frame_count, frame_length)
+    energy = (frames*frames).mean(axis=1)
+    return int(np.argmin(energy)) * frame_length + frame_length // 2
+
+def iter_chunks(read:Callable[[int],np.ndarray], sample_rate:int, chunk_seconds:float = 30.0, search_seconds:float = 2.0) -> Iterator[AudioChunk]:
+    """
+    Splits audio into chunks of about chunk_seconds, cutting each one at the quietest point of its last search_seconds.
+    Only one chunk is held in memory at a time.
+
+    Parameters:
+        read: a function that reads up to the given number of samples, returning none at the end of the audio.
+        sample_rate: the number of samples per second.
+        chunk_seconds: the length of the chunks before they are aligned to silence.
+        search_seconds: the length of the end of each chunk that is searched for silence.
+
+    Returns:
+        a generator of the chunks, in order.
+    """
+    chunk_length = int(sample_rate * chunk_seconds)
+    search_length = min(int(sample_rate * search_seconds), chunk_length // 2)
+
+    index = 0
+    position = 0
+    carried = np.zeros(0, dtype=np.int16)
+    while True:
+        samples = np.concatenate([carried, read(chunk_length + search_length - len(carried))])
+        if(len(samples) == 0):
+            return
+
+        if(len(samples) <= chunk_length):
+            cut = len(samples)
+        else:
+            search_start = chunk_length - search_length
+            cut = search_start + quietest_point(samples[search_start:], sample_rate)
+
+        yield AudioChunk(index, position / sample_rate, (position + cut) / sample_rate, samples[:cut], sample_rate)
+
+        index += 1
+        position += cut
+        carried = samples[cut:]
+
+# <-------------------------------- Chunked Transcriber ------------------------------->
+
+class ChunkedTranscriber:
+
+    def __init__(self, recognizer:Callable[[sr.AudioData],str] = google_recognizer, chunk_seconds:float = 30.0, search_seconds:float = 2.0, max_workers:int = 4) -> None:
+        """
+        Initialises a transcriber that splits audio into silence aligned chunks and transcribes them concurrently.
+
+        Parameters:
+            recognizer: the backend that transcribes a chunk of audio.
+            chunk_seconds: the length of the chunks before they are aligned to silence.
+            search_seconds: the length of the end of each chunk that is searched for silence.
+            max_workers: the number of chunks that are transcribed at a time.
+
+        Returns:
+            None
+        """
+        self.recognizer:Callable[[sr.AudioData],str] = recognizer
+        self.chunk_seconds:float = chunk_seconds
+        self.search_seconds:float = search_seconds
+        self.max_workers:int = max_workers
+
+    def transcribe_chunks(self, chunks:Iterator[AudioChunk]) -> list[str]:
+        """
+        Transcribes the chunks through a pool of threads.
+
+        Parameters:
+            chunks: the chunks of the audio, in order.
+
+        Returns:
+            the text of each chunk, in the order of the chunks.
+        """
+        return [segment.text for segment in self.iter_segments(chunks)]
+
+    def iter_segments(self, chunks:Iterator[AudioChunk]) -> Iterator[TranscriptSegment]:
+        """
+        Transcribes the chunks through a pool of threads and yields each one as soon as it and the chunks before it are
+        done, so the first segments can be used while the rest of the audio is still being transcribed. At most twice as
+        many chunks as there are workers are read ahead, so the memory used is bounded by the chunk size.
+
+        Parameters:
+            chunks: the chunks of the audio, in order.
+
+        Returns:
+            a generator of the segments, with the times of their chunks, in order.
+        """
+        pending:collections.deque = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='transcribe-chunk') as executor:
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(self.recognizer, chunk.to_audio_data())))
+                if(len(pending) >= 2*self.max_workers):
+                    done, future = pending.popleft()
+                    yield TranscriptSegment(done.index, done.start, done.end, future.result())
+
+            while len(pending) > 0:
+                done, future = pending.popleft()
+                yield TranscriptSegment(done.index, done.start, done.end, future.result())
+
+    def iter_sample_segments(self, read:Callable[[int],np.ndarray], sample_rate:int) -> Iterator[TranscriptSegment]:
+        """
+        Transcribes audio given as a reader of 16 bit mono samples, a segment at a time.
+
+        Parameters:
+            read: a function that reads up to the given number of samples.
+            sample_rate: the number of samples per second.
+
+        Returns:
+            a generator of the segments, in order.
+        """
+        return self.iter_segments(iter_chunks(read, sample_rate, self.chunk_seconds, self.search_seconds))
+
+    def iter_file_segments(self, path:str) -> Iterator[TranscriptSegment]:
+        """
+        Transcribes a .wav file, a segment at a time.
+
+        Parameters:
+            path: the path of the .wav file.
+
+        Returns:
+            a generator of the segments, in order.
+        """
+        read, sample_rate, close = wav_sample_reader(path)
+        try:
+            yield from self.iter_sample_segments(read, sample_rate)
+        finally:
+            close()
+
+    def transcribe_samples(self, read:Callable[[int],np.ndarray], sample_rate:int) -> str:
+        """
+        Transcribes audio given as a reader of 16 bit mono samples.
+
+        Parameters:
+            read: a function that reads up to the given number of samples.
+            sample_rate: the number of samples per second.
+
+        Returns:
+            the text of the audio, stitched together in order.
+        """
+        texts = self.transcribe_chunks(iter_chunks(read, sample_rate, self.chunk_seconds, self.search_seconds))
+        return ' '.join(text for text in texts if text != '')
+
+    def transcribe_file(self, path:str) -> str:
+        """
+        Transcribes a .wav file.
+
+        Parameters:
+            path: the path of the .wav file.
+
+        Returns:
+            the text of the audio, stitched together in order.
+        """
+        read, sample_rate, close = wav_sample_reader(path)
+        try:
+            return self.transcribe_samples(read, sample_rate)
+        finally:
+            close()
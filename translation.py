@@ -0,0 +1,328 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import concurrent.futures
+from stage_cache import hash_text
+from sqlite_connection import ProcessConnection
+from typing import Callable, Iterable, Optional
+
+# the Google translator rejects texts longer than 5000 characters, the requests are kept below that
+MAX_REQUEST_CHARS = 4500
+# transcripts often come without punctuation, so long sentences are cut at a word boundary to stay cacheable
+MAX_SEGMENT_CHARS = 1000
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+# a backend translates a list of segments from a source to a target language, returning one translation per segment
+Backend = Callable[[list[str],str,str],list[str]]
+
+# <-------------------------------- Translation Backends ------------------------------->
+
+def google_backend(segments:list[str], source:str, target:str) -> list[str]:
+    """
+    Translates segments with the Google translator in a single request, one segment per line.
+
+    Parameters:
+        segments: the segments to be translated, none of them holding a newline.
+        source: the language of the segments.
+        target: the language to translate the segments into.
+
+    Returns:
+        the translation of each segment, in order.
+    """
+    from deep_translator import GoogleTranslator
+    translator = GoogleTranslator(source=source, target=target)
+    translated = translator.translate(text='\n'.join(segments))
+    lines = [line.strip() for line in (translated or '').split('\n')]
+    if(len(lines) == len(segments)):
+        return lines
+
+    #the service merged or split some lines, so the segments are sent one at a time instead.
+    return [translator.translate(text=segment) or '' for segment in segments]
+
+# <-------------------------------- Segmentation ------------------------------->
+
+def split_segments(text:str, max_segment_chars:int = MAX_SEGMENT_CHARS) -> list[str]:
+    """
+    Splits a text into sentences, cutting the sentences that are too long at the last space before the limit.
+
+    Parameters:
+        text: the text to be split.
+        max_segment_chars: the longest segment.
+
+    Returns:
+        the segments, in order, without empty ones.
+    """
+    segments = []
+    for sentence in SENTENCE_END.split(' '.join(text.split())):
+        while len(sentence) > max_segment_chars:
+            cut = sentence.rfind(' ', 0, max_segment_chars)
+            if(cut <= 0):
+                cut = max_segment_chars
+            segments.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if(sentence != ''):
+            segments.append(sentence)
+    return segments
+
+def pack_requests(segments:list[str], max_request_chars:int = MAX_REQUEST_CHARS) -> list[list[str]]:
+    """
+    Groups segments into requests whose joined length stays below the limit of the translator.
+
+    Parameters:
+        segments: the segments to be grouped.
+        max_request_chars: the longest request, counting the newlines between the segments.
+
+    Returns:
+        the segments of each request.
+    """
+    requests = []
+    current:list[str] = []
+    length = 0
+    for segment in segments:
+        if(len(current) > 0 and length + 1 + len(segment) > max_request_chars):
+            requests.append(current)
+            current, length = [], 0
+        length += len(segment) + (1 if len(current) > 0 else 0)
+        current.append(segment)
+    if(len(current) > 0):
+        requests.append(current)
+    return requests
+
+# <-------------------------------- Phrase Cache ------------------------------->
+
+class TranslationCache:
+
+    def __init__(self, path:str) -> None:
+        """
+        Initialises a persistent cache of translated segments in a SQLite file, keyed by the source and target
+        languages and the hash of the segment.
+
+        Parameters:
+            path: the path of the SQLite file.
+
+        Returns:
+            None
+        """
+        self.path:str = path
+        self.lock = threading.Lock()
+        self.database = ProcessConnection(path, ['CREATE TABLE IF NOT EXISTS translations (source TEXT, target TEXT, segment_hash TEXT, translation TEXT, '
+                                                 'PRIMARY KEY (source, target, segment_hash))'], wal=True)
+
+    def get_many(self, source:str, target:str, hashes:Iterable[str]) -> dict[str,str]:
+        """
+        Looks up the translations of segments.
+
+        Parameters:
+            source: the language of the segments.
+            target: the language of the translations.
+            hashes: the hashes of the segments.
+
+        Returns:
+            the cached translations, by hash.
+        """
+        hashes = list(hashes)
+        found = {}
+        with self.lock:
+            connection = self.connect()
+            #sqlite limits the number of parameters of a query, so the hashes are looked up in slices.
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start+500]
+                rows = connection.execute(f'SELECT segment_hash, translation FROM translations WHERE source = ? AND target = ? AND segment_hash IN ({",".join("?"*len(part))})',
+                                          [source, target, *part]).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, source:str, target:str, translations:dict[str,str]) -> None:
+        """
+        Stores the translations of segments.
+
+        Parameters:
+            source: the language of the segments.
+            target: the language of the translations.
+            translations: the translations, by hash of the segment.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO translations (source, target, segment_hash, translation) VALUES (?, ?, ?, ?)',
+                                       [(source, target, segment_hash, translation) for segment_hash, translation in translations.items()])
+
+    def connect(self) -> sqlite3.Connection:
+        return self.database.get()
+
+# <-------------------------------- Translation Engine ------------------------------->
+
+class TranslationEngine:
+
+    def __init__(self, backend:Backend = google_backend, cache_path:Optional[str] = '.translation_cache.sqlite', max_concurrency:int = 4,
+                 max_request_chars:int = MAX_REQUEST_CHARS, max_segment_chars:int = MAX_SEGMENT_CHARS, retries:int = 2, backoff_seconds:float = 1.0) -> None:
+        """
+        Initialises an engine that translates texts a segment at a time. The segments of all the texts being translated
+        are deduplicated, looked up in the cache, and the missing ones are sent in bulk requests through a pool with a
+        limited number of workers. A segment that another text is already waiting for is not requested again.
+
+        Parameters:
+            backend: the function that translates a list of segments.
+            cache_path [optional]: the SQLite file of the cache, nothing is cached if it is None.
+            max_concurrency: the number of requests sent at one time.
+            max_request_chars: the longest request.
+            max_segment_chars: the longest segment.
+            retries: the number of times a failed request is retried.
+            backoff_seconds: the delay before the first retry, doubled for each following retry.
+
+        Returns:
+            None
+        """
+        self.backend:Backend = backend
+        self.cache:Optional[TranslationCache] = TranslationCache(cache_path) if cache_path != None else None
+        self.max_concurrency:int = max_concurrency
+        self.max_request_chars:int = max_request_chars
+        self.max_segment_chars:int = max_segment_chars
+        self.retries:int = retries
+        self.backoff_seconds:float = backoff_seconds
+        self.lock = threading.Lock()
+        self.in_flight:dict[tuple[str,str,str],concurrent.futures.Future] = {}
+        self.executor:Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.executor_pid:Optional[int] = None
+        self.requests_sent:int = 0
+
+    def __call__(self, text:str, source:str, target:str) -> str:
+        return self.translate_text(text, source, target)
+
+    def segment(self, text:str) -> list[str]:
+        """
+        Splits a text into the segments the engine translates, so a text translated into several languages is split once.
+
+        Parameters:
+            text: the text to be split.
+
+        Returns:
+            the segments, in order.
+        """
+        return split_segments(text, self.max_segment_chars)
+
+    def translate_text(self, text:str, source:str, target:str) -> str:
+        """
+        Translates a text. The engine itself can be set as VideoFile.translator, calling it translates a text.
+
+        Parameters:
+            text: the text to be translated.
+            source: the language of the text.
+            target: the language to translate the text into.
+
+        Returns:
+            the translated text.
+        """
+        return self.translate_texts([text], source, target)[0]
+
+    def translate_texts(self, texts:list[str], source:str, target:str) -> list[str]:
+        """
+        Translates texts together, so their segments are deduplicated and packed into the same requests.
+
+        Parameters:
+            texts: the texts to be translated.
+            source: the language of the texts.
+            target: the language to translate the texts into.
+
+        Returns:
+            the translation of each text, in order.
+        """
+        segmented = [self.segment(text) for text in texts]
+        return self.translate_segmented(segmented, source, target)
+
+    def translate_segmented(self, segmented:list[list[str]], source:str, target:str) -> list[str]:
+        """
+        Translates texts that are already split into segments.
+
+        Parameters:
+            segmented: the segments of each text.
+            source: the language of the texts.
+            target: the language to translate the texts into.
+
+        Returns:
+            the translation of each text, its translated segments joined by spaces.
+        """
+        segments = {hash_text(segment): segment for segments in segmented for segment in segments}
+        translations = self.cache.get_many(source, target, segments) if self.cache != None else {}
+
+        missing = [segment_hash for segment_hash in segments if segment_hash not in translations]
+        executor = self.get_executor()
+        waiting:dict[str,concurrent.futures.Future] = {}
+        to_request:list[str] = []
+        with self.lock:
+            for segment_hash in missing:
+                future = self.in_flight.get((source, target, segment_hash))
+                if(future == None):
+                    future = concurrent.futures.Future()
+                    self.in_flight[(source, target, segment_hash)] = future
+                    to_request.append(segment_hash)
+                waiting[segment_hash] = future
+
+        if(len(to_request) > 0):
+            hashes_by_segment = {segments[segment_hash]: segment_hash for segment_hash in to_request}
+            for request in pack_requests([segments[segment_hash] for segment_hash in to_request], self.max_request_chars):
+                executor.submit(self.send_request, request, [hashes_by_segment[segment] for segment in request], source, target)
+
+        for segment_hash, future in waiting.items():
+            translations[segment_hash] = future.result()
+
+        return [' '.join(translations[hash_text(segment)] for segment in segments_of_text) for segments_of_text in segmented]
+
+    def send_request(self, request:list[str], hashes:list[str], source:str, target:str) -> None:
+        """
+        Sends one bulk request, retrying it on failure, and hands the translations to the texts waiting for them.
+
+        Parameters:
+            request: the segments of the request.
+            hashes: the hash of each segment.
+            source: the language of the segments.
+            target: the language to translate the segments into.
+
+        Returns:
+            None
+        """
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    translated = self.backend(request, source, target)
+                    break
+                except Exception as e:
+                    if(attempt == self.retries):
+                        raise
+                    delay = self.backoff_seconds * (2 ** attempt)
+                    print(f"RETRYING - translation request of {len(request)} segment(s) failed ({e}), retrying in {delay} second(s)")
+                    time.sleep(delay)
+
+            if(len(translated) != len(request)):
+                raise ValueError(f'the translator returned {len(translated)} translation(s) for {len(request)} segment(s)')
+            results = dict(zip(hashes, translated))
+            with self.lock:
+                self.requests_sent += 1
+            if(self.cache != None):
+                self.cache.put_many(source, target, results)
+            error = None
+        except Exception as e:
+            results, error = {}, e
+
+        with self.lock:
+            futures = [self.in_flight.pop((source, target, segment_hash)) for segment_hash in hashes]
+        for segment_hash, future in zip(hashes, futures):
+            if(error != None):
+                future.set_exception(error)
+            else:
+                future.set_result(results[segment_hash])
+
+    def get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        #the threads of the pool do not survive a fork, so a forked worker starts a pool of its own.
+        with self.lock:
+            if(self.executor == None or self.executor_pid != os.getpid()):
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='translate-request')
+                self.executor_pid = os.getpid()
+                self.in_flight = {}
+            return self.executor
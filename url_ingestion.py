@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import math
+import hashlib
+import numpy as np
+from urllib.parse import urlparse, parse_qs
+from VideoFile import VideoFile
+from typing import Iterator, Optional, Union
+
+VIDEO_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com', 'www.youtube-nocookie.com'}
+SHORT_HOSTS = {'youtu.be', 'www.youtu.be'}
+# the first part of the paths that are followed by the id of the video
+ID_PATHS = {'shorts', 'embed', 'v', 'live', 'e'}
+
+# above this many expected URLs a Bloom filter replaces the exact set of seen videos
+BLOOM_THRESHOLD = 1_000_000
+# the shortest line of a URL file that holds a video, a bare 11 character id and its newline
+MIN_URL_LINE_BYTES = 12
+
+# <-------------------------------- URL Normalisation ------------------------------->
+
+def canonical_video_id(url:str) -> Optional[str]:
+    """
+    Extracts the id of a YouTube video from any of its URL forms: watch, shorts, embed, live and youtu.be links,
+    with or without tracking parameters, or a bare id.
+
+    Parameters:
+        url: the URL of the video.
+
+    Returns:
+        the 11 character id of the video, None if the URL is not a YouTube video URL.
+    """
+    url = url.strip()
+    if(VIDEO_ID.match(url)):
+        return url
+    if('://' not in url):
+        url = 'https://' + url
+
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    parts = [part for part in parsed.path.split('/') if part != '']
+
+    candidate = None
+    if(host in SHORT_HOSTS and len(parts) > 0):
+        candidate = parts[0]
+    elif(host in YOUTUBE_HOSTS):
+        if(len(parts) > 0 and parts[0] == 'watch'):
+            candidate = parse_qs(parsed.query).get('v', [None])[0]
+        elif(len(parts) > 1 and parts[0] in ID_PATHS):
+            candidate = parts[1]
+
+    if(candidate != None and VIDEO_ID.match(candidate)):
+        return candidate
+    return None
+
+def canonical_url(video_id:str) -> str:
+    """
+    Builds the canonical watch URL of a video, so the same video always has the same URL in the logs and caches.
+
+    Parameters:
+        video_id: the id of the video.
+
+    Returns:
+        the URL.
+    """
+    return f'https://www.youtube.com/watch?v={video_id}'
+
+# <-------------------------------- Seen Sets ------------------------------->
+
+class SeenSet:
+
+    def __init__(self) -> None:
+        """
+        Initialises an exact set of the keys seen so far, holding a 64 bit hash of each key instead of the key itself.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        self.hashes:set[int] = set()
+
+    def add(self, key:str) -> bool:
+        """
+        Adds a key.
+
+        Parameters:
+            key: the key.
+
+        Returns:
+            True if the key had not been seen before.
+        """
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        if(digest in self.hashes):
+            return False
+        self.hashes.add(digest)
+        return True
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+class BloomFilter:
+
+    def __init__(self, capacity:int, error_rate:float = 0.001) -> None:
+        """
+        Initialises a Bloom filter, whose memory is fixed by its capacity. A key that was never added is reported as
+        seen with a probability of error_rate once the filter holds capacity keys, so such a video would be skipped;
+        a key that was added is always reported as seen.
+
+        Parameters:
+            capacity: the expected number of keys.
+            error_rate: the false positive rate at that capacity.
+
+        Returns:
+            None
+        """
+        self.size:int = max(8, int(-capacity * math.log(error_rate) / math.log(2)**2))
+        self.hash_count:int = max(1, round(self.size / capacity * math.log(2)))
+        self.bits:np.ndarray = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count:int = 0
+
+    def add(self, key:str) -> bool:
+        """
+        Adds a key.
+
+        Parameters:
+            key: the key.
+
+        Returns:
+            True if the key had not been seen before (or, rarely, a false positive made it look seen: False).
+        """
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        positions = [(first + i*second) % self.size for i in range(self.hash_count)]
+
+        new = False
+        for position in positions:
+            byte, bit = divmod(position, 8)
+            if(not self.bits[byte] & (1 << bit)):
+                self.bits[byte] |= (1 << bit)
+                new = True
+        if(new):
+            self.count += 1
+        return new
+
+    def __len__(self) -> int:
+        return self.count
+
+def make_seen_set(expected:Optional[int] = None, error_rate:float = 0.001) -> Union[SeenSet,BloomFilter]:
+    """
+    Picks the set of seen videos for the expected number of URLs: exact for ordinary inputs, a Bloom filter of fixed
+    size for huge ones.
+
+    Parameters:
+        expected [optional]: the expected number of URLs.
+        error_rate: the false positive rate of the Bloom filter.
+
+    Returns:
+        the seen set.
+    """
+    if(expected != None and expected > BLOOM_THRESHOLD):
+        return BloomFilter(expected, error_rate)
+    return SeenSet()
+
+def estimate_url_count(filepath:str) -> int:
+    """
+    Estimates the number of URLs of a file from its size, without reading it. It is an upper bound, as no line that
+    holds a video is shorter than a bare video id, so a Bloom filter sized by it never holds more keys than its
+    capacity. A file of full URLs is overestimated about three times, which costs the filter memory, not accuracy.
+
+    Parameters:
+        filepath: the path of the file.
+
+    Returns:
+        the largest number of URLs the file can hold.
+    """
+    return os.path.getsize(filepath) // MIN_URL_LINE_BYTES
+
+# <-------------------------------- Streaming Ingestion ------------------------------->
+
+def iter_urls(filepath:str, url_field:str = 'url') -> Iterator[str]:
+    """
+    Reads the URLs of a file one line at a time: a text file with one URL per line, or a JSON Lines file (.jsonl) with
+    the URL in a field of each record. Blank lines and lines starting with # are skipped.
+
+    Parameters:
+        filepath: the path of the file.
+        url_field: the field of the JSON records that holds the URL.
+
+    Returns:
+        a generator of the URLs, without surrounding whitespace.
+    """
+    is_json_lines = filepath.endswith('.jsonl')
+    with open(filepath, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if(line == '' or line.startswith('#')):
+                continue
+            if(is_json_lines):
+                try:
+                    url = json.loads(line).get(url_field)
+                except (ValueError, AttributeError):
+                    print(f"UNSUCCESSFUL - line {line_number} of {filepath} is not a JSON record, skipping it.")
+                    continue
+                if(not isinstance(url, str)):
+                    continue
+                line = url.strip()
+            yield line
+
+def ingest_videos(filepath:str, seen:Optional[Union[SeenSet,BloomFilter]] = None, url_field:str = 'url', expected:Optional[int] = None) -> Iterator[VideoFile]:
+    """
+    Streams the videos of a URL file, creating each VideoFile only when the consumer, like the pipeline, asks for it.
+    YouTube URLs are reduced to the id of their video and rewritten to the canonical URL, and a video whose id (or,
+    for other URLs, whose URL) was already seen is dropped, so it is never downloaded twice.
+
+    Without a seen set, one is picked by make_seen_set for the expected number of URLs, estimated from the size of the
+    file if it is not given. Up to BLOOM_THRESHOLD URLs the set is exact, and grows by about 70 bytes per video; above
+    it a Bloom filter keeps the memory fixed, about 1.8 bytes per expected URL, at the cost of dropping about one in a
+    thousand new videos as if they were duplicates.
+
+    Parameters:
+        filepath: the path of the text or JSON Lines file.
+        seen [optional]: the set of seen videos, shared between files to deduplicate across them.
+        url_field: the field of the JSON records that holds the URL.
+        expected [optional]: the expected number of URLs, to size the seen set.
+
+    Returns:
+        a generator of the VideoFile objects.
+    """
+    if(seen == None):
+        seen = make_seen_set(expected if expected != None else estimate_url_count(filepath))
+
+    read = duplicates = 0
+    for url in iter_urls(filepath, url_field):
+        read += 1
+        video_id = canonical_video_id(url)
+        key = video_id if video_id != None else url
+        if(not seen.add(key)):
+            duplicates += 1
+            continue
+
+        video = VideoFile(canonical_url(video_id) if video_id != None else url)
+        video.video_id = video_id
+        yield video
+
+    print(f"INGESTION :: read {read} URL(s) from {filepath}, dropped {duplicates} duplicate(s)")
@@ -0,0 +1,227 @@
+import functools
+import threading
+import numpy as np
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+# the 10 NRC emotions, one column each
+EMOTION_COLUMNS = ('fear', 'anger', 'anticipation', 'trust', 'surprise', 'positive', 'negative', 'sadness', 'disgust', 'joy')
+NUMERIC_COLUMNS = ('polarity', 'subjectivity') + EMOTION_COLUMNS
+STRING_COLUMNS = ('url', 'video_id', 'title', 'video_path', 'audio_path', 'text_path', 'translated_text_path', 'sentiments_path', 'emotions_path')
+
+# <-------------------------------- Video Batch ------------------------------->
+
+class VideoBatch:
+
+    def __init__(self, capacity:int = 64) -> None:
+        """
+        Initialises a columnar table of the results of a batch of videos, one row per video: a float array for the
+        polarity, the subjectivity and each NRC emotion, NaN until the stage has run, and a string array for the URL,
+        title and output paths. The stages write into the row of their video as they complete.
+
+        Parameters:
+            capacity: the number of rows allocated up front, the table grows by doubling.
+
+        Returns:
+            None
+        """
+        self.lock = threading.Lock()
+        self.size:int = 0
+        self.numeric:dict[str,np.ndarray] = {name: np.full(capacity, np.nan) for name in NUMERIC_COLUMNS}
+        self.strings:dict[str,np.ndarray] = {name: np.empty(capacity, dtype=object) for name in STRING_COLUMNS}
+
+    @classmethod
+    def from_videos(cls, videos:list[Any]) -> 'VideoBatch':
+        """
+        Creates a table with a row for each video and attaches the videos to it.
+
+        Parameters:
+            videos: the array of VideoFile objects.
+
+        Returns:
+            the VideoBatch.
+        """
+        batch = cls(max(1, len(videos)))
+        for video in videos:
+            batch.add(video)
+        return batch
+
+    def attach(self, videos:Iterable[Any]) -> Iterator[Any]:
+        """
+        Adds a row for each video of a stream as it passes through, so a lazily read input is never held in a list.
+
+        Parameters:
+            videos: the VideoFile objects.
+
+        Returns:
+            a generator of the same videos.
+        """
+        for video in videos:
+            self.add(video)
+            yield video
+
+    def add(self, video:Any) -> int:
+        """
+        Adds a row for a video and attaches the video to it, so its stages record their results in the row.
+
+        Parameters:
+            video: the VideoFile object.
+
+        Returns:
+            the index of the row.
+        """
+        with self.lock:
+            if(self.size == len(self.numeric['polarity'])):
+                self.grow(2*self.size)
+            row = self.size
+            self.size += 1
+        video.batch = self
+        video.batch_row = row
+        self.record(video)
+        return row
+
+    def record(self, video:Any) -> None:
+        """
+        Copies the current results of a video into its row.
+
+        Parameters:
+            video: the VideoFile object attached to the table.
+
+        Returns:
+            None
+        """
+        row = video.batch_row
+        with self.lock:
+            for name in STRING_COLUMNS:
+                value = getattr(video, name)
+                if(value != None):
+                    self.strings[name][row] = value
+
+            sentiment = video.sentiment
+            if(hasattr(sentiment, 'polarity')):
+                self.numeric['polarity'][row] = sentiment.polarity
+                self.numeric['subjectivity'][row] = sentiment.subjectivity
+
+            if(video.emotions != None):
+                for name in EMOTION_COLUMNS:
+                    #the emotions hold both keys, as NRCLex does: its legacy 'anticip' key is always there, and emotion_scorer
+                    #appends the 'anticipation' key of the lexicon for compatibility, so the column reads 'anticipation' when
+                    #it is present and falls back to 'anticip' for the emotions that were scored without it.
+                    value = video.emotions.get(name, video.emotions.get('anticip', 0.0)) if name == 'anticipation' else video.emotions.get(name, 0.0)
+                    self.numeric[name][row] = value
+
+    def __len__(self) -> int:
+        return self.size
+
+    def column(self, name:str) -> np.ndarray:
+        """
+        Returns a column of the table.
+
+        Parameters:
+            name: the name of the column.
+
+        Returns:
+            a view of the column, one value per video.
+        """
+        if(name in self.numeric):
+            return self.numeric[name][:self.size]
+        return self.strings[name][:self.size]
+
+    def emotion_matrix(self) -> np.ndarray:
+        """
+        Returns the emotion scores of all the videos as one matrix, for corpus wide queries.
+
+        Parameters:
+            None
+
+        Returns:
+            a matrix with a row per video and a column per emotion, in the order of EMOTION_COLUMNS.
+        """
+        return np.column_stack([self.column(name) for name in EMOTION_COLUMNS])
+
+    def row(self, index:int) -> dict[str,Any]:
+        return {name: self.column(name)[index] for name in STRING_COLUMNS + NUMERIC_COLUMNS}
+
+# <-------------------------------- Persistence ------------------------------->
+
+    def save(self, path:str) -> None:
+        """
+        Saves the table to a single file, Parquet if the path ends in .parquet (pyarrow is needed), .npz otherwise.
+
+        Parameters:
+            path: the path of the file.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            numeric = {name: column[:self.size].copy() for name, column in self.numeric.items()}
+            strings = {name: ['' if value == None else str(value) for value in column[:self.size]] for name, column in self.strings.items()}
+
+        if(path.endswith('.parquet')):
+            import pyarrow
+            import pyarrow.parquet
+            table = pyarrow.table({**{name: pyarrow.array(values, type=pyarrow.string()) for name, values in strings.items()}, **numeric})
+            pyarrow.parquet.write_table(table, path)
+        else:
+            #fixed width unicode arrays load back without pickle.
+            np.savez_compressed(path, **numeric, **{name: np.array(values, dtype=str) for name, values in strings.items()})
+        print(f'Results of {self.size} videos saved to {path}')
+
+    @classmethod
+    def load(cls, path:str) -> 'VideoBatch':
+        """
+        Loads a table saved by save.
+
+        Parameters:
+            path: the path of the .parquet or .npz file.
+
+        Returns:
+            the VideoBatch, without videos attached.
+        """
+        if(path.endswith('.parquet')):
+            import pyarrow.parquet
+            columns = pyarrow.parquet.read_table(path).to_pydict()
+        else:
+            with np.load(path, allow_pickle=False) as data:
+                columns = {name: data[name] for name in data.files}
+
+        size = len(columns['polarity'])
+        batch = cls(max(1, size))
+        batch.size = size
+        for name in NUMERIC_COLUMNS:
+            batch.numeric[name][:size] = np.asarray(columns[name], dtype=float)
+        for name in STRING_COLUMNS:
+            batch.strings[name][:size] = [None if value == '' else str(value) for value in columns[name]]
+        return batch
+
+# <-------------------------------- Helper Functions ------------------------------->
+
+    def grow(self, capacity:int) -> None:
+        for name, column in self.numeric.items():
+            grown = np.full(capacity, np.nan)
+            grown[:len(column)] = column
+            self.numeric[name] = grown
+        for name, column in self.strings.items():
+            grown = np.empty(capacity, dtype=object)
+            grown[:len(column)] = column
+            self.strings[name] = grown
+
+def recorded_stage(method:Callable) -> Callable:
+    """
+    A decorator for the VideoFile stage methods that copies the results of the video into its row of the batch table
+    once the stage succeeds, when the video is attached to one.
+
+    Parameters:
+        method: the stage method.
+
+    Returns:
+        the decorated method.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        if(self.batch != None):
+            self.batch.record(self)
+        return result
+
+    return wrapper
@@ -0,0 +1,174 @@
+import json
+import bisect
+import numpy as np
+from artifact_store import atomic_open
+from typing import NamedTuple
+
+# the length of the frames whose energy is measured
+FRAME_SECONDS = 0.03
+# a frame is speech when it is this much louder than the noise floor of the audio
+THRESHOLD_DB = 12.0
+# frames quieter than this are never speech, however quiet the audio is
+ABSOLUTE_FLOOR_DB = -55.0
+# the silence put between two kept regions, so the recognizer hears a pause instead of words run together
+GAP_SECONDS = 0.15
+
+class SpeechRegion(NamedTuple):
+    # the start of the region in the trimmed audio and in the original audio, and its length, in seconds
+    trimmed_start: float
+    original_start: float
+    duration: float
+
+# <-------------------------------- Timestamp Map ------------------------------->
+
+class TimestampMap:
+
+    def __init__(self, regions:list[SpeechRegion], original_seconds:float) -> None:
+        """
+        Initialises the map between the timeline of trimmed audio and the timeline of the original audio, so a time
+        found in the trimmed audio, like the start of a subtitle, can be placed back in the video.
+
+        Parameters:
+            regions: the kept regions, in order.
+            original_seconds: the length of the original audio.
+
+        Returns:
+            None
+        """
+        self.regions:list[SpeechRegion] = regions
+        self.original_seconds:float = original_seconds
+        self.starts:list[float] = [region.trimmed_start for region in regions]
+
+    @property
+    def kept_seconds(self) -> float:
+        return sum(region.duration for region in self.regions)
+
+    def to_original(self, seconds:float) -> float:
+        """
+        Maps a time of the trimmed audio to the original audio. A time inside a gap between two regions is mapped to
+        the end of the region before it.
+
+        Parameters:
+            seconds: the time in the trimmed audio.
+
+        Returns:
+            the time in the original audio.
+        """
+        if(len(self.regions) == 0):
+            return seconds
+        index = max(0, bisect.bisect_right(self.starts, seconds) - 1)
+        region = self.regions[index]
+        return region.original_start + min(max(0.0, seconds - region.trimmed_start), region.duration)
+
+    def save(self, path:str) -> None:
+        with atomic_open(path, 'w') as map_file:
+            json.dump({'original_seconds': self.original_seconds, 'regions': [list(region) for region in self.regions]}, map_file)
+
+    @classmethod
+    def load(cls, path:str) -> 'TimestampMap':
+        with open(path, 'r') as map_file:
+            data = json.load(map_file)
+        return cls([SpeechRegion(*region) for region in data['regions']], data['original_seconds'])
+
+# <-------------------------------- Voice Activity Detection ------------------------------->
+
+def frame_energies(samples:np.ndarray, sample_rate:int, frame_seconds:float = FRAME_SECONDS) -> np.ndarray:
+    """
+    Measures the loudness of each short frame of the audio.
+
+    Parameters:
+        samples: the 16 bit mono samples of the audio.
+        sample_rate: the number of samples per second.
+        frame_seconds: the length of the frames.
+
+    Returns:
+        the RMS energy of each frame in dB relative to full scale, the last partial frame included.
+    """
+    frame_length = max(1, int(sample_rate * frame_seconds))
+    frame_count = -(-len(samples) // frame_length)
+    padded = np.zeros(frame_count*frame_length, dtype=np.float32)
+    padded[:len(samples)] = samples
+    frames = padded.reshape(frame_count, frame_length) / 32768.0
+    return 10*np.log10((frames*frames).mean(axis=1) + 1e-10)
+
+def detect_speech(samples:np.ndarray, sample_rate:int, frame_seconds:float = FRAME_SECONDS, threshold_db:float = THRESHOLD_DB,
+                  padding_seconds:float = 0.2, min_speech_seconds:float = 0.25, min_silence_seconds:float = 0.4) -> list[tuple[int,int]]:
+    """
+    Finds the regions of the audio with speech from the energy of its frames: a frame is speech when it is threshold_db
+    louder than the noise floor (the 10th percentile of the frames). Pauses shorter than min_silence_seconds are kept
+    inside a region, bursts shorter than min_speech_seconds are dropped, and every region is padded so the first and
+    last syllables are not clipped.
+
+    Parameters:
+        samples: the 16 bit mono samples of the audio.
+        sample_rate: the number of samples per second.
+        frame_seconds: the length of the frames.
+        threshold_db: how much louder than the noise floor a frame of speech is.
+        padding_seconds: the audio kept before and after each region.
+        min_speech_seconds: the shortest region kept.
+        min_silence_seconds: the shortest pause that splits two regions.
+
+    Returns:
+        the start and end sample of each region, in order.
+    """
+    if(len(samples) == 0):
+        return []
+    energies = frame_energies(samples, sample_rate, frame_seconds)
+    noise_floor = float(np.percentile(energies, 10))
+    voiced = energies > max(noise_floor + threshold_db, ABSOLUTE_FLOOR_DB)
+
+    #the edges of the runs of voiced frames, as pairs of (first frame, frame after the last).
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+    runs = edges.reshape(-1, 2)
+
+    frame_length = max(1, int(sample_rate * frame_seconds))
+    min_silence_frames = int(min_silence_seconds / frame_seconds)
+    merged:list[list[int]] = []
+    for start, end in runs:
+        if(len(merged) > 0 and start - merged[-1][1] < min_silence_frames):
+            merged[-1][1] = end
+        else:
+            merged.append([int(start), int(end)])
+
+    padding = int(padding_seconds * sample_rate)
+    min_speech = int(min_speech_seconds * sample_rate)
+    regions:list[tuple[int,int]] = []
+    for start, end in merged:
+        if((end - start)*frame_length < min_speech):
+            continue
+        start = max(0, start*frame_length - padding)
+        end = min(len(samples), end*frame_length + padding)
+        #the padding can make neighbouring regions overlap, they are joined.
+        if(len(regions) > 0 and start <= regions[-1][1]):
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+def trim_silence(samples:np.ndarray, sample_rate:int, **vad_options) -> tuple[np.ndarray,TimestampMap]:
+    """
+    Drops the parts of the audio without speech, like silences, music intros and dead air, keeping a short pause between
+    the regions of speech.
+
+    Parameters:
+        samples: the 16 bit mono samples of the audio.
+        sample_rate: the number of samples per second.
+        vad_options: the options of detect_speech.
+
+    Returns:
+        the samples of the speech, and the map from their timeline to the timeline of the original audio.
+    """
+    gap = np.zeros(int(GAP_SECONDS * sample_rate), dtype=np.int16)
+    pieces:list[np.ndarray] = []
+    regions:list[SpeechRegion] = []
+    position = 0
+    for start, end in detect_speech(samples, sample_rate, **vad_options):
+        if(len(pieces) > 0):
+            pieces.append(gap)
+            position += len(gap)
+        pieces.append(samples[start:end])
+        regions.append(SpeechRegion(position / sample_rate, start / sample_rate, (end - start) / sample_rate))
+        position += end - start
+
+    trimmed = np.concatenate(pieces).astype(np.int16) if len(pieces) > 0 else np.zeros(0, dtype=np.int16)
+    return trimmed, TimestampMap(regions, len(samples) / sample_rate)